@@ -3,6 +3,7 @@ from textG.api.urls import text_router
 from users.api.urls import users_router
 from imgG.api.urls import img_router
 from videoG.api.urls import video_router
+from history.api.urls import history_router
 from django.urls import path, include
 
 router = DefaultRouter()
@@ -12,6 +13,7 @@ router.registry.extend(text_router.registry)
 router.registry.extend(users_router.registry)
 router.registry.extend(img_router.registry)
 router.registry.extend(video_router.registry)
+router.registry.extend(history_router.registry)
 
 urlpatterns = [
     path('', include(router.urls)),
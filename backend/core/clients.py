@@ -0,0 +1,89 @@
+import threading
+
+import httpx
+import openai
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+
+DEFAULTS = {
+    'max_connections': 50,
+    'max_keepalive_connections': 20,
+    'keepalive_expiry': 60,
+    'connect_timeout': 10,
+    'read_timeout': 120,
+    'max_retries': 2,
+}
+
+_lock = threading.Lock()
+_openai_clients = {}
+_http_session = None
+
+
+def http_options():
+    """Настройки пулов соединений из UPSTREAM_HTTP"""
+    return {**DEFAULTS, **getattr(settings, 'UPSTREAM_HTTP', {})}
+
+
+def resolve_api_key(api_key):
+    """Раскрывает ключ OpenAI, сохраненный в .env в виде gpt:..."""
+    return "sk-proj-" + api_key[:3:-1] if api_key.startswith('gpt:') else api_key
+
+
+def get_openai_client(api_key=None) -> openai.OpenAI:
+    """
+    Общий для процесса клиент OpenAI с пулом keep-alive соединений.
+    Создается при первом обращении, поэтому не замедляет старт воркера
+    """
+    api_key = resolve_api_key(api_key or settings.API_KEY)
+    client = _openai_clients.get(api_key)
+    if client is not None:
+        return client
+
+    with _lock:
+        client = _openai_clients.get(api_key)
+        if client is None:
+            options = http_options()
+            http_client = openai.DefaultHttpxClient(
+                limits=httpx.Limits(
+                    max_connections=options['max_connections'],
+                    max_keepalive_connections=options['max_keepalive_connections'],
+                    keepalive_expiry=options['keepalive_expiry'],
+                ),
+                timeout=httpx.Timeout(options['read_timeout'], connect=options['connect_timeout']),
+            )
+            client = openai.OpenAI(
+                api_key=api_key,
+                base_url=getattr(settings, 'OPENAI_BASE_URL', None),
+                http_client=http_client,
+                max_retries=options['max_retries'],
+            )
+            _openai_clients[api_key] = client
+    return client
+
+
+def get_http_session() -> requests.Session:
+    """Общая для процесса сессия requests с пулом соединений"""
+    global _http_session
+    if _http_session is not None:
+        return _http_session
+
+    with _lock:
+        if _http_session is None:
+            options = http_options()
+            session = requests.Session()
+            adapter = HTTPAdapter(
+                pool_connections=options['max_keepalive_connections'],
+                pool_maxsize=options['max_connections'],
+            )
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            _http_session = session
+    return _http_session
+
+
+def http_timeout():
+    """Таймаут (connect, read) для запросов через get_http_session"""
+    options = http_options()
+    return options['connect_timeout'], options['read_timeout']
@@ -0,0 +1,186 @@
+import logging
+import os
+import random
+import tempfile
+import time
+from email.utils import parsedate_to_datetime
+from io import BytesIO
+
+import requests
+from django.conf import settings
+from django.utils import timezone
+
+from .clients import get_http_session, http_timeout
+from .metrics import bytes_total
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'max_attempts': 4,
+    'backoff_base': 0.5,
+    'backoff_max': 30,
+    'max_bytes': 50 * 1024 ** 2,
+    'chunk_size': 64 * 1024,
+}
+
+# Ответы, после которых повтор имеет смысл: сервер перегружен или временно недоступен
+RETRY_STATUSES = {408, 425, 429, 500, 502, 503, 504}
+# Для POST повторяем только то, что сервер точно не начал выполнять
+SAFE_RETRY_STATUSES = {429, 503}
+IDEMPOTENT_METHODS = {'GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE'}
+USER_AGENT = 'Mozilla/5.0'
+
+
+class DownloadError(Exception):
+    def __init__(self, message, status_code=None, attempts=0):
+        super().__init__(message)
+        self.status_code = status_code
+        self.attempts = attempts
+
+
+def download_options():
+    """Настройки повторов и лимитов из UPSTREAM_DOWNLOADS"""
+    return {**DEFAULTS, **getattr(settings, 'UPSTREAM_DOWNLOADS', {})}
+
+
+def retry_delay(attempt, retry_after=None, options=None):
+    """
+    Пауза перед повтором номер attempt (с 1): Retry-After сервера, если он есть,
+    иначе экспоненциальная задержка со случайным разбросом
+    """
+    options = options or download_options()
+    if retry_after:
+        try:
+            delay = float(retry_after)
+        except ValueError:
+            try:
+                delay = (parsedate_to_datetime(retry_after) - timezone.now()).total_seconds()
+            except (TypeError, ValueError):
+                delay = None
+        if delay is not None:
+            return min(max(delay, 0), options['backoff_max'])
+    return random.uniform(0, min(options['backoff_base'] * 2 ** (attempt - 1), options['backoff_max']))
+
+
+def _should_retry(method, status_code=None, error=None):
+    idempotent = method.upper() in IDEMPOTENT_METHODS
+    if error is not None:
+        # Если не удалось даже подключиться, запрос до сервера не дошел
+        return idempotent or isinstance(error, requests.ConnectTimeout)
+    return status_code in (RETRY_STATUSES if idempotent else SAFE_RETRY_STATUSES)
+
+
+def request_with_retries(method, url, max_attempts=None, **kwargs) -> requests.Response:
+    """
+    Запрос через общую сессию с повторами при сетевых ошибках и 429/5xx, не больше
+    max_attempts попыток (по умолчанию из настроек). Возвращает последний ответ
+    (число попыток в response.attempts); исключение поднимается, только если ответа не было
+    """
+    options = download_options()
+    max_attempts = max_attempts or options['max_attempts']
+    kwargs.setdefault('timeout', http_timeout())
+    session = get_http_session()
+
+    for attempt in range(1, max_attempts + 1):
+        last = attempt == max_attempts
+        try:
+            response = session.request(method, url, **kwargs)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            if last or not _should_retry(method, error=e):
+                raise
+            delay = retry_delay(attempt, options=options)
+            logger.warning("%s %s: %s, повтор через %.1f с", method, url, e, delay)
+        else:
+            if last or not _should_retry(method, status_code=response.status_code):
+                response.attempts = attempt
+                return response
+            delay = retry_delay(attempt, response.headers.get('Retry-After'), options)
+            logger.warning("%s %s: HTTP %s, повтор через %.1f с", method, url, response.status_code, delay)
+            response.close()
+        time.sleep(delay)
+
+
+def download(url, path=None, max_bytes=None, headers=None):
+    """
+    Скачивает файл потоком, кусками по chunk_size, в память или атомарно в path.
+    Прерывает загрузку сверх max_bytes. Возвращает dict с данными (или путем) и метриками:
+    attempts, ttfb_ms (до заголовков ответа в удачной попытке), elapsed_ms, size_bytes.
+    Все попытки - и запроса, и повторного чтения оборванного тела - из одного бюджета max_attempts
+    """
+    options = download_options()
+    max_bytes = options['max_bytes'] if max_bytes is None else max_bytes
+    headers = {'User-Agent': USER_AGENT, **(headers or {})}
+    start = time.perf_counter()
+    requests_made = 0
+
+    while True:
+        remaining = options['max_attempts'] - requests_made
+        try:
+            response = request_with_retries('GET', url, max_attempts=remaining, headers=headers, stream=True)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            # Повторы подключения уже сделал request_with_retries
+            raise DownloadError(f'Download error: {e}', attempts=options['max_attempts']) from e
+        requests_made += response.attempts
+        # requests считает elapsed до разбора заголовков ответа этой попытки
+        ttfb_ms = round(response.elapsed.total_seconds() * 1000, 1)
+        try:
+            with response:
+                if response.status_code != 200:
+                    raise DownloadError(f'HTTP {response.status_code}', response.status_code, requests_made)
+                declared = int(response.headers.get('Content-Length') or 0)
+                if max_bytes and declared > max_bytes:
+                    raise DownloadError(f'File too large: {declared} bytes (limit {max_bytes})', 200, requests_made)
+                data, size = _read_body(response, path, max_bytes, options['chunk_size'], requests_made)
+            break
+        except (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError) as e:
+            # Обрыв посреди тела ответа: начинаем заново, если попытки остались
+            if requests_made >= options['max_attempts']:
+                raise DownloadError(f'Download error: {e}', attempts=requests_made) from e
+            time.sleep(retry_delay(requests_made, options=options))
+
+    metrics = {
+        'attempts': requests_made,
+        'ttfb_ms': ttfb_ms,
+        'elapsed_ms': round((time.perf_counter() - start) * 1000, 1),
+        'size_bytes': size,
+    }
+    logger.info("Скачано %s: %s", url, metrics)
+    bytes_total.inc(size, operation='download')
+    return {
+        'url': url,
+        'data': data,
+        'path': path,
+        'content_type': response.headers.get('Content-Type', ''),
+        'size_bytes': size,
+        'metrics': metrics,
+    }
+
+
+def _read_body(response, path, max_bytes, chunk_size, attempt):
+    """Читает тело в BytesIO или во временный файл рядом с path; при превышении лимита бросает DownloadError"""
+    if path:
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or '.', suffix='.part')
+        target = os.fdopen(fd, 'wb')
+    else:
+        tmp_path, target = None, BytesIO()
+
+    size = 0
+    try:
+        for chunk in response.iter_content(chunk_size=chunk_size):
+            size += len(chunk)
+            if max_bytes and size > max_bytes:
+                raise DownloadError(f'File too large: over {max_bytes} bytes', 200, attempt)
+            target.write(chunk)
+
+        if tmp_path:
+            target.close()
+            os.replace(tmp_path, path)
+            return None, size
+        return target.getvalue(), size
+    except BaseException:
+        target.close()
+        if tmp_path and os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
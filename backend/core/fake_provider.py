@@ -0,0 +1,355 @@
+"""
+Локальная замена OpenAI (chat completions, vision, images) и AIMLAPI (видео) для разработки
+и нагрузочных тестов без расходов на настоящие API. Только стандартная библиотека, Django не нужен:
+
+    cd backend && python -m core.fake_provider --port 8100 --secret dev-secret --profile realistic
+
+Для Django в окружении:
+    OPENAI_BASE_URL=http://127.0.0.1:8100/v1
+    AIMLAPI_BASE_URL=http://127.0.0.1:8100
+    VIDEO_WEBHOOK_URL=http://127.0.0.1:8000      (без него - только опрос)
+    VIDEO_WEBHOOK_SECRET=dev-secret
+
+Задержки берутся из профиля (--profile) и масштабируются --scale, отдельные значения
+меняются через --latency images=2.5. --error-rate и --throttle-rate добавляют ответы 500 и 429
+"""
+import argparse
+import base64
+import json
+import random
+import struct
+import threading
+import time
+import uuid
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+from urllib.request import Request, urlopen
+
+from core.webhooks import signed_headers
+
+
+# Задержки в секундах: (среднее, разброс) для запросов, для chat_token и video_frame - на единицу
+PROFILES = {
+    'instant': {
+        'chat': (0, 0), 'chat_token': 0, 'vision': (0, 0), 'images': (0, 0), 'video_frame': 0.001,
+    },
+    'fast': {
+        'chat': (0.05, 0.02), 'chat_token': 0.002, 'vision': (0.1, 0.03), 'images': (0.2, 0.05), 'video_frame': 0.01,
+    },
+    # Порядок величин как у настоящих API
+    'realistic': {
+        'chat': (0.8, 0.3), 'chat_token': 0.02, 'vision': (2.0, 0.6), 'images': (8.0, 2.0), 'video_frame': 0.5,
+    },
+}
+
+# Несколько байт вместо настоящего mp4: клиенту важны только размер и Range
+FAKE_VIDEO = b'\x00\x00\x00\x18ftypmp42' + bytes(range(256)) * 64
+
+FAKE_REPLY = (
+    'Дорогой коллега! Поздравляем с днем рождения и желаем крепкого здоровья, '
+    'интересных задач, надежной команды и времени на то, что приносит радость.'
+)
+
+
+def tiny_png(width=64, height=64, color=(200, 120, 80)):
+    """Однотонный PNG без Pillow: годится и как ответ DALL-E, и как фото пользователя в нагрузочном тесте"""
+    def chunk(kind, data):
+        return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data) & 0xffffffff)
+
+    row = b'\x00' + bytes(color) * width
+    return (
+        b'\x89PNG\r\n\x1a\n'
+        + chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0))
+        + chunk(b'IDAT', zlib.compress(row * height))
+        + chunk(b'IEND', b'')
+    )
+
+
+FAKE_IMAGE = tiny_png(256, 256)
+
+
+class FakeProvider:
+    """
+    Состояние и поведение поддельного провайдера. Статус видео вычисляется по прошедшему
+    времени, готовность видео сообщается вебхуком на callback_url
+    """
+
+    def __init__(self, secret='', profile='fast', scale=1.0, latency=None, error_rate=0.0, throttle_rate=0.0,
+                 fail_rate=0.0, drop_callbacks=0.0):
+        self.secret = secret
+        self.latency = {**PROFILES[profile], **(latency or {})}
+        self.scale = scale
+        # Доля ответов 500 и 429 (с Retry-After) на любые запросы к API
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        # Доля видео, которые завершатся ошибкой, и доля потерянных вебхуков (их должен подобрать опрос)
+        self.fail_rate = fail_rate
+        self.drop_callbacks = drop_callbacks
+        self.base_url = ''
+        self.generations = {}
+        self.requests = {}
+        self.lock = threading.Lock()
+
+    def delay(self, kind):
+        """Задержка для вида запроса из профиля, с нормальным разбросом"""
+        value = self.latency[kind]
+        mean, spread = value if isinstance(value, (tuple, list)) else (value, 0)
+        return max(0.0, random.gauss(mean, spread) if spread else mean) * self.scale
+
+    def fault(self):
+        """Случайный сбой по профилю ошибок: (статус, тело) или None"""
+        roll = random.random()
+        if roll < self.throttle_rate:
+            return 429, {'error': {'message': 'Rate limit reached', 'type': 'rate_limit_error'}}
+        if roll < self.throttle_rate + self.error_rate:
+            return 500, {'error': {'message': 'The server had an error', 'type': 'server_error'}}
+        return None
+
+    def count(self, kind):
+        with self.lock:
+            self.requests[kind] = self.requests.get(kind, 0) + 1
+
+    def chat_completion(self, payload):
+        """Ответ в формате chat.completion; vision - если в сообщениях есть image_url"""
+        kind = 'vision' if self._has_image(payload.get('messages', [])) else 'chat'
+        self.count(kind)
+        time.sleep(self.delay(kind))
+        content = 'Фотография: улыбающийся человек на светлом фоне.' if kind == 'vision' else FAKE_REPLY
+        return {
+            'id': f"chatcmpl-{uuid.uuid4().hex}",
+            'object': 'chat.completion',
+            'created': int(time.time()),
+            'model': payload.get('model', 'gpt-4o'),
+            'choices': [{
+                'index': 0,
+                'message': {'role': 'assistant', 'content': content},
+                'finish_reason': 'stop',
+            }],
+            'usage': {'prompt_tokens': 50, 'completion_tokens': len(content.split()), 'total_tokens': 50 + len(content.split())},
+        }
+
+    def chat_chunks(self, payload):
+        """Потоковый ответ: chat.completion.chunk по слову"""
+        self.count('chat_stream')
+        time.sleep(self.delay('chat'))
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        base = {
+            'id': completion_id,
+            'object': 'chat.completion.chunk',
+            'created': int(time.time()),
+            'model': payload.get('model', 'gpt-4o'),
+        }
+        yield {**base, 'choices': [{'index': 0, 'delta': {'role': 'assistant', 'content': ''}, 'finish_reason': None}]}
+        for word in FAKE_REPLY.split(' '):
+            time.sleep(self.delay('chat_token'))
+            yield {**base, 'choices': [{'index': 0, 'delta': {'content': word + ' '}, 'finish_reason': None}]}
+        yield {**base, 'choices': [{'index': 0, 'delta': {}, 'finish_reason': 'stop'}]}
+
+    def image_generation(self, payload):
+        self.count('images')
+        count = int(payload.get('n') or 1)
+        time.sleep(self.delay('images'))
+        data = []
+        for _ in range(count):
+            if payload.get('response_format') == 'b64_json':
+                item = {'b64_json': base64.b64encode(FAKE_IMAGE).decode('ascii')}
+            else:
+                item = {'url': f"{self.base_url}/files/{uuid.uuid4().hex}.png"}
+            item['revised_prompt'] = payload.get('prompt', '')
+            data.append(item)
+        return {'created': int(time.time()), 'data': data}
+
+    def create(self, payload):
+        self.count('video')
+        generation = {
+            'id': uuid.uuid4().hex,
+            'prompt': payload.get('prompt', ''),
+            'created': time.time(),
+            'duration': max(int(payload.get('num_frames') or 90), 1) * self.delay('video_frame'),
+            'failed': random.random() < self.fail_rate,
+            'callback_url': payload.get('callback_url'),
+        }
+        with self.lock:
+            self.generations[generation['id']] = generation
+        threading.Timer(generation['duration'], self._complete, args=(generation['id'],)).start()
+        return {'id': generation['id'], 'status': 'queued'}
+
+    def status(self, generation_id):
+        with self.lock:
+            generation = self.generations.get(generation_id)
+        if generation is None:
+            return None
+
+        elapsed = time.time() - generation['created']
+        data = {'id': generation_id}
+        if elapsed < generation['duration'] * 0.2:
+            data['status'] = 'queued'
+        elif elapsed < generation['duration']:
+            data['status'] = 'generating'
+        elif generation['failed']:
+            data.update({'status': 'failed', 'error': 'Generation failed'})
+        else:
+            data.update({'status': 'completed', 'video': {'url': f"{self.base_url}/files/{generation_id}.mp4"}})
+        return data
+
+    def stats(self):
+        with self.lock:
+            return {'requests': dict(self.requests), 'videos': len(self.generations)}
+
+    def _has_image(self, messages):
+        for message in messages:
+            content = message.get('content')
+            if isinstance(content, list) and any(part.get('type') == 'image_url' for part in content):
+                return True
+        return False
+
+    def _complete(self, generation_id):
+        with self.lock:
+            callback_url = self.generations[generation_id]['callback_url']
+        if not callback_url or random.random() < self.drop_callbacks:
+            return
+
+        body = json.dumps(self.status(generation_id)).encode('utf-8')
+        request = Request(callback_url, data=body, headers=signed_headers(self.secret, body), method='POST')
+        try:
+            with urlopen(request, timeout=10) as response:
+                response.read()
+        except OSError as e:
+            print(f"Callback {callback_url} failed: {e}")
+
+
+class FakeProviderHandler(BaseHTTPRequestHandler):
+    provider = None
+    # keep-alive: клиенты OpenAI и requests держат пулы соединений
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        path = urlparse(self.path).path
+        payload = self._read_json()
+        routes = {
+            '/v1/chat/completions': self._chat_completions,
+            '/v1/images/generations': lambda data: self._json(200, self.provider.image_generation(data)),
+            '/v2/video/generations': lambda data: self._json(200, self.provider.create(data)),
+        }
+        if path not in routes:
+            return self._json(404, {'error': 'Not found'})
+        fault = self.provider.fault()
+        if fault is not None:
+            return self._json(*fault)
+        routes[path](payload)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path == '/v2/video/generations':
+            generation_id = parse_qs(url.query).get('generation_id', [''])[0]
+            data = self.provider.status(generation_id)
+            if data is None:
+                return self._json(404, {'error': 'Generation not found'})
+            return self._json(200, data)
+        if url.path == '/stats':
+            return self._json(200, self.provider.stats())
+        if url.path.startswith('/files/'):
+            if url.path.endswith('.png'):
+                return self._bytes(FAKE_IMAGE, 'image/png')
+            return self._bytes(FAKE_VIDEO, 'video/mp4')
+        self._json(404, {'error': 'Not found'})
+
+    def log_message(self, format, *args):
+        pass
+
+    def _chat_completions(self, payload):
+        if not payload.get('stream'):
+            return self._json(200, self.provider.chat_completion(payload))
+
+        # SSE без Content-Length: соединение закрываем после [DONE]
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        self.close_connection = True
+        for chunk in self.provider.chat_chunks(payload):
+            self.wfile.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode('utf-8'))
+            self.wfile.flush()
+        self.wfile.write(b'data: [DONE]\n\n')
+
+    def _read_json(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        try:
+            return json.loads(self.rfile.read(length) or b'{}')
+        except ValueError:
+            return {}
+
+    def _json(self, status, data):
+        body = json.dumps(data, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        if status == 429:
+            self.send_header('Retry-After', '1')
+        self._bytes(body, 'application/json', status_sent=True)
+
+    def _bytes(self, body, content_type, status_sent=False):
+        if not status_sent:
+            self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def make_server(host='127.0.0.1', port=8100, **options):
+    """Создает сервер (port=0 - любой свободный); запуск - serve_forever() в потоке"""
+    provider = FakeProvider(**options)
+    handler = type('Handler', (FakeProviderHandler,), {'provider': provider})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    provider.base_url = f"http://{host}:{server.server_address[1]}"
+    server.provider = provider
+    return server
+
+
+def parse_latency(values):
+    """['images=2.5', 'chat=0.5:0.1'] -> {'images': (2.5, 0), 'chat': (0.5, 0.1)}"""
+    latency = {}
+    for value in values or []:
+        name, _, spec = value.partition('=')
+        mean, _, spread = spec.partition(':')
+        latency[name.strip()] = (float(mean), float(spread or 0))
+    return latency
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Локальная замена OpenAI и AIMLAPI')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8100)
+    parser.add_argument('--secret', default='', help='секрет подписи вебхуков (VIDEO_WEBHOOK_SECRET)')
+    parser.add_argument('--profile', choices=sorted(PROFILES), default='fast')
+    parser.add_argument('--scale', type=float, default=1.0, help='множитель всех задержек')
+    parser.add_argument('--latency', action='append', metavar='NAME=MEAN[:SPREAD]',
+                        help=f"задержка отдельного вида запроса: {', '.join(PROFILES['fast'])}")
+    parser.add_argument('--error-rate', type=float, default=0.0, help='доля ответов 500')
+    parser.add_argument('--throttle-rate', type=float, default=0.0, help='доля ответов 429')
+    parser.add_argument('--fail-rate', type=float, default=0.0, help='доля неудачных генераций видео')
+    parser.add_argument('--drop-callbacks', type=float, default=0.0, help='доля потерянных вебхуков видео')
+    args = parser.parse_args()
+
+    server = make_server(
+        args.host,
+        args.port,
+        secret=args.secret,
+        profile=args.profile,
+        scale=args.scale,
+        latency=parse_latency(args.latency),
+        error_rate=args.error_rate,
+        throttle_rate=args.throttle_rate,
+        fail_rate=args.fail_rate,
+        drop_callbacks=args.drop_callbacks
+    )
+    print(f"Fake provider on {server.provider.base_url} (profile {args.profile}, scale {args.scale})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
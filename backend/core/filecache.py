@@ -0,0 +1,28 @@
+import os
+
+from django.core.cache.backends.filebased import FileBasedCache
+
+
+class LRUFileBasedCache(FileBasedCache):
+    """
+    Файловый кэш с вытеснением LRU: при MAX_ENTRIES удаляется 1/CULL_FREQUENCY записей,
+    которые дольше всех не записывались и не продлевались (touch), а не случайные
+    """
+
+    def _cull(self):
+        filelist = self._list_cache_files()
+        num_entries = len(filelist)
+        if num_entries < self._max_entries:
+            return
+        if self._cull_frequency == 0:
+            return self.clear()
+        for fname in sorted(filelist, key=_last_used)[:num_entries // self._cull_frequency]:
+            self._delete(fname)
+
+
+def _last_used(fname):
+    # Файл мог удалить другой воркер: такой считаем самым старым
+    try:
+        return os.path.getmtime(fname)
+    except OSError:
+        return 0
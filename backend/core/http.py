@@ -0,0 +1,93 @@
+import os
+import re
+
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.utils.http import http_date
+
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+CHUNK_SIZE = 64 * 1024
+
+
+def _read_range(path, start, length):
+    with open(path, 'rb') as f:
+        f.seek(start)
+        while length > 0:
+            chunk = f.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+def _parse_range(header, size):
+    """
+    Разбирает заголовок Range с одним диапазоном.
+    Возвращает (start, end), None если диапазон не задан или их несколько, False если он невыполним
+    """
+    match = RANGE_RE.match(header.strip())
+    if not match:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # bytes=-N: последние N байт
+        length = int(last)
+        if length == 0:
+            return False
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        return False
+    return start, end
+
+
+def ranged_file_response(request, path, content_type, etag=None, max_age=0, immutable=False,
+                         last_modified=None, filename=None):
+    """
+    Отдает файл с диска с поддержкой ETag/If-None-Match и Range (206/416).
+    Для неизменяемого контента (адресация по хэшу) ставит долгий Cache-Control
+    """
+    size = os.path.getsize(path)
+    quoted_etag = f'"{etag}"' if etag else None
+
+    def with_cache_headers(response):
+        cache_control = f'public, max-age={max_age}'
+        if immutable:
+            cache_control += ', immutable'
+        response['Cache-Control'] = cache_control
+        response['Accept-Ranges'] = 'bytes'
+        if quoted_etag:
+            response['ETag'] = quoted_etag
+        if last_modified:
+            response['Last-Modified'] = http_date(last_modified)
+        if filename:
+            response['Content-Disposition'] = f'inline; filename="{filename}"'
+        return response
+
+    if quoted_etag:
+        if_none_match = request.headers.get('If-None-Match', '')
+        if if_none_match.strip() == '*' or quoted_etag in [t.strip() for t in if_none_match.split(',')]:
+            return with_cache_headers(HttpResponse(status=304))
+
+    range_header = request.headers.get('Range')
+    if_range = request.headers.get('If-Range')
+    if range_header and (not if_range or if_range.strip() == quoted_etag):
+        byte_range = _parse_range(range_header, size)
+        if byte_range is False:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+            return with_cache_headers(response)
+        if byte_range:
+            start, end = byte_range
+            length = end - start + 1
+            response = StreamingHttpResponse(_read_range(path, start, length), status=206, content_type=content_type)
+            response['Content-Length'] = str(length)
+            response['Content-Range'] = f'bytes {start}-{end}/{size}'
+            return with_cache_headers(response)
+
+    response = FileResponse(open(path, 'rb'), content_type=content_type)
+    response['Content-Length'] = str(size)
+    return with_cache_headers(response)
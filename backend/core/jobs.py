@@ -0,0 +1,239 @@
+import logging
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, models, transaction
+from django.dispatch import Signal
+from django.utils import timezone
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'workers': 4,
+    # Задача в статусе running дольше этого времени считается брошенной упавшим процессом
+    'stale_after': 15 * 60,
+    'poll_interval': 1.0,
+    'events_timeout': 5 * 60,
+}
+
+# Ответ handler: задача продолжается вне пула и будет завершена через JobQueue.finish
+DEFERRED = object()
+
+# Задача завершена (успешно или с ошибкой): sender - модель задачи, аргумент job
+job_finished = Signal()
+
+
+class BaseJob(models.Model):
+    """
+    Фоновая задача, сохраненная в БД: переживает перезапуск процесса.
+    Конкретные задачи наследуют модель и добавляют свои входные поля
+    """
+    PENDING = 'pending'
+    RUNNING = 'running'
+    SUCCEEDED = 'succeeded'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (PENDING, 'В очереди'),
+        (RUNNING, 'Выполняется'),
+        (SUCCEEDED, 'Готово'),
+        (FAILED, 'Ошибка'),
+    ]
+    FINISHED = (SUCCEEDED, FAILED)
+
+    id = models.UUIDField(
+        primary_key=True,
+        default=uuid.uuid4,
+        editable=False
+    )
+    status = models.CharField(
+        max_length=16,
+        choices=STATUS_CHOICES,
+        default=PENDING,
+        db_index=True,
+        verbose_name="Статус"
+    )
+    result = models.JSONField(
+        null=True,
+        blank=True,
+        verbose_name="Результат"
+    )
+    error = models.TextField(
+        blank=True,
+        verbose_name="Ошибка"
+    )
+    created_at = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name="Дата создания"
+    )
+    started_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        verbose_name="Начало выполнения"
+    )
+    finished_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        verbose_name="Окончание выполнения"
+    )
+
+    class Meta:
+        abstract = True
+
+    @property
+    def is_finished(self):
+        return self.status in self.FINISHED
+
+    def event_key(self):
+        """По изменению этого значения events() отдает новое состояние задачи"""
+        return self.status
+
+    def as_dict(self):
+        return {
+            'job_id': str(self.id),
+            'status': self.status,
+            'error': self.error or None,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None,
+        }
+
+    def __str__(self):
+        return f"{self.id} ({self.status})"
+
+
+class JobQueue:
+    """
+    Локальная очередь задач: пул потоков в процессе, состояние в БД.
+    handler(job) получает задачу и возвращает dict результата; результат с success=False
+    или исключение переводят задачу в failed, DEFERRED оставляет ее в running до finish().
+    Задачу забирает тот, кто первым сменил статус pending -> running,
+    поэтому несколько процессов не выполнят ее дважды
+    """
+
+    def __init__(self, model, handler, setting=None, name=None):
+        self.model = model
+        self.handler = handler
+        self.setting = setting
+        self.name = name or model._meta.model_name
+        self._executor = None
+        self._lock = threading.Lock()
+        self._changed = threading.Condition()
+
+    @property
+    def options(self):
+        return {**DEFAULTS, **getattr(settings, self.setting, {})} if self.setting else dict(DEFAULTS)
+
+    def start(self):
+        """Создает пул при первом обращении и возвращает в очередь задачи, оставшиеся от прошлого запуска"""
+        if self._executor is not None:
+            return self._executor
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.options['workers'],
+                    thread_name_prefix=f'job-{self.name}'
+                )
+                self.recover()
+        return self._executor
+
+    def stale_jobs(self):
+        """Задачи running дольше stale_after: их handler не завершился, потому что процесс упал"""
+        stale = timezone.now() - timedelta(seconds=self.options['stale_after'])
+        return self.model.objects.filter(status=BaseJob.RUNNING, started_at__lt=stale)
+
+    def recover(self):
+        reset = self.stale_jobs().update(status=BaseJob.PENDING, started_at=None)
+        pending = list(self.model.objects.filter(status=BaseJob.PENDING).order_by('created_at').values_list('pk', flat=True))
+        if reset or pending:
+            logger.info("Очередь %s: восстановлено %s задач (%s зависших)", self.name, len(pending), reset)
+        for pk in pending:
+            self._executor.submit(self._run, pk)
+
+    def submit(self, job):
+        """Ставит сохраненную задачу в очередь после коммита транзакции"""
+        executor = self.start()
+        transaction.on_commit(lambda: executor.submit(self._run, job.pk))
+        return job
+
+    def get(self, pk):
+        self.start()
+        return self.model.objects.filter(pk=pk).first()
+
+    def events(self, pk):
+        """
+        Генератор состояний задачи: отдает задачу при каждом изменении event_key()
+        и завершается, когда задача закончена или истек events_timeout
+        """
+        options = self.options
+        deadline = timezone.now() + timedelta(seconds=options['events_timeout'])
+        last_key = None
+        while True:
+            job = self.model.objects.filter(pk=pk).first()
+            if job is None:
+                return
+            if job.event_key() != last_key:
+                last_key = job.event_key()
+                yield job
+            if job.is_finished or timezone.now() >= deadline:
+                return
+            # Изменения в этом процессе будят сразу, из других процессов - не позже poll_interval
+            with self._changed:
+                self._changed.wait(options['poll_interval'])
+
+    def finish(self, job, result):
+        """
+        Сохраняет результат задачи и будит тех, кто ждет ее в events.
+        Завершает только задачу в статусе running: из нескольких процессов (опрос, вебхук)
+        побеждает первый. Возвращает False, если задачу уже завершили
+        """
+        job.result = result
+        if isinstance(result, dict) and result.get('success') is False:
+            job.status = BaseJob.FAILED
+            job.error = result.get('error', 'Unknown error')
+        else:
+            job.status = BaseJob.SUCCEEDED
+        job.finished_at = timezone.now()
+        with transaction.atomic():
+            claimed = self.model.objects.filter(pk=job.pk, status=BaseJob.RUNNING).update(
+                status=job.status, finished_at=job.finished_at
+            )
+            if claimed:
+                job.save()
+        if not claimed:
+            logger.info("Очередь %s: задача %s уже завершена", self.name, job.pk)
+            return False
+        job_finished.send(sender=self.model, job=job)
+        self.notify()
+        return True
+
+    def notify(self):
+        with self._changed:
+            self._changed.notify_all()
+
+    def _run(self, pk):
+        try:
+            claimed = self.model.objects.filter(pk=pk, status=BaseJob.PENDING).update(
+                status=BaseJob.RUNNING, started_at=timezone.now()
+            )
+            if not claimed:
+                return
+            self.notify()
+
+            job = self.model.objects.get(pk=pk)
+            try:
+                result = self.handler(job)
+            except Exception as e:
+                logger.exception("Задача %s %s упала", self.name, pk)
+                result = {'success': False, 'error': str(e)}
+
+            # Задачу завершит кто-то другой через finish(), она остается running
+            if result is not DEFERRED:
+                self.finish(job, result)
+        except Exception:
+            logger.exception("Очередь %s: не удалось выполнить задачу %s", self.name, pk)
+        finally:
+            connection.close()
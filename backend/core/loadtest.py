@@ -0,0 +1,269 @@
+"""
+Нагрузочный тест эндпоинтов генерации: для каждого эндпоинта и уровня параллельности
+отправляет запросы и считает p50/p95/p99 задержки и пропускную способность. Результат - JSON.
+Django не нужен, тест работает с запущенным сервером по HTTP:
+
+    # 1. тестовый провайдер
+    cd backend && python -m core.fake_provider --profile fast --secret dev-secret
+    # 2. сервер, направленный на него
+    OPENAI_BASE_URL=http://127.0.0.1:8100/v1 AIMLAPI_BASE_URL=http://127.0.0.1:8100 \\
+        RATE_LIMITS_DISABLED=1 python manage.py runserver --noreload
+    # 3. тест
+    python -m core.loadtest --endpoints text,image,video --concurrency 1,4,16 --requests 50 \\
+        --output loadtest.json [--baseline old.json --max-regression 0.2]
+
+Для видео задержка - время до готовности задачи (опрос status_url), время ответа 202 - в accepted_ms
+"""
+import argparse
+import base64
+import itertools
+import json
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+import requests
+
+from core.fake_provider import tiny_png
+
+
+DEFAULT_MESSAGE = 'Поздравление с днем рождения для коллеги'
+
+
+def percentile(values, p):
+    """Перцентиль по ближайшему рангу; values отсортированы"""
+    if not values:
+        return None
+    rank = max(1, -(-len(values) * p // 100))
+    return values[int(rank) - 1]
+
+
+def latency_summary(latencies):
+    values = sorted(latencies)
+    if not values:
+        return {}
+    return {
+        'min': round(values[0], 1),
+        'mean': round(sum(values) / len(values), 1),
+        'p50': round(percentile(values, 50), 1),
+        'p95': round(percentile(values, 95), 1),
+        'p99': round(percentile(values, 99), 1),
+        'max': round(values[-1], 1),
+    }
+
+
+class Scenario:
+    """Один запрос к эндпоинту: тело запроса и проверка ответа"""
+
+    name = None
+    path = None
+
+    def __init__(self, options):
+        self.options = options
+
+    def payload(self, index):
+        raise NotImplementedError
+
+    def complete(self, session, response, sample):
+        """Успешен ли запрос; может дождаться фоновой задачи и дописать поля в sample"""
+        return response.ok
+
+
+class TextScenario(Scenario):
+    name = 'text'
+    path = '/api/text/generate/'
+
+    def payload(self, index):
+        return {'message': f"{self.options.message} #{index}"}
+
+
+class ImageScenario(Scenario):
+    name = 'image'
+    path = '/api/img/generate/'
+
+    def payload(self, index):
+        # Разные фото, чтобы не попадать в кэш описаний
+        color = (index & 255, index >> 8 & 255, index >> 16 & 255)
+        return {
+            'template_type': self.options.template_type,
+            'text': self.options.message,
+            'image_data': base64.b64encode(tiny_png(64, 64, color)).decode('ascii'),
+            'image_format': 'png',
+            'response_format': 'url',
+        }
+
+
+class VideoScenario(Scenario):
+    name = 'video'
+    path = '/api/video/generate/'
+
+    def payload(self, index):
+        return {'prompt': f"{self.options.message} #{index}"}
+
+    def complete(self, session, response, sample):
+        if response.status_code != 202:
+            return False
+        sample['accepted_ms'] = sample['latency_ms']
+        status_url = response.json()['status_url']
+        deadline = time.monotonic() + self.options.video_timeout
+        while time.monotonic() < deadline:
+            time.sleep(self.options.poll_interval)
+            data = session.get(status_url, timeout=self.options.timeout).json()
+            if data.get('status') in ('succeeded', 'failed'):
+                return data['status'] == 'succeeded'
+        sample['error'] = 'timeout'
+        return False
+
+
+SCENARIOS = {scenario.name: scenario for scenario in (TextScenario, ImageScenario, VideoScenario)}
+
+
+class LoadTest:
+    def __init__(self, options):
+        self.options = options
+        self._local = threading.local()
+        # Сквозной номер запроса со случайного начала: тела не повторяются между уровнями и запусками
+        self._index = itertools.count(random.randrange(1 << 24))
+
+    def session(self):
+        # Своя сессия с keep-alive у каждого потока
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = self._local.session = requests.Session()
+            if self.options.token:
+                session.headers['Authorization'] = f"Token {self.options.token}"
+        return session
+
+    def run(self):
+        results = []
+        for name in self.options.endpoints:
+            scenario = SCENARIOS[name](self.options)
+            for concurrency in self.options.concurrency:
+                result = self.run_level(scenario, concurrency)
+                results.append(result)
+                latency = result['latency_ms']
+                print(
+                    f"{name:6} c={concurrency:<4} ok={result['ok']}/{result['requests']} "
+                    f"p50={latency.get('p50')} p95={latency.get('p95')} p99={latency.get('p99')} ms "
+                    f"{result['throughput_rps']} rps",
+                    file=sys.stderr
+                )
+        return {
+            'started_at': datetime.now(timezone.utc).isoformat(),
+            'base_url': self.options.base_url,
+            'requests_per_level': self.options.requests,
+            'results': results,
+        }
+
+    def run_level(self, scenario, concurrency):
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            indexes = [next(self._index) for _ in range(self.options.requests)]
+            samples = list(executor.map(lambda index: self.request(scenario, index), indexes))
+        duration = time.perf_counter() - started
+
+        ok = [sample for sample in samples if sample['ok']]
+        result = {
+            'endpoint': scenario.name,
+            'concurrency': concurrency,
+            'requests': len(samples),
+            'ok': len(ok),
+            'errors': len(samples) - len(ok),
+            'status_codes': dict(Counter(str(sample['status']) for sample in samples)),
+            'duration_s': round(duration, 2),
+            'throughput_rps': round(len(ok) / duration, 2) if duration else None,
+            'latency_ms': latency_summary([sample['latency_ms'] for sample in ok]),
+        }
+        accepted = [sample['accepted_ms'] for sample in ok if 'accepted_ms' in sample]
+        if accepted:
+            result['accepted_ms'] = latency_summary(accepted)
+        return result
+
+    def request(self, scenario, index):
+        session = self.session()
+        sample = {'ok': False, 'status': None}
+        started = time.perf_counter()
+        try:
+            response = session.post(
+                self.options.base_url + scenario.path, json=scenario.payload(index), timeout=self.options.timeout
+            )
+            sample['status'] = response.status_code
+            sample['latency_ms'] = (time.perf_counter() - started) * 1000
+            sample['ok'] = scenario.complete(session, response, sample)
+        except (requests.RequestException, ValueError, KeyError) as e:
+            sample['status'] = type(e).__name__
+            sample['error'] = str(e)
+        sample['latency_ms'] = (time.perf_counter() - started) * 1000
+        return sample
+
+
+def compare(report, baseline, max_regression):
+    """Уровни, где p95 вырос больше чем на max_regression (доля) относительно прошлого отчета"""
+    previous = {(item['endpoint'], item['concurrency']): item for item in baseline.get('results', [])}
+    regressions = []
+    for item in report['results']:
+        before = previous.get((item['endpoint'], item['concurrency']))
+        if not before or not before['latency_ms'] or not item['latency_ms']:
+            continue
+        old_p95, new_p95 = before['latency_ms']['p95'], item['latency_ms']['p95']
+        if old_p95 and new_p95 > old_p95 * (1 + max_regression):
+            regressions.append({
+                'endpoint': item['endpoint'],
+                'concurrency': item['concurrency'],
+                'p95_before': old_p95,
+                'p95_after': new_p95,
+            })
+    return regressions
+
+
+def _list(value, cast=str):
+    return [cast(item) for item in value.split(',') if item.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Нагрузочный тест /api/*/generate')
+    parser.add_argument('--base-url', default='http://127.0.0.1:8000')
+    parser.add_argument('--endpoints', type=_list, default=['text', 'image', 'video'],
+                        help=f"через запятую: {', '.join(SCENARIOS)}")
+    parser.add_argument('--concurrency', type=lambda value: _list(value, int), default=[1, 4, 16],
+                        help='уровни параллельности через запятую')
+    parser.add_argument('--requests', type=int, default=50, help='запросов на каждый уровень')
+    parser.add_argument('--token', default='', help='токен пользователя (Authorization: Token ...)')
+    parser.add_argument('--message', default=DEFAULT_MESSAGE)
+    parser.add_argument('--template-type', default='birthday')
+    parser.add_argument('--timeout', type=float, default=120)
+    parser.add_argument('--poll-interval', type=float, default=0.5)
+    parser.add_argument('--video-timeout', type=float, default=600)
+    parser.add_argument('--output', help='файл для JSON-отчета (по умолчанию stdout)')
+    parser.add_argument('--baseline', help='прошлый отчет: при росте p95 выход с кодом 1')
+    parser.add_argument('--max-regression', type=float, default=0.2)
+    options = parser.parse_args()
+    options.base_url = options.base_url.rstrip('/')
+
+    unknown = set(options.endpoints) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown endpoints: {', '.join(sorted(unknown))}")
+
+    report = LoadTest(options).run()
+    if options.baseline:
+        with open(options.baseline, encoding='utf-8') as f:
+            report['regressions'] = compare(report, json.load(f), options.max_regression)
+
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    if options.output:
+        with open(options.output, 'w', encoding='utf-8') as f:
+            f.write(output)
+    else:
+        print(output)
+
+    if report.get('regressions'):
+        print(f"p95 regressions: {report['regressions']}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,317 @@
+"""
+Метрики в формате Prometheus без внешних зависимостей: счетчики, гистограммы и gauge.
+Запись - обновление словаря под блокировкой, без ввода-вывода. Каждый процесс раз в
+flush_interval секунд сохраняет свой снимок в METRICS['directory'], а /metrics складывает
+снимки всех воркеров (flush_interval=None - снимки не пишутся, видны только метрики своего процесса). Счетчики и гистограммы умерших процессов продолжают учитываться
+(файлы старше retention удаляются), gauge - только у процессов, обновлявших файл
+в последние stale_after секунд
+"""
+import atexit
+import json
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+
+
+DEFAULTS = {
+    'enabled': True,
+    # По умолчанию BASE_DIR/cache/metrics
+    'directory': None,
+    'flush_interval': 5,
+    'stale_after': 60,
+    'retention': 7 * 24 * 60 * 60,
+    # Если задан, /metrics требует Authorization: Bearer <token>,
+    # иначе доступен только с адресов allowed_networks (REMOTE_ADDR)
+    'token': '',
+    'allowed_networks': ('127.0.0.0/8', '::1/128'),
+}
+
+# Границы гистограмм в секундах: от запросов к БД до генерации видео
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300)
+
+
+def metrics_options():
+    options = {**DEFAULTS, **getattr(settings, 'METRICS', {})}
+    options['directory'] = options['directory'] or os.path.join(settings.BASE_DIR, 'cache', 'metrics')
+    return options
+
+
+class Metric:
+    type = None
+
+    def __init__(self, name, documentation, labelnames=(), registry=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.registry = registry
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        # Запись в файл начинается с первого измерения: процессы без метрик (migrate и т.п.) ничего не пишут
+        if self.registry is not None and not self.registry.started:
+            self.registry.start()
+        return tuple(str(labels.get(name, '')) for name in self.labelnames)
+
+    def snapshot(self):
+        with self._lock:
+            return [[list(key), value] for key, value in self._values.items()]
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    type = 'gauge'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    @contextmanager
+    def track_inprogress(self, **labels):
+        self.inc(**labels)
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+
+class Histogram(Metric):
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), registry=None, buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames, registry)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # Счетчики по корзинам (без накопления), сумма и количество
+                state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][index] += 1
+                    break
+            state[1] += value
+            state[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def snapshot(self):
+        with self._lock:
+            return [[list(key), [list(state[0]), state[1], state[2]]] for key, state in self._values.items()]
+
+
+class MetricsRegistry:
+    """Метрики процесса и их сборка со всех воркеров"""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+        self._started = False
+
+    @property
+    def started(self):
+        return self._started
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter(name, documentation, labelnames, self))
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self._register(Gauge(name, documentation, labelnames, self))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(name, documentation, labelnames, self, buckets))
+
+    def _register(self, metric):
+        with self._lock:
+            self._metrics[metric.name] = metric
+        return metric
+
+    def snapshot(self):
+        return {
+            'pid': os.getpid(),
+            'updated': time.time(),
+            'metrics': {name: metric.snapshot() for name, metric in self._metrics.items()},
+        }
+
+    def start(self):
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+            if metrics_options()['flush_interval']:
+                threading.Thread(target=self._flush_loop, name='metrics-flush', daemon=True).start()
+                atexit.register(self._flush_quietly)
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(metrics_options()['flush_interval'])
+            self._flush_quietly()
+
+    def _flush_quietly(self):
+        if not metrics_options()['enabled']:
+            return
+        try:
+            self.flush()
+        except OSError:
+            pass
+
+    def flush(self):
+        """Атомарно записывает снимок процесса в <directory>/<pid>.json"""
+        directory = metrics_options()['directory']
+        os.makedirs(directory, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(self.snapshot(), f)
+        os.replace(temp_path, os.path.join(directory, f"{os.getpid()}.json"))
+
+    def collect(self):
+        """Снимки всех процессов: файлы других воркеров и текущее состояние этого"""
+        options = metrics_options()
+        snapshots = [self.snapshot()]
+        directory = options['directory']
+        if os.path.isdir(directory):
+            for filename in os.listdir(directory):
+                if not filename.endswith('.json') or filename == f"{os.getpid()}.json":
+                    continue
+                path = os.path.join(directory, filename)
+                try:
+                    if time.time() - os.path.getmtime(path) > options['retention']:
+                        os.remove(path)
+                        continue
+                    with open(path) as f:
+                        snapshots.append(json.load(f))
+                except (OSError, ValueError):
+                    continue
+
+        now = time.time()
+        merged = {}
+        for snapshot in snapshots:
+            alive = now - snapshot['updated'] <= options['stale_after']
+            for name, values in snapshot['metrics'].items():
+                metric = self._metrics.get(name)
+                if metric is None or (metric.type == 'gauge' and not alive):
+                    continue
+                target = merged.setdefault(name, {})
+                for labels, value in values:
+                    key = tuple(labels)
+                    if metric.type == 'histogram':
+                        state = target.setdefault(key, [[0] * len(metric.buckets), 0.0, 0])
+                        state[0] = [a + b for a, b in zip(state[0], value[0])]
+                        state[1] += value[1]
+                        state[2] += value[2]
+                    else:
+                        target[key] = target.get(key, 0) + value
+        return merged
+
+    def render(self):
+        """Текстовый формат Prometheus 0.0.4"""
+        lines = []
+        merged = self.collect()
+        for name, metric in sorted(self._metrics.items()):
+            lines.append(f"# HELP {name} {metric.documentation}")
+            lines.append(f"# TYPE {name} {metric.type}")
+            for key, value in sorted(merged.get(name, {}).items()):
+                labels = dict(zip(metric.labelnames, key))
+                if metric.type != 'histogram':
+                    lines.append(f"{name}{_labels(labels)} {_number(value)}")
+                    continue
+                cumulative = 0
+                for bound, count in zip(metric.buckets, value[0]):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{_labels({**labels, 'le': _number(bound)})} {cumulative}")
+                lines.append(f"{name}_bucket{_labels({**labels, 'le': '+Inf'})} {value[2]}")
+                lines.append(f"{name}_sum{_labels(labels)} {_number(value[1])}")
+                lines.append(f"{name}_count{_labels(labels)} {value[2]}")
+        return '\n'.join(lines) + '\n'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + '}'
+
+
+def _number(value):
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+registry = MetricsRegistry()
+
+stage_seconds = registry.histogram(
+    'generation_stage_seconds', 'Длительность этапа генерации', ('component', 'stage')
+)
+generations_in_progress = registry.gauge(
+    'generations_in_progress', 'Генерации, выполняемые сейчас', ('component',)
+)
+upstream_requests = registry.counter(
+    'upstream_requests_total', 'Запросы к внешним API', ('service', 'operation', 'outcome')
+)
+upstream_errors = registry.counter(
+    'upstream_errors_total', 'Ошибки запросов к внешним API по типу', ('service', 'operation', 'error')
+)
+upstream_seconds = registry.histogram(
+    'upstream_request_seconds', 'Длительность запросов к внешним API', ('service', 'operation')
+)
+upstream_in_flight = registry.gauge(
+    'upstream_requests_in_flight', 'Запросы к внешним API, ожидающие ответа', ('service', 'operation')
+)
+bytes_total = registry.counter(
+    'generation_bytes_total', 'Переданные байты: скачивание, base64, фото для vision', ('operation',)
+)
+
+
+class UpstreamCall:
+    """Исход запроса: исключение отмечается само, ответ с ошибкой - через call.error = 'HTTP 500'"""
+
+    def __init__(self):
+        self.error = None
+
+
+@contextmanager
+def upstream_call(service, operation):
+    """Замер запроса к внешнему API: длительность, in-flight, исход и тип ошибки"""
+    call = UpstreamCall()
+    upstream_in_flight.inc(service=service, operation=operation)
+    started = time.perf_counter()
+    try:
+        yield call
+    except Exception as e:
+        call.error = type(e).__name__
+        raise
+    finally:
+        upstream_seconds.observe(time.perf_counter() - started, service=service, operation=operation)
+        upstream_in_flight.dec(service=service, operation=operation)
+        upstream_requests.inc(service=service, operation=operation, outcome='error' if call.error else 'ok')
+        if call.error:
+            upstream_errors.inc(service=service, operation=operation, error=call.error)
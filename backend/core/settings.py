@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/4.2/ref/settings/
 
 from pathlib import Path
 import os
+import sys
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -59,6 +60,8 @@ INSTALLED_APPS = [
     'textG',
     'users',
     'imgG',
+    'videoG',
+    'history',
 ]
 
 CORS_ALLOWED_ORIGINS = ['http://localhost:5173']
@@ -106,6 +109,193 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+# Кэши общие для всех воркеров: файловые на одной машине или Redis, если задан REDIS_URL.
+# Файловый кэш сам вытесняет давно не использованные записи сверх MAX_ENTRIES (core/filecache.py).
+# В Redis MAX_ENTRIES не действует: объем ограничивают maxmemory и maxmemory-policy allkeys-lru
+# в конфигурации сервера, без них история диалогов ограничена только TTL
+
+REDIS_URL = os.environ.get('REDIS_URL')
+
+# manage.py test не пишет в рабочие каталоги: кэши в памяти процесса, снимки метрик не сохраняются
+TESTING = sys.argv[1:2] == ['test']
+
+
+def cache_config(name, max_entries):
+    if TESTING:
+        return {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': name,
+            'OPTIONS': {'MAX_ENTRIES': max_entries},
+        }
+    if REDIS_URL:
+        return {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+            'KEY_PREFIX': name,
+        }
+    return {
+        'BACKEND': 'core.filecache.LRUFileBasedCache',
+        'LOCATION': os.path.join(BASE_DIR, 'cache', name),
+        'OPTIONS': {'MAX_ENTRIES': max_entries},
+    }
+
+
+CACHES = {
+    'default': cache_config('default', 10000),
+    'textg_sessions': cache_config('textg_sessions', 5000),
+    'auth_tokens': cache_config('auth_tokens', 10000),
+}
+
+# Кэш токен -> пользователь для users.authentication.CachedTokenAuthentication
+AUTH_TOKEN_CACHE = {
+    'alias': 'auth_tokens',
+    'ttl': 5 * 60,
+}
+
+# Лимиты генераций на пользователя (users/throttling.py): capacity запросов подряд,
+# пополнение per_minute в минуту и дневная квота daily. Эндпоинт без записи не ограничен
+RATE_LIMITS = {
+    'img_generate': {'capacity': 5, 'per_minute': 6, 'daily': 200},
+    'video_generate': {'capacity': 2, 'per_minute': 2, 'daily': 30},
+    'text_generate': {'capacity': 10, 'per_minute': 20, 'daily': 1000},
+    # Пакет стоит столько токенов, сколько в нем элементов: capacity не меньше TEXTG_BATCH['max_items'],
+    # иначе допустимый пакет не пройдет никогда (проверяется manage.py check, users.W001)
+    'text_batch': {'capacity': 500, 'per_minute': 20, 'daily': 1000},
+}
+# Для нагрузочных тестов против тестового провайдера (python -m core.loadtest)
+if os.environ.get('RATE_LIMITS_DISABLED'):
+    RATE_LIMITS = {}
+
+# Пулы соединений к OpenAI и AIMLAPI (общие на процесс, см. core/clients.py)
+UPSTREAM_HTTP = {
+    'max_connections': 50,
+    'max_keepalive_connections': 20,
+    'keepalive_expiry': 60,
+    'connect_timeout': 10,
+    'read_timeout': 120,
+    'max_retries': 2,
+}
+
+# Повторы и лимиты скачивания файлов у внешних API (core/downloader.py)
+UPSTREAM_DOWNLOADS = {
+    'max_attempts': 4,
+    'backoff_base': 0.5,
+    'backoff_max': 30,
+    'max_bytes': 50 * 1024 ** 2,
+    'chunk_size': 64 * 1024,
+}
+
+# Потоков для параллельных этапов генерации изображений (imgG/gpt.py)
+IMG_PIPELINE_WORKERS = 8
+
+# Вариантов изображения за один запрос и потоков для параллельных вызовов DALL-E
+IMG_MAX_VARIANTS = 4
+IMG_VARIANT_WORKERS = 8
+
+# Кэш описаний фото от GPT-4o (таблица imgG.ImageDescription, вытеснение LRU)
+IMG_DESCRIPTION_CACHE = {
+    'max_entries': 5000,
+}
+
+# Фоновые задачи генерации изображений (core/jobs.py, imgG/jobs.py)
+IMG_JOBS = {
+    'workers': 4,
+    'stale_after': 15 * 60,
+    'poll_interval': 1.0,
+    'events_timeout': 5 * 60,
+}
+
+# Адреса OpenAI и AIMLAPI; для локальной проверки - тестовый провайдер (python -m core.fake_provider).
+# OPENAI_BASE_URL не задан - адрес по умолчанию клиента openai
+OPENAI_BASE_URL = os.environ.get('OPENAI_BASE_URL') or None
+AIMLAPI_BASE_URL = os.environ.get('AIMLAPI_BASE_URL', 'https://api.aimlapi.com').rstrip('/')
+
+# Вебхук о готовности видео (videoG/webhooks.py). Включается, если задан публичный адрес
+# /api/video/webhook/; опрос при этом остается редкой проверкой пропущенных уведомлений
+VIDEO_WEBHOOK = {
+    'url': os.environ.get('VIDEO_WEBHOOK_URL', ''),
+    'secret': os.environ.get('VIDEO_WEBHOOK_SECRET', ''),
+    'tolerance': 5 * 60,
+    'sweep_interval': 60,
+}
+
+# Фоновые задачи генерации видео (videoG/jobs.py): воркер только создает генерацию в AIMLAPI
+VIDEO_JOBS = {
+    'workers': 4,
+    'stale_after': 15 * 60,
+    'events_timeout': 15 * 60,
+}
+
+# Общий поток опроса генераций видео (videoG/poller.py), интервалы в секундах
+VIDEO_POLLER = {
+    'min_interval': 2,
+    'max_interval': 15,
+    'backoff': 1.5,
+    'ewma_alpha': 0.3,
+    'window': 0.25,
+    'timeout': 10 * 60,
+}
+
+# Режим progressive: сначала короткий черновик, затем полная версия (videoG/jobs.py)
+VIDEO_PROGRESSIVE = {
+    'draft_frames': 30,
+    'final_frames': 90,
+    'parallel': False,
+}
+
+# Локальные копии готовых видео и постеры (MEDIA_ROOT/videos, videoG/storage.py)
+VIDEO_STORAGE = {
+    'location': 'videos',
+    'max_bytes': 500 * 1024 ** 2,
+    'poster_at': 1.0,
+    'poster_width': 640,
+    'ffmpeg_timeout': 30,
+}
+
+# Фоновая запись истории генераций (history/writer.py): пачки до batch_size раз в flush_interval секунд
+HISTORY_WRITER = {
+    'batch_size': 200,
+    'flush_interval': 1.0,
+    'max_queue': 10000,
+}
+
+# Локальное хранилище сгенерированных изображений (MEDIA_ROOT/generated, imgG/storage.py)
+IMG_STORAGE = {
+    'location': 'generated',
+    'max_bytes': 5 * 1024 ** 3,
+    'max_age_days': 30,
+    'gc_interval': 60 * 60,
+}
+
+# История диалогов GPTClient
+TEXTG_SESSION_STORE = {
+    'BACKEND': 'textG.sessions.CacheSessionStore',
+    'OPTIONS': {
+        'alias': 'textg_sessions',
+        'ttl': 60 * 60,
+        'max_messages': 50,
+    },
+}
+
+# Кэш ответов для первых сообщений без истории (включается флагом cache в запросе)
+TEXTG_RESPONSE_CACHE = {
+    'max_size': 1000,
+    'ttl': 6 * 60 * 60,
+}
+
+# Пакетная генерация: параллельных запросов к GPT и максимум элементов в пакете
+TEXTG_BATCH = {
+    'concurrency': 8,
+    'max_items': 500,
+}
+
+# Бюджет токенов истории диалога по эндпоинтам (старое сворачивается в сводку).
+# Значения по умолчанию - DEFAULT_BUDGETS в textG/context.py, здесь только переопределения
+TEXTG_CONTEXT_BUDGETS = {}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
 
@@ -154,10 +344,24 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'users.authentication.CachedTokenAuthentication',
         'rest_framework.authentication.SessionAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.AllowAny',  # Изменено с IsAuthenticated на AllowAny
     ],
-}
\ No newline at end of file
+    # Сколько прокси перед приложением: по нему лимиты анонимов берут IP из X-Forwarded-For.
+    # 0 - только REMOTE_ADDR, заголовок от клиента игнорируется
+    'NUM_PROXIES': int(os.environ.get('NUM_PROXIES', '0')),
+}
+
+# Метрики для Prometheus (core/metrics.py, /metrics): снимки процессов пишутся в directory
+# (по умолчанию BASE_DIR/cache/metrics) раз в flush_interval секунд, None - не пишутся.
+# Без token /metrics отвечает только адресам из allowed_networks
+METRICS = {
+    'enabled': True,
+    'flush_interval': None if TESTING else 5,
+    'stale_after': 60,
+    'token': os.environ.get('METRICS_TOKEN', ''),
+    'allowed_networks': ('127.0.0.0/8', '::1/128'),
+}
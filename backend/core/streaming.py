@@ -0,0 +1,49 @@
+import json
+
+from django.http import StreamingHttpResponse
+from rest_framework.renderers import BaseRenderer
+
+
+def format_event(data, event=None):
+    """Форматирует одно событие Server-Sent Events"""
+    payload = json.dumps(data, ensure_ascii=False)
+    lines = []
+    if event:
+        lines.append(f"event: {event}")
+    lines.append(f"data: {payload}")
+    return "\n".join(lines) + "\n\n"
+
+
+def ndjson_response(rows):
+    """Потоковый ответ в формате NDJSON: по одному JSON-объекту на строку"""
+    lines = (json.dumps(row, ensure_ascii=False) + "\n" for row in rows)
+    response = StreamingHttpResponse(lines, content_type='application/x-ndjson; charset=utf-8')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+def sse_response(events):
+    """
+    Оборачивает генератор событий в потоковый HTTP-ответ.
+    Заголовки отключают буферизацию в прокси, чтобы токены доходили сразу
+    """
+    response = StreamingHttpResponse(events, content_type='text/event-stream; charset=utf-8')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+class EventStreamRenderer(BaseRenderer):
+    """
+    Рендерер для клиентов с Accept: text/event-stream.
+    Обычные ответы (ошибки валидации) отдаются как одно событие error
+    """
+    media_type = 'text/event-stream'
+    format = 'sse'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return format_event(data, event='error').encode(self.charset)
@@ -0,0 +1,176 @@
+import json
+import os
+import shutil
+import tempfile
+import time
+from datetime import timedelta
+from io import BytesIO
+from unittest import mock
+
+import requests
+from django.test import SimpleTestCase, override_settings
+
+from .downloader import DownloadError, download, request_with_retries, retry_delay
+from .metrics import MetricsRegistry
+
+
+class BrokenBody(BytesIO):
+    """Тело ответа, соединение которого обрывается после первых байт"""
+
+    def read(self, size=-1):
+        if self.tell():
+            raise requests.ConnectionError('connection reset')
+        return super().read(2)
+
+
+def make_response(status=200, body=b'', headers=None, broken=False):
+    response = requests.Response()
+    response.status_code = status
+    response.headers.update(headers or {})
+    response.raw = BrokenBody(body) if broken else BytesIO(body)
+    response.elapsed = timedelta(milliseconds=42)
+    return response
+
+
+class MetricsTests(SimpleTestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        override = override_settings(METRICS={'directory': self.directory, 'flush_interval': None, 'stale_after': 60})
+        override.enable()
+        self.addCleanup(override.disable)
+
+        self.registry = MetricsRegistry()
+        self.requests = self.registry.counter('requests_total', 'Запросы', ('outcome',))
+        self.active = self.registry.gauge('active', 'Активные')
+        self.seconds = self.registry.histogram('seconds', 'Длительность', buckets=(0.1, 1))
+
+    def write_snapshot(self, pid, updated, metrics):
+        with open(os.path.join(self.directory, f'{pid}.json'), 'w') as f:
+            json.dump({'pid': pid, 'updated': updated, 'metrics': metrics}, f)
+
+    def test_render(self):
+        self.requests.inc(outcome='ok')
+        self.requests.inc(2, outcome='error')
+        for value in (0.05, 0.5, 5):
+            self.seconds.observe(value)
+        lines = self.registry.render().splitlines()
+        self.assertIn('# TYPE requests_total counter', lines)
+        self.assertIn('requests_total{outcome="error"} 2', lines)
+        self.assertIn('requests_total{outcome="ok"} 1', lines)
+        # Корзины гистограммы накопительные
+        self.assertEqual(
+            [line for line in lines if line.startswith('seconds_')],
+            ['seconds_bucket{le="0.1"} 1', 'seconds_bucket{le="1"} 2', 'seconds_bucket{le="+Inf"} 3',
+             'seconds_sum 5.55', 'seconds_count 3']
+        )
+
+    def test_collect_merges_processes_and_drops_stale_gauges(self):
+        self.requests.inc(outcome='ok')
+        self.active.inc()
+        self.write_snapshot(1, time.time(), {
+            'requests_total': [[['ok'], 3]],
+            'active': [[[], 2]],
+            'seconds': [[[], [[1, 0], 0.05, 1]]],
+        })
+        # Процесс давно не обновлял снимок: его счетчики учитываются, gauge - нет
+        self.write_snapshot(2, time.time() - 600, {'requests_total': [[['ok'], 1]], 'active': [[[], 5]]})
+        merged = self.registry.collect()
+        self.assertEqual(merged['requests_total'], {('ok',): 5})
+        self.assertEqual(merged['active'], {(): 3})
+        self.assertEqual(merged['seconds'], {(): [[1, 0], 0.05, 1]})
+
+    def test_no_snapshots_without_flush_interval(self):
+        self.requests.inc(outcome='ok')
+        self.assertTrue(self.registry.started)
+        time.sleep(0.05)
+        self.assertEqual(os.listdir(self.directory), [])
+
+
+class MetricsViewTests(SimpleTestCase):
+    def test_internal_addresses_only_by_default(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 200)
+        self.assertEqual(self.client.get('/metrics', REMOTE_ADDR='203.0.113.5').status_code, 403)
+
+    @override_settings(METRICS={'token': 'secret', 'flush_interval': None})
+    def test_token(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+        self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer wrong').status_code, 403)
+        response = self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('# TYPE generation_stage_seconds histogram', response.content.decode())
+
+
+@override_settings(UPSTREAM_DOWNLOADS={'max_attempts': 3, 'backoff_max': 30, 'chunk_size': 4})
+@mock.patch('core.downloader.time.sleep')
+class DownloaderTests(SimpleTestCase):
+    def patch_requests(self, *responses):
+        patcher = mock.patch.object(requests.Session, 'request', side_effect=responses)
+        self.addCleanup(patcher.stop)
+        return patcher.start()
+
+    def test_retry_after(self, sleep):
+        request = self.patch_requests(make_response(503, headers={'Retry-After': '3'}), make_response(body=b'video'))
+        with self.assertLogs('core.downloader', 'WARNING'):
+            result = download('https://cdn/v.mp4')
+        self.assertEqual(result['data'], b'video')
+        self.assertEqual(result['metrics']['attempts'], 2)
+        self.assertEqual(result['metrics']['ttfb_ms'], 42)
+        sleep.assert_called_once_with(3.0)
+        self.assertEqual(request.call_count, 2)
+
+    def test_retry_delay(self, sleep):
+        self.assertEqual(retry_delay(1, '120'), 30)
+        self.assertEqual(retry_delay(1, 'Wed, 21 Oct 2015 07:28:00 GMT'), 0)
+        self.assertLessEqual(retry_delay(2, 'soon', {'backoff_base': 0.5, 'backoff_max': 30}), 1.0)
+
+    def test_post_is_not_retried_after_server_error(self, sleep):
+        request = self.patch_requests(make_response(500), make_response())
+        self.assertEqual(request_with_retries('POST', 'https://api').status_code, 500)
+        self.assertEqual(request.call_count, 1)
+
+    def test_broken_body_is_read_again(self, sleep):
+        self.patch_requests(make_response(body=b'video', broken=True), make_response(body=b'video'))
+        result = download('https://cdn/v.mp4')
+        self.assertEqual((result['data'], result['metrics']['attempts']), (b'video', 2))
+
+    def test_request_and_body_retries_share_one_budget(self, sleep):
+        request = self.patch_requests(
+            make_response(503),
+            make_response(body=b'video', broken=True),
+            make_response(body=b'video', broken=True),
+            make_response(body=b'video'),
+        )
+        with self.assertRaises(DownloadError) as error, self.assertLogs('core.downloader', 'WARNING'):
+            download('https://cdn/v.mp4')
+        self.assertEqual(error.exception.attempts, 3)
+        self.assertEqual(request.call_count, 3)
+
+    def test_http_error(self, sleep):
+        self.patch_requests(make_response(404))
+        with self.assertRaises(DownloadError) as error:
+            download('https://cdn/v.mp4')
+        self.assertEqual((error.exception.status_code, error.exception.attempts), (404, 1))
+
+    def test_max_bytes(self, sleep):
+        self.patch_requests(make_response(body=b'0' * 100, headers={'Content-Length': '100'}))
+        with self.assertRaisesMessage(DownloadError, 'File too large: 100 bytes'):
+            download('https://cdn/v.mp4', max_bytes=10)
+
+        # Размер не объявлен: загрузка прерывается на лимите, временный файл удаляется
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.patch_requests(make_response(body=b'0' * 100))
+        with self.assertRaisesMessage(DownloadError, 'File too large: over 10 bytes'):
+            download('https://cdn/v.mp4', path=os.path.join(directory, 'v.mp4'), max_bytes=10)
+        self.assertEqual(os.listdir(directory), [])
+
+    def test_download_to_path(self, sleep):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'videos', 'v.mp4')
+        self.patch_requests(make_response(body=b'video', headers={'Content-Type': 'video/mp4'}))
+        result = download('https://cdn/v.mp4', path=path)
+        self.assertEqual((result['data'], result['content_type'], result['size_bytes']), (None, 'video/mp4', 5))
+        with open(path, 'rb') as f:
+            self.assertEqual(f.read(), b'video')
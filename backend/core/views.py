@@ -0,0 +1,33 @@
+import hmac
+import ipaddress
+
+from django.http import HttpResponse, HttpResponseForbidden
+from django.views.decorators.http import require_GET
+
+from .metrics import metrics_options, registry
+
+
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _metrics_allowed(request, options):
+    """С токеном - только Authorization: Bearer <token>, без него - только внутренние адреса"""
+    if options['token']:
+        header = request.headers.get('Authorization', '')
+        return hmac.compare_digest(header.encode(), f"Bearer {options['token']}".encode())
+    try:
+        address = ipaddress.ip_address(request.META.get('REMOTE_ADDR', ''))
+    except ValueError:
+        return False
+    return any(address in ipaddress.ip_network(network) for network in options['allowed_networks'])
+
+
+@require_GET
+def metrics(request):
+    """Метрики всех воркеров в текстовом формате Prometheus"""
+    options = metrics_options()
+    if not options['enabled']:
+        return HttpResponse(status=404)
+    if not _metrics_allowed(request, options):
+        return HttpResponseForbidden()
+    return HttpResponse(registry.render(), content_type=PROMETHEUS_CONTENT_TYPE)
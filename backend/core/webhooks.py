@@ -0,0 +1,40 @@
+import hashlib
+import hmac
+import time
+
+
+# Подпись: HMAC-SHA256 от "<timestamp>.<тело запроса>" общим секретом
+SIGNATURE_HEADER = 'X-Webhook-Signature'
+TIMESTAMP_HEADER = 'X-Webhook-Timestamp'
+
+
+def sign(secret, timestamp, body):
+    message = f"{timestamp}.".encode('utf-8') + body
+    return 'sha256=' + hmac.new(secret.encode('utf-8'), message, hashlib.sha256).hexdigest()
+
+
+def signed_headers(secret, body, timestamp=None):
+    """Заголовки для отправки подписанного вебхука (используется тестовым провайдером)"""
+    timestamp = str(int(timestamp if timestamp is not None else time.time()))
+    return {
+        'Content-Type': 'application/json',
+        TIMESTAMP_HEADER: timestamp,
+        SIGNATURE_HEADER: sign(secret, timestamp, body),
+    }
+
+
+def verify(secret, body, timestamp, signature, tolerance=300):
+    """
+    Проверяет подпись и свежесть вебхука.
+    Старая метка времени отклоняется, чтобы перехваченный запрос нельзя было повторить
+    """
+    if not secret or not timestamp or not signature:
+        return False
+    try:
+        age = abs(time.time() - int(timestamp))
+    except ValueError:
+        return False
+    if age > tolerance:
+        return False
+    # compare_digest принимает str только из ASCII: заголовок с другими символами дал бы TypeError (500)
+    return hmac.compare_digest(sign(secret, timestamp, body).encode('utf-8'), signature.encode('utf-8'))
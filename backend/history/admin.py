@@ -0,0 +1,20 @@
+from django.contrib import admin
+from .models import Generation
+
+
+@admin.register(Generation)
+class GenerationAdmin(admin.ModelAdmin):
+    list_display = [
+        'id',
+        'user',
+        'kind',
+        'status',
+        'duration_ms',
+        'created_at'
+    ]
+    list_filter = ['kind', 'status']
+    search_fields = ['user__email', 'prompt']
+    raw_id_fields = ['user']
+    readonly_fields = [field.name for field in Generation._meta.fields]
+    # Без COUNT(*) по всей таблице на миллионах записей
+    show_full_result_count = False
@@ -0,0 +1,45 @@
+from django.urls import reverse
+from rest_framework import serializers
+
+from ..models import Generation
+
+
+class GenerationSerializer(serializers.ModelSerializer):
+    """Запись истории со ссылками на результат (файлы изображений, видео, статус задачи)"""
+
+    links = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Generation
+        fields = (
+            'id', 'kind', 'status', 'prompt', 'result', 'error', 'job_id',
+            'duration_ms', 'timings', 'created_at', 'links'
+        )
+
+    def get_links(self, obj):
+        request = self.context['request']
+        links = {}
+        result = obj.result or {}
+
+        if obj.kind == Generation.IMAGE:
+            links['images'] = [
+                request.build_absolute_uri(reverse('img-image-file', kwargs={'digest': digest}))
+                for digest in result.get('images', [])
+            ]
+            if obj.job_id:
+                links['status_url'] = request.build_absolute_uri(
+                    reverse('img-job-status', kwargs={'job_id': obj.job_id})
+                )
+
+        elif obj.kind == Generation.VIDEO and obj.job_id:
+            links['status_url'] = request.build_absolute_uri(
+                reverse('video-job-status', kwargs={'job_id': obj.job_id})
+            )
+            if result.get('local_copy'):
+                links['video'] = request.build_absolute_uri(
+                    reverse('video-video-file', kwargs={'job_id': obj.job_id})
+                )
+            elif result.get('video_url'):
+                links['video'] = result['video_url']
+
+        return links
@@ -0,0 +1,10 @@
+from django.urls import path, include
+from rest_framework.routers import DefaultRouter
+from .views import GenerationViewSet
+
+history_router = DefaultRouter()
+history_router.register(r'history', GenerationViewSet, basename='history')
+
+urlpatterns = [
+    path('', include(history_router.urls)),
+]
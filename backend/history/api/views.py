@@ -0,0 +1,33 @@
+from rest_framework import mixins, permissions, viewsets
+from rest_framework.pagination import CursorPagination
+
+from ..models import Generation
+from .serializers import GenerationSerializer
+
+
+class HistoryCursorPagination(CursorPagination):
+    """
+    Keyset-пагинация по created_at: страница берется по индексу (user, created_at)
+    с условием created_at < курсора, без OFFSET, поэтому не замедляется на глубоких страницах
+    """
+    ordering = '-created_at'
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+
+class GenerationViewSet(mixins.ListModelMixin, mixins.RetrieveModelMixin, viewsets.GenericViewSet):
+    """
+    История генераций текущего пользователя, новые сначала.
+    ?kind=text|image|video - только один тип
+    """
+    serializer_class = GenerationSerializer
+    pagination_class = HistoryCursorPagination
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_queryset(self):
+        queryset = Generation.objects.filter(user=self.request.user)
+        kind = self.request.query_params.get('kind')
+        if kind:
+            queryset = queryset.filter(kind=kind)
+        return queryset
@@ -0,0 +1,40 @@
+# Generated by Django 4.2.27 on 2026-10-18 11:57
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Generation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('text', 'Текст'), ('image', 'Изображение'), ('video', 'Видео')], max_length=10, verbose_name='Тип')),
+                ('status', models.CharField(choices=[('pending', 'В процессе'), ('succeeded', 'Готово'), ('failed', 'Ошибка')], default='succeeded', max_length=20, verbose_name='Статус')),
+                ('prompt', models.TextField(blank=True, verbose_name='Запрос')),
+                ('result', models.JSONField(blank=True, default=dict, verbose_name='Результат')),
+                ('error', models.TextField(blank=True, verbose_name='Ошибка')),
+                ('job_id', models.UUIDField(blank=True, null=True, verbose_name='ID задачи')),
+                ('duration_ms', models.PositiveIntegerField(blank=True, null=True, verbose_name='Длительность, мс')),
+                ('timings', models.JSONField(blank=True, default=dict, verbose_name='Этапы, мс')),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Дата создания')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='generations', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Генерация',
+                'verbose_name_plural': 'История генераций',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['user', '-created_at'], name='generation_user_created_idx'), models.Index(fields=['user', 'kind', '-created_at'], name='generation_user_kind_idx'), models.Index(condition=models.Q(('job_id__isnull', False)), fields=['job_id'], name='generation_job_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,60 @@
+from django.conf import settings
+from django.db import models
+from django.utils import timezone
+
+
+class Generation(models.Model):
+    """
+    Запись истории генераций пользователя: что просили и где лежит результат.
+    Сами изображения и видео не копируются - хранится ссылка (sha256 файла, ID задачи, URL)
+    """
+    TEXT = 'text'
+    IMAGE = 'image'
+    VIDEO = 'video'
+    KIND_CHOICES = [
+        (TEXT, 'Текст'),
+        (IMAGE, 'Изображение'),
+        (VIDEO, 'Видео'),
+    ]
+
+    PENDING = 'pending'
+    SUCCEEDED = 'succeeded'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (PENDING, 'В процессе'),
+        (SUCCEEDED, 'Готово'),
+        (FAILED, 'Ошибка'),
+    ]
+
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='generations',
+        verbose_name="Пользователь"
+    )
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES, verbose_name="Тип")
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=SUCCEEDED, verbose_name="Статус")
+    prompt = models.TextField(blank=True, verbose_name="Запрос")
+    # Ссылка на результат: текст ответа, sha256 изображений, URL видео
+    result = models.JSONField(default=dict, blank=True, verbose_name="Результат")
+    error = models.TextField(blank=True, verbose_name="Ошибка")
+    # Фоновая задача (ImageJob/VideoJob), по которой запись обновится после завершения
+    job_id = models.UUIDField(null=True, blank=True, verbose_name="ID задачи")
+    duration_ms = models.PositiveIntegerField(null=True, blank=True, verbose_name="Длительность, мс")
+    timings = models.JSONField(default=dict, blank=True, verbose_name="Этапы, мс")
+    # Время запроса, а не записи в БД: запись делается в фоне пачками
+    created_at = models.DateTimeField(default=timezone.now, verbose_name="Дата создания")
+
+    class Meta:
+        verbose_name = "Генерация"
+        verbose_name_plural = "История генераций"
+        ordering = ['-created_at']
+        indexes = [
+            # Лента пользователя и лента по типу: курсорная пагинация идет по индексу без OFFSET
+            models.Index(fields=['user', '-created_at'], name='generation_user_created_idx'),
+            models.Index(fields=['user', 'kind', '-created_at'], name='generation_user_kind_idx'),
+            models.Index(fields=['job_id'], name='generation_job_idx', condition=models.Q(job_id__isnull=False)),
+        ]
+
+    def __str__(self):
+        return f"{self.get_kind_display()} {self.user_id} {self.created_at:%Y-%m-%d %H:%M}"
@@ -0,0 +1,39 @@
+from django.dispatch import receiver
+
+from core.jobs import job_finished
+from imgG.models import ImageJob
+from videoG.models import VideoJob
+from .models import Generation
+from .writer import history_writer, image_reference
+
+
+def _job_fields(job):
+    fields = {
+        'status': Generation.SUCCEEDED if job.status == job.SUCCEEDED else Generation.FAILED,
+        'error': job.error or '',
+    }
+    if job.started_at and job.finished_at:
+        fields['duration_ms'] = round((job.finished_at - job.started_at).total_seconds() * 1000)
+    return fields
+
+
+@receiver(job_finished, sender=ImageJob)
+def record_image_job(sender, job, **kwargs):
+    fields = _job_fields(job)
+    if job.status == job.SUCCEEDED:
+        fields['result'] = {'job_id': str(job.pk), 'template_type': job.template_type, **image_reference(job.result)}
+        fields['timings'] = job.result.get('timings', {})
+    history_writer.update_job(job.pk, **fields)
+
+
+@receiver(job_finished, sender=VideoJob)
+def record_video_job(sender, job, **kwargs):
+    fields = _job_fields(job)
+    if job.status == job.SUCCEEDED:
+        fields['result'] = {
+            'job_id': str(job.pk),
+            'video_url': job.video_url,
+            'local_copy': bool(job.video_file),
+            'video_sha256': job.video_sha256,
+        }
+    history_writer.update_job(job.pk, **fields)
@@ -0,0 +1,104 @@
+import uuid
+from datetime import timedelta
+from unittest import mock
+
+from django.test import TestCase
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from core.jobs import job_finished
+from imgG.models import ImageJob
+from users.models import User
+from .models import Generation
+from .writer import history_writer
+
+
+class GenerationViewSetTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(email='anna@example.com', username='anna', password='secret-123')
+        self.other = User.objects.create_user(email='oleg@example.com', username='oleg', password='secret-123')
+        now = timezone.now()
+        Generation.objects.bulk_create([
+            Generation(user=self.user, kind=Generation.VIDEO if index % 5 == 0 else Generation.TEXT,
+                       prompt=f'запрос {index}', created_at=now - timedelta(minutes=index))
+            for index in range(25)
+        ])
+        Generation.objects.create(user=self.other, kind=Generation.TEXT, prompt='чужой', created_at=now)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def prompts(self, page):
+        return [row['prompt'] for row in page['results']]
+
+    def test_pages_by_cursor_newest_first(self):
+        first = self.client.get('/api/history/', {'page_size': 10}).data
+        self.assertEqual(self.prompts(first), [f'запрос {index}' for index in range(10)])
+        self.assertIsNone(first['previous'])
+
+        second = self.client.get(first['next']).data
+        self.assertEqual(self.prompts(second), [f'запрос {index}' for index in range(10, 20)])
+        last = self.client.get(second['next']).data
+        self.assertEqual(self.prompts(last), [f'запрос {index}' for index in range(20, 25)])
+        self.assertIsNone(last['next'])
+
+    def test_default_and_max_page_size(self):
+        self.assertEqual(len(self.client.get('/api/history/').data['results']), 20)
+        Generation.objects.bulk_create([Generation(user=self.user, kind=Generation.TEXT) for _ in range(100)])
+        self.assertEqual(len(self.client.get('/api/history/', {'page_size': 500}).data['results']), 100)
+
+    def test_kind_filter(self):
+        page = self.client.get('/api/history/', {'kind': Generation.VIDEO}).data
+        self.assertEqual(self.prompts(page), [f'запрос {index}' for index in range(0, 25, 5)])
+
+    def test_only_own_generations(self):
+        self.assertNotIn('чужой', self.prompts(self.client.get('/api/history/', {'page_size': 100}).data))
+        foreign = Generation.objects.get(user=self.other)
+        self.assertEqual(self.client.get(f'/api/history/{foreign.pk}/').status_code, 404)
+
+    def test_requires_authentication(self):
+        self.assertEqual(APIClient().get('/api/history/').status_code, 401)
+
+
+class HistoryWriterTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(email='anna@example.com', username='anna', password='secret-123')
+        # Очередь разбирается синхронно: фоновый поток не видит транзакцию теста
+        patcher = mock.patch.object(history_writer, '_put', side_effect=lambda item: history_writer._write([item]))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_record_without_job_is_queued(self):
+        history_writer.record(self.user, Generation.TEXT, prompt='Поздравь', result={'response': 'Ура'})
+        history_writer._put.assert_called_once()
+        self.assertEqual(Generation.objects.get().result, {'response': 'Ура'})
+
+    def test_anonymous_is_not_recorded(self):
+        history_writer.record(mock.Mock(is_authenticated=False), Generation.TEXT, prompt='Поздравь')
+        self.assertFalse(Generation.objects.exists())
+
+    def test_pending_job_is_updated_when_finished(self):
+        job = ImageJob.objects.create(template_type='Юбилей')
+        history_writer.record(self.user, Generation.IMAGE, prompt='Юбилей', status=Generation.PENDING, job_id=job.pk)
+        # Запись задачи сохраняется сразу, мимо очереди
+        history_writer._put.assert_not_called()
+        self.assertEqual(Generation.objects.get().status, Generation.PENDING)
+
+        job.status = ImageJob.SUCCEEDED
+        job.started_at = timezone.now() - timedelta(seconds=2)
+        job.finished_at = timezone.now()
+        job.result = {'stored_image': 'abc', 'image_url': 'https://img', 'timings': {'dalle': 1500}}
+        job_finished.send(sender=ImageJob, job=job)
+
+        generation = Generation.objects.get()
+        self.assertEqual(generation.status, Generation.SUCCEEDED)
+        self.assertEqual(generation.result['images'], ['abc'])
+        self.assertEqual(generation.result['image_urls'], ['https://img'])
+        self.assertEqual(generation.timings, {'dalle': 1500})
+        self.assertAlmostEqual(generation.duration_ms, 2000, delta=50)
+
+    def test_failed_job(self):
+        job_id = uuid.uuid4()
+        history_writer.record(self.user, Generation.VIDEO, status=Generation.PENDING, job_id=job_id)
+        history_writer.update_job(job_id, status=Generation.FAILED, error='timeout')
+        generation = Generation.objects.get()
+        self.assertEqual((generation.status, generation.error), (Generation.FAILED, 'timeout'))
@@ -0,0 +1,139 @@
+import atexit
+import logging
+import queue
+import threading
+import time
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils import timezone
+
+from .models import Generation
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'batch_size': 200,
+    # Сколько секунд копим записи перед записью пачкой
+    'flush_interval': 1.0,
+    # При переполнении очереди запись теряется, но запрос не ждет
+    'max_queue': 10000,
+}
+
+
+def image_reference(result):
+    """Ссылка на результат генерации изображения: sha256 сохраненных файлов и исходные URL, без base64"""
+    sources = result.get('variants') or [result]
+    succeeded = [source for source in sources if source.get('success', True)]
+    return {
+        'images': [source['stored_image'] for source in succeeded if source.get('stored_image')],
+        'image_urls': [source['image_url'] for source in succeeded if source.get('image_url')],
+        'message': result.get('content') or '',
+    }
+
+
+class HistoryWriter:
+    """
+    Пишет историю генераций в фоновом потоке пачками (bulk_create), чтобы запрос
+    пользователя не ждал INSERT. Исключение - записи фоновых задач: их завершает опрос
+    или вебхук, возможно в другом воркере, поэтому такая запись сохраняется сразу,
+    и обновление по job_id всегда находит строку
+    """
+
+    def __init__(self):
+        self._queue = None
+        self._thread = None
+        self._lock = threading.Lock()
+
+    @property
+    def options(self):
+        return {**DEFAULTS, **getattr(settings, 'HISTORY_WRITER', {})}
+
+    def record(self, user, kind, prompt='', result=None, status=Generation.SUCCEEDED, error='', job_id=None,
+               duration_ms=None, timings=None):
+        """Ставит запись в очередь (с job_id - пишет сразу). Анонимные запросы в историю не попадают"""
+        if user is None or not user.is_authenticated:
+            return
+        generation = Generation(
+            user_id=user.pk,
+            kind=kind,
+            status=status,
+            prompt=prompt or '',
+            result=result or {},
+            error=error or '',
+            job_id=job_id,
+            duration_ms=round(duration_ms) if duration_ms is not None else None,
+            timings=timings or {},
+            created_at=timezone.now(),
+        )
+        if job_id is not None:
+            generation.save(force_insert=True)
+            return
+        self._put(('create', generation))
+
+    def update_job(self, job_id, **fields):
+        """Обновляет записи фоновой задачи (статус, результат) после ее завершения"""
+        self._put(('update', job_id, fields))
+
+    def flush(self):
+        """Ждет, пока очередь будет записана (тесты, остановка процесса)"""
+        if self._queue is not None:
+            self._queue.join()
+
+    def _put(self, item):
+        self._start()
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            logger.warning("История генераций: очередь переполнена, запись пропущена")
+
+    def _start(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._queue = queue.Queue(maxsize=self.options['max_queue'])
+                self._thread = threading.Thread(target=self._loop, name='history-writer', daemon=True)
+                self._thread.start()
+                atexit.register(self.flush)
+
+    def _loop(self):
+        while True:
+            batch = [self._queue.get()]
+            options = self.options
+            deadline = time.monotonic() + options['flush_interval']
+            while len(batch) < options['batch_size']:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            close_old_connections()
+            try:
+                self._write(batch)
+            except Exception:
+                logger.exception("История генераций: не удалось записать %s записей", len(batch))
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def _write(self, batch):
+        created = []
+        for item in batch:
+            if item[0] == 'create':
+                created.append(item[1])
+                continue
+            if created:
+                Generation.objects.bulk_create(created)
+                created = []
+            _, job_id, fields = item
+            Generation.objects.filter(job_id=job_id).update(**fields)
+        if created:
+            Generation.objects.bulk_create(created)
+
+
+history_writer = HistoryWriter()
@@ -1,6 +1,6 @@
 from django.contrib import admin
 from django.utils.html import format_html
-from .models import CardTemplate
+from .models import CardTemplate, GeneratedImage, ImageJob
 
 
 @admin.register(CardTemplate)
@@ -35,4 +35,34 @@ class CardTemplateAdmin(admin.ModelAdmin):
     def log_deletion(self, *args, **kwargs):
         """Отключаем логирование удаления"""
         return None
-        
\ No newline at end of file
+
+
+@admin.register(GeneratedImage)
+class GeneratedImageAdmin(admin.ModelAdmin):
+    list_display = [
+        'sha256',
+        'content_type',
+        'size_bytes',
+        'model',
+        'created_at',
+        'last_accessed_at'
+    ]
+    list_filter = ['content_type', 'model']
+    search_fields = ['sha256', 'prompt']
+    readonly_fields = [field.name for field in GeneratedImage._meta.fields]
+
+
+@admin.register(ImageJob)
+class ImageJobAdmin(admin.ModelAdmin):
+    list_display = [
+        'id',
+        'template_type',
+        'status',
+        'created_at',
+        'started_at',
+        'finished_at'
+    ]
+    list_filter = ['status', 'template_type']
+    search_fields = ['id', 'text']
+    exclude = ['image_data']
+    readonly_fields = [field.name for field in ImageJob._meta.fields if field.name != 'image_data']
@@ -1,48 +1,132 @@
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
+from rest_framework.parsers import FormParser, JSONParser, MultiPartParser
 from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from django.conf import settings
+from django.http import Http404, HttpResponse
+from django.urls import reverse
 from django.utils.decorators import method_decorator
 from django.views.decorators.csrf import csrf_exempt
 import base64
-from ..gpt import process_with_gpt  # Импортируем готовую функцию
+import os
+from core.http import ranged_file_response
+from core.streaming import EventStreamRenderer, format_event, ndjson_response, sse_response
+from history.models import Generation
+from history.writer import history_writer, image_reference
+from users.throttling import ImageGenerationThrottle, RefundRejectedGenerationMixin
+from ..gpt import process_with_gpt, stream_with_gpt  # Импортируем готовую функцию
+from ..jobs import image_jobs
+from ..models import GeneratedImage, ImageJob
+from ..storage import absolute_path, touch
 
 
-class CardTemplateViewSet(viewsets.ViewSet):
+RESPONSE_FORMATS = ('base64', 'binary', 'url')
+# Файлы адресуются хэшем содержимого и никогда не меняются
+IMAGE_CACHE_SECONDS = 365 * 24 * 60 * 60
+
+
+class CardTemplateViewSet(RefundRejectedGenerationMixin, viewsets.ViewSet):
+    parser_classes = [JSONParser, MultiPartParser, FormParser]
+    renderer_classes = [*api_settings.DEFAULT_RENDERER_CLASSES, EventStreamRenderer]
     
     @method_decorator(csrf_exempt)
-    @action(detail=False, methods=['post'], url_path='generate')
+    @action(detail=False, methods=['post'], url_path='generate', throttle_classes=[ImageGenerationThrottle])
     def send_message(self, request):
         """
-        Принимает данные, вызывает внешнюю функцию и возвращает результат
+        Принимает данные, вызывает внешнюю функцию и возвращает результат.
+        Фото приходит файлом image (multipart/form-data) или полем image_data в base64.
+        response_format: base64 (по умолчанию) | binary | url.
+        variants: сколько вариантов сгенерировать по одному описанию и промпту;
+        с флагом stream варианты приходят в NDJSON по мере готовности.
+        С флагом async сразу отвечает 202 с job_id, генерация идет в фоне
         """
         try:
             # Получаем данные из запроса
             template_type = request.data.get('template_type')
             text = request.data.get('text', '')
+            response_format = request.data.get('response_format') or request.query_params.get('response_format', 'base64')
             
+            if response_format not in RESPONSE_FORMATS:
+                return Response(
+                    {'error': f'Unknown response_format: {response_format}'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            
+            max_variants = getattr(settings, 'IMG_MAX_VARIANTS', 4)
+            try:
+                variants = int(request.data.get('variants') or 1)
+            except (TypeError, ValueError):
+                variants = 0
+            if not 1 <= variants <= max_variants:
+                return Response(
+                    {'error': f'variants must be an integer from 1 to {max_variants}'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            if variants > 1 and response_format == 'binary':
+                return Response(
+                    {'error': 'response_format=binary returns a single image, use base64 or url for variants'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
             
             # Подготавливаем данные для внешней функции
             gpt_params = {
                 'template_type': template_type,
                 'text': text,
                 'image_data': None,
-                'image_format': None
+                'image_format': None,
+                'encode_base64': response_format == 'base64',
+                'variants': variants
             }
             
-            try:
-                image_data = base64.b64decode(request.data['image_data'])
-                gpt_params['image_format'] = request.data.get('image_format', 'image/jpeg')
-            except (base64.binascii.Error, ValueError) as e:
-                return Response(
-                    {'error': f'Invalid base64 image: {str(e)}'},
-                    status=status.HTTP_400_BAD_REQUEST
-                )
+            upload = request.FILES.get('image')
+            if upload is not None:
+                image_data = upload.read()
+                gpt_params['image_format'] = self._image_subtype(upload.content_type)
+            else:
+                try:
+                    image_data = base64.b64decode(request.data['image_data'])
+                    gpt_params['image_format'] = self._image_subtype(request.data.get('image_format', 'jpeg'))
+                except KeyError:
+                    return Response(
+                        {'error': 'Image is required: send file "image" or base64 "image_data"'},
+                        status=status.HTTP_400_BAD_REQUEST
+                    )
+                except (base64.binascii.Error, ValueError) as e:
+                    return Response(
+                        {'error': f'Invalid base64 image: {str(e)}'},
+                        status=status.HTTP_400_BAD_REQUEST
+                    )
             
             # Сохраняем бинарные данные изображения если есть
             if image_data:
                 gpt_params['image_data'] = image_data
             
+            if self._flag(request, 'async'):
+                job = ImageJob.objects.create(
+                    template_type=template_type or '',
+                    text=text or '',
+                    image_data=image_data or b'',
+                    image_format=gpt_params['image_format'] or '',
+                    variants=variants
+                )
+                # Запись истории по задаче пишется сразу, до submit: завершить задачу может другой воркер
+                history_writer.record(
+                    request.user,
+                    Generation.IMAGE,
+                    prompt=text,
+                    result={'template_type': template_type},
+                    status=Generation.PENDING,
+                    job_id=job.pk
+                )
+                image_jobs.submit(job)
+                return Response(self._job_data(request, job), status=status.HTTP_202_ACCEPTED)
+            
+            if self._flag(request, 'stream'):
+                return ndjson_response(self._stream_rows(request, stream_with_gpt(**gpt_params), template_type, text))
+            
             result = process_with_gpt(**gpt_params)
+            self._record(request, result, template_type, text)
             
             # Проверяем результат
             if not result or 'error' in result:
@@ -52,26 +136,168 @@ class CardTemplateViewSet(viewsets.ViewSet):
                     status=status.HTTP_500_INTERNAL_SERVER_ERROR
                 )
             
-            # Подготавливаем ответ
-            response_data = {
-                'success': True,
-                'template_type': template_type,
-                'message': result.get('content'),
-            }
-            
-            # Если в результате есть сгенерированное изображение (base64)
-            if 'image_base64' in result:
-                response_data['generated_image'] = result['image_base64']
-                response_data['image_format'] = result.get('image_format', 'image/png')
-                response_data['image_size'] = result.get('size_bytes', 0)
+            if response_format == 'binary':
+                return self._binary_response(result, template_type)
             
-            if 'image_url' in result:
-                response_data['image_url'] = result['image_url']
-            
-            return Response(response_data, status=status.HTTP_200_OK)
+            return Response(self._result_data(request, result, template_type), status=status.HTTP_200_OK)
         
         except Exception as e:
             return Response(
                 {'error': f'Internal server error: {str(e)}'},
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
-            )
\ No newline at end of file
+            )
+    
+    @action(detail=False, methods=['get'], url_path=r'jobs/(?P<job_id>[0-9a-f-]{36})')
+    def job_status(self, request, job_id=None):
+        """Состояние фоновой задачи; после завершения - тот же результат, что и у синхронного generate"""
+        job = image_jobs.get(job_id)
+        if job is None:
+            return Response({'error': 'Job not found'}, status=status.HTTP_404_NOT_FOUND)
+        return Response(self._job_data(request, job), status=status.HTTP_200_OK)
+    
+    @action(detail=False, methods=['get'], url_path=r'jobs/(?P<job_id>[0-9a-f-]{36})/events')
+    def job_events(self, request, job_id=None):
+        """
+        Server-Sent Events по задаче: событие с именем статуса при каждом его изменении,
+        поток закрывается после succeeded/failed
+        """
+        if image_jobs.get(job_id) is None:
+            return Response({'error': 'Job not found'}, status=status.HTTP_404_NOT_FOUND)
+        
+        def events():
+            for job in image_jobs.events(job_id):
+                yield format_event(self._job_data(request, job), event=job.status)
+        
+        return sse_response(events())
+    
+    @action(detail=False, methods=['get'], url_path=r'files/(?P<digest>[0-9a-f]{64})')
+    def image_file(self, request, digest=None):
+        """
+        Отдает сохраненное изображение с долгим кэшем, ETag и поддержкой Range
+        """
+        image = GeneratedImage.objects.filter(sha256=digest).first()
+        if image is None or not os.path.exists(absolute_path(image.path)):
+            raise Http404('Изображение не найдено')
+        
+        touch(image)
+        return ranged_file_response(
+            request,
+            absolute_path(image.path),
+            content_type=image.content_type,
+            etag=image.sha256,
+            max_age=IMAGE_CACHE_SECONDS,
+            immutable=True,
+            last_modified=image.created_at.timestamp()
+        )
+    
+    def _result_data(self, request, result, template_type):
+        """Тело успешного ответа generate из результата process_with_gpt"""
+        response_data = {
+            'success': True,
+            'template_type': template_type,
+            'message': result.get('content'),
+        }
+        
+        response_data.update(self._image_data(request, result))
+        
+        if 'variants' in result:
+            response_data['variants'] = [self._variant_data(request, variant) for variant in result['variants']]
+        
+        if 'timings' in result:
+            response_data['timings'] = result['timings']
+        
+        if 'preprocess' in result:
+            response_data['preprocess'] = result['preprocess']
+        
+        return response_data
+    
+    def _image_data(self, request, result):
+        """Поля изображения: base64, исходная ссылка и постоянная ссылка на наш файл"""
+        image_data = {}
+        
+        # Если в результате есть сгенерированное изображение (base64)
+        if 'image_base64' in result:
+            image_data['generated_image'] = result['image_base64']
+            image_data['image_format'] = result.get('image_format', 'image/png')
+            image_data['image_size'] = result.get('size_bytes', 0)
+        
+        if 'image_url' in result:
+            image_data['image_url'] = result['image_url']
+        
+        # Изображение сохранено у нас, даем постоянную ссылку на него
+        if 'stored_image' in result:
+            image_data['generated_image_url'] = request.build_absolute_uri(
+                reverse('img-image-file', kwargs={'digest': result['stored_image']})
+            )
+            image_data['image_format'] = result.get('image_format', 'image/png')
+            image_data['image_size'] = result.get('size_bytes', 0)
+        
+        return image_data
+    
+    def _variant_data(self, request, variant):
+        if not variant.get('success'):
+            return {'index': variant['index'], 'success': False, 'error': variant.get('error')}
+        return {
+            'index': variant['index'],
+            'success': True,
+            **self._image_data(request, variant),
+            'timings': variant.get('timings', {}),
+        }
+    
+    def _stream_rows(self, request, events, template_type, text):
+        """Строки NDJSON: варианты отдаются в том же виде, что и в variants обычного ответа"""
+        variants = []
+        for event in events:
+            if event['type'] == 'variant':
+                variants.append(event)
+                yield {'type': 'variant', **self._variant_data(request, event)}
+            else:
+                if event['type'] in ('done', 'error'):
+                    result = {'variants': variants, 'timings': event.get('timings', {})}
+                    if not event.get('success'):
+                        result['error'] = event.get('error') or 'All variants failed'
+                    self._record(request, result, template_type, text)
+                yield event
+    
+    def _record(self, request, result, template_type, text):
+        """Запись в историю пользователя: ссылки на сохраненные изображения, без base64"""
+        failed = not result or 'error' in result
+        history_writer.record(
+            request.user,
+            Generation.IMAGE,
+            prompt=text,
+            result={'template_type': template_type, **image_reference(result or {})},
+            status=Generation.FAILED if failed else Generation.SUCCEEDED,
+            error=(result or {}).get('error', '') if failed else '',
+            duration_ms=(result or {}).get('timings', {}).get('total_ms'),
+            timings=(result or {}).get('timings', {})
+        )
+    
+    def _job_data(self, request, job):
+        data = job.as_dict()
+        data['status_url'] = request.build_absolute_uri(reverse('img-job-status', kwargs={'job_id': job.pk}))
+        data['events_url'] = request.build_absolute_uri(reverse('img-job-events', kwargs={'job_id': job.pk}))
+        if job.status == ImageJob.SUCCEEDED:
+            data['result'] = self._result_data(request, job.result, job.template_type)
+        return data
+    
+    def _flag(self, request, name):
+        return str(request.data.get(name, request.query_params.get(name, ''))).lower() in ('1', 'true', 'yes')
+    
+    def _image_subtype(self, image_format):
+        """image/jpeg -> jpeg (фронтенд присылает уже подтип)"""
+        return (image_format or 'jpeg').split('/')[-1]
+    
+    def _binary_response(self, result, template_type):
+        """Сгенерированное изображение сырыми байтами, метаданные в заголовках"""
+        image_format = result.get('image_format', 'image/png')
+        response = HttpResponse(result['image_bytes'], content_type=image_format)
+        response['Content-Disposition'] = f'inline; filename="greeting.{image_format.split("/")[-1]}"'
+        response['X-Template-Type'] = str(template_type or '')
+        timings = result.get('timings', {})
+        response['Server-Timing'] = ', '.join(
+            f"{name[:-3]};dur={value}" for name, value in timings.items() if name.endswith('_ms')
+        )
+        if 'preprocess' in result:
+            response['X-Upload-Bytes-Saved'] = str(result['preprocess']['saved_bytes'])
+        return response
@@ -0,0 +1,55 @@
+import threading
+import uuid
+
+from django.apps import apps
+from django.core.cache import cache
+
+
+class TemplateCatalog:
+    """
+    Каталог активных шаблонов открыток в памяти процесса.
+    Загружается одним запросом и сбрасывается сигналами post_save/post_delete.
+    Версия каталога лежит в общем кэше, чтобы сброс увидели все воркеры
+    """
+
+    VERSION_KEY = 'imgG:template_catalog:version'
+
+    def __init__(self):
+        self._templates = None
+        self._version = None
+        self._lock = threading.Lock()
+
+    def get(self, title):
+        """Данные активного шаблона по названию или None"""
+        return self._current().get(title)
+
+    def invalidate(self):
+        """Сбрасывает каталог во всех процессах"""
+        cache.set(self.VERSION_KEY, uuid.uuid4().hex, None)
+        with self._lock:
+            self._templates = None
+
+    def _current(self):
+        version = cache.get(self.VERSION_KEY)
+        templates = self._templates
+        if templates is not None and version == self._version:
+            return templates
+
+        with self._lock:
+            if self._templates is None or version != self._version:
+                self._templates = self._load()
+                self._version = version
+            return self._templates
+
+    def _load(self):
+        CardTemplate = apps.get_model('imgG', 'CardTemplate')
+        templates = {}
+        for template in CardTemplate.objects.filter(is_active=True).order_by('id'):
+            templates.setdefault(template.title, {
+                'prompt': template.prompt if template.prompt else "",
+                'title': template.title,
+            })
+        return templates
+
+
+template_catalog = TemplateCatalog()
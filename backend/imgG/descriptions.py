@@ -0,0 +1,70 @@
+import hashlib
+import logging
+
+from django.apps import apps
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+
+logger = logging.getLogger(__name__)
+
+
+def image_digest(data: bytes) -> str:
+    """SHA-256 содержимого изображения"""
+    return hashlib.sha256(data).hexdigest()
+
+
+class DescriptionCache:
+    """
+    Кэш описаний GPT-4o по хэшу фото и версии промта.
+    Хранится в БД, поэтому общий для всех воркеров; при переполнении
+    удаляются записи, которые дольше всех не использовались (LRU)
+    """
+
+    @property
+    def model(self):
+        return apps.get_model('imgG', 'ImageDescription')
+
+    @property
+    def max_entries(self):
+        return getattr(settings, 'IMG_DESCRIPTION_CACHE', {}).get('max_entries', 5000)
+
+    def get(self, digest, prompt_version):
+        try:
+            updated = self.model.objects.filter(digest=digest, prompt_version=prompt_version).update(
+                last_used_at=timezone.now(),
+                hits=F('hits') + 1
+            )
+            if not updated:
+                return None
+            return self.model.objects.filter(
+                digest=digest, prompt_version=prompt_version
+            ).values_list('description', flat=True).first()
+        except Exception as e:
+            logger.warning("Кэш описаний недоступен: %s", e)
+            return None
+
+    def set(self, digest, prompt_version, description):
+        try:
+            # Точка сохранения: конфликт не должен ломать внешнюю транзакцию
+            with transaction.atomic():
+                self.model.objects.create(digest=digest, prompt_version=prompt_version, description=description)
+        except IntegrityError:
+            # Параллельный запрос с тем же фото уже сохранил описание
+            return
+        except Exception as e:
+            logger.warning("Не удалось сохранить описание в кэш: %s", e)
+            return
+        self.evict()
+
+    def evict(self):
+        """Удаляет самые давно использованные записи сверх max_entries"""
+        excess = self.model.objects.count() - self.max_entries
+        if excess > 0:
+            stale = self.model.objects.order_by('last_used_at').values_list('pk', flat=True)[:excess]
+            self.model.objects.filter(pk__in=list(stale)).delete()
+
+
+description_cache = DescriptionCache()
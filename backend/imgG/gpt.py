@@ -1,68 +1,129 @@
 # gpt.py
 import openai
 import base64
-import requests
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from django.conf import settings
-from django.apps import apps
+from django.db import connection
+from core.clients import get_openai_client
+from core.downloader import DownloadError, download
+from core.metrics import bytes_total, generations_in_progress, stage_seconds, upstream_call
+from .catalog import template_catalog
+from .descriptions import description_cache, image_digest
+from .preprocess import MAX_LONG_SIDE, MAX_SHORT_SIDE, preprocess_image
+from .storage import store_generated_image
+
+
+logger = logging.getLogger(__name__)
+
+
+DESCRIPTION_MODEL = "gpt-4o"
+DESCRIPTION_MAX_TOKENS = 200
+# DALL-E 3 отдает PNG до ~3 МБ, все заметно больше - не изображение
+IMAGE_MAX_BYTES = 20 * 1024 ** 2
+DESCRIPTION_PROMPT = """"Подробно опиши (ОЧЕНЬ ВАЖНО ПОДРОБНО ОПИСАТЬ ЛЮДЕЙ НА ИЗОБРАЖЕНИЕ) это изображение.
+                                 Используй богатый и детализированный язык, чтобы сгенерировать описание,
+                                  которое может быть использовано для дальнейшей генерации нового изображения в DALLE.
+                                   Укажи ключевые объекты (опиши заметные детали (например очки))"""
+
+# Версия промта для кэша описаний: меняется вместе с промтом, моделью, лимитом и предобработкой
+DESCRIPTION_PROMPT_VERSION = image_digest(
+    f"{DESCRIPTION_MODEL}:{DESCRIPTION_MAX_TOKENS}:{MAX_LONG_SIDE}x{MAX_SHORT_SIDE}:{DESCRIPTION_PROMPT}".encode('utf-8')
+)[:16]
+
+# Небольшой пул для независимых этапов пайплайна (БД, подготовка фото, vision)
+stage_executor = ThreadPoolExecutor(
+    max_workers=getattr(settings, 'IMG_PIPELINE_WORKERS', 8),
+    thread_name_prefix='img-stage'
+)
+# Отдельный ограниченный пул для параллельных вызовов DALL-E (по одному на вариант)
+variant_executor = ThreadPoolExecutor(
+    max_workers=getattr(settings, 'IMG_VARIANT_WORKERS', 8),
+    thread_name_prefix='img-variant'
+)
+
+
+def timed(timings, stage, func, *args, **kwargs):
+    """Выполняет этап и записывает его длительность в timings[stage] (мс) и в метрики"""
+    start = time.perf_counter()
+    try:
+        return func(*args, **kwargs)
+    finally:
+        elapsed = time.perf_counter() - start
+        timings[stage] = round(elapsed * 1000, 1)
+        stage_seconds.observe(elapsed, component='img', stage=stage[:-3] if stage.endswith('_ms') else stage)
+
+
+def encode_image(image_bytes):
+    bytes_total.inc(len(image_bytes), operation='base64_encode')
+    return base64.b64encode(image_bytes).decode('utf-8')
 
 
 class DalleImageGenerator:
-    def __init__(self):
-        """Инициализация клиента OpenAI для DALL-E"""
-        self.client = openai.OpenAI(api_key=settings.API_KEY)
-        
+    @property
+    def client(self):
+        """Общий клиент OpenAI процесса (создается при первом обращении)"""
+        return get_openai_client(settings.API_KEY)
+    
     def get_template_data(self, template_name):
-        """Получает данные шаблона из БД"""
+        """Получает данные активного шаблона из каталога в памяти"""
         try:
-            CardTemplate = apps.get_model('imgG', 'CardTemplate')
-            template = CardTemplate.objects.filter(title=template_name).first()
-            
-            if template:
-                data = {
-                    'prompt': template.prompt if template.prompt else "",
-                    'title': template.title,
-                }
-                
-                return data
-            else:
-                return {}
+            return template_catalog.get(template_name) or {}
         
         except Exception as e:
             return {}
-        
+    
+    def _load_template_in_thread(self, template_name):
+        """get_template_data для пула: если каталог подгружался из БД, закрываем соединение потока"""
+        try:
+            return self.get_template_data(template_name)
+        finally:
+            connection.close()
+    
+    def prepare_image(self, bytes_image_string, file_type_name):
+        """
+        Готовит фото для vision-запроса: уменьшает, перекодирует и собирает data URL.
+        Возвращает data_url, detail и статистику по байтам
+        """
+        prepared = preprocess_image(bytes_image_string, file_type_name)
+        base64_image_string = base64.b64encode(prepared.pop('data')).decode('utf-8')
+        bytes_total.inc(len(base64_image_string), operation='vision_upload')
+        prepared['data_url'] = f"data:{prepared['mime']};base64,{base64_image_string}"
+        return prepared
+    
     def description_img(self, bytes_image_string, file_type_name):
-        mime_type = f"image/{file_type_name}"
-        base64_image_string = base64.b64encode(bytes_image_string).decode('utf-8')
-        image_data_url = f"data:{mime_type};base64,{base64_image_string}"
-        
+        prepared = self.prepare_image(bytes_image_string, file_type_name)
+        return self.describe_image(prepared['data_url'], prepared['detail'])
+    
+    def describe_image(self, image_data_url, detail="auto"):
+        """Описание изображения через GPT-4o"""
         try:
-            response = self.client.chat.completions.create(
-                model="gpt-4o",  # Рекомендуемая модель для Vision задач
-                messages=[
-                    {
-                        "role": "user",
-                        "content": [
-                            {
-                                "type": "text",
-                                # Промт для генерации описания для дальнейшего использования
-                                "text": """"Подробно опиши (ОЧЕНЬ ВАЖНО ПОДРОБНО ОПИСАТЬ ЛЮДЕЙ НА ИЗОБРАЖЕНИЕ) это изображение.
-                                 Используй богатый и детализированный язык, чтобы сгенерировать описание,
-                                  которое может быть использовано для дальнейшей генерации нового изображения в DALLE.
-                                   Укажи ключевые объекты (опиши заметные детали (например очки))"""
-                            },
-                            {
-                                "type": "image_url",
-                                "image_url": {
-                                    # Передаем Base64 в виде data URL
-                                    "url": image_data_url,
-                                    "detail": "auto"  # Запрос на более детальный анализ
+            with upstream_call('openai', 'vision'):
+                response = self.client.chat.completions.create(
+                    model=DESCRIPTION_MODEL,  # Рекомендуемая модель для Vision задач
+                    messages=[
+                        {
+                            "role": "user",
+                            "content": [
+                                {
+                                    "type": "text",
+                                    # Промт для генерации описания для дальнейшего использования
+                                    "text": DESCRIPTION_PROMPT
+                                },
+                                {
+                                    "type": "image_url",
+                                    "image_url": {
+                                        # Передаем Base64 в виде data URL
+                                        "url": image_data_url,
+                                        "detail": detail  # low для маленьких фото, иначе high
+                                    }
                                 }
-                            }
-                        ]
-                    }
-                ],
-                max_tokens=200  # Ограничение длины ответа
-            )
+                            ]
+                        }
+                    ],
+                    max_tokens=DESCRIPTION_MAX_TOKENS  # Ограничение длины ответа
+                )
             
             image_description = response.choices[0].message.content
             return image_description
@@ -70,93 +131,223 @@ class DalleImageGenerator:
         except Exception as e:
             print(f"❌ Произошла ошибка при вызове OpenAI API: {e}")
     
-    def generate_dalle3_image(self, prompt, size="1024x1024", quality="standard"):
+    def generate_dalle3_image(self, prompt, size="1024x1024", quality="standard", timings=None, encode_base64=True):
         """Генерирует изображение через DALL-E 3"""
+        timings = timings if timings is not None else {}
         try:
-            response = self.client.images.generate(
-                model="dall-e-3",
-                prompt=prompt,
-                size=size,
-                quality=quality,
-                n=1,
-                response_format="url"
-            )
+            with upstream_call('openai', 'images'):
+                response = timed(
+                    timings, 'generation_ms',
+                    self.client.images.generate,
+                    model="dall-e-3",
+                    prompt=prompt,
+                    size=size,
+                    quality=quality,
+                    n=1,
+                    response_format="url"
+                )
             
             image_url = response.data[0].url
             
-            result = self._download_and_encode_image(image_url, prompt, model='dall-e-3')
+            result = timed(
+                timings, 'download_ms',
+                self._download_and_encode_image, image_url, prompt, model='dall-e-3', encode_base64=False
+            )
             
             if result.get('success'):
+                download_metrics = result.pop('download')
+                timings['download_ttfb_ms'] = download_metrics['ttfb_ms']
+                timings['download_attempts'] = download_metrics['attempts']
                 result['operation'] = 'generation'
                 result['model'] = 'dall-e-3'
+                timed(timings, 'store_ms', self._store_image, result)
+                if encode_base64:
+                    result['image_base64'] = timed(timings, 'encode_ms', encode_image, result.pop('image_bytes'))
             
             return result
         
         except openai.OpenAIError as e:
             return {'success': False, 'error': f'DALL-E 3 error: {str(e)}'}
     
-    def _download_and_encode_image(self, image_url, prompt=None, model=None):
-        """Скачивает и кодирует изображение"""
+    def _store_image(self, result):
+        """
+        Сохраняет результат в локальное хранилище: ссылка DALL-E временная.
+        Ошибка хранилища не мешает отдать изображение пользователю
+        """
+        try:
+            image = store_generated_image(
+                result['image_bytes'],
+                result['image_format'],
+                prompt=result.get('prompt', ''),
+                model=result.get('model', ''),
+                source_url=result.get('image_url', '')
+            )
+            result['stored_image'] = image.sha256
+        except Exception as e:
+            logger.warning("Не удалось сохранить изображение: %s", e)
+    
+    def _download_and_encode_image(self, image_url, prompt=None, model=None, encode_base64=True):
+        """
+        Скачивает и кодирует изображение.
+        При encode_base64=False возвращает сырые байты в image_bytes без копии в base64
+        """
         try:
-            headers = {'User-Agent': 'Mozilla/5.0'}
-            img_response = requests.get(image_url, headers=headers, timeout=30)
-            
-            if img_response.status_code == 200:
-                image_data = img_response.content
-                
-                # Определяем формат
-                if image_data[:8] == b'\x89PNG\r\n\x1a\n':
-                    img_format = 'png'
-                elif image_data[:3] == b'\xff\xd8\xff':
-                    img_format = 'jpeg'
-                else:
-                    img_format = 'png'
-                
-                image_b64 = base64.b64encode(image_data).decode('utf-8')
-                
-                result = {
-                    'success': True,
-                    'image_base64': image_b64,
-                    'image_url': image_url,
-                    'image_format': f'image/{img_format}',
-                    'size_bytes': len(image_data)
-                }
-                
-                if prompt:
-                    result['prompt'] = prompt
-                if model:
-                    result['model'] = model
-                
-                return result
+            downloaded = download(image_url, max_bytes=IMAGE_MAX_BYTES)
+            image_data = downloaded['data']
+            
+            # Определяем формат
+            if image_data[:8] == b'\x89PNG\r\n\x1a\n':
+                img_format = 'png'
+            elif image_data[:3] == b'\xff\xd8\xff':
+                img_format = 'jpeg'
+            else:
+                img_format = 'png'
+            
+            result = {
+                'success': True,
+                'image_url': image_url,
+                'image_format': f'image/{img_format}',
+                'size_bytes': len(image_data),
+                'download': downloaded['metrics']
+            }
+            
+            if encode_base64:
+                result['image_base64'] = encode_image(image_data)
             else:
-                return {'success': False, 'error': f'Download failed: HTTP {img_response.status_code}'}
+                result['image_bytes'] = image_data
+            
+            if prompt:
+                result['prompt'] = prompt
+            if model:
+                result['model'] = model
+            
+            return result
+        
+        except DownloadError as e:
+            return {'success': False, 'error': f'Download failed: {str(e)}'}
         
         except Exception as e:
             return {'success': False, 'error': f'Download error: {str(e)}'}
     
-    def process_image_generation(self, template_type, user_text=None, user_image_data=None, size=None, image_format=None):
-        """Основная функция генерации"""
+    def _describe_stage(self, timings, user_image_data, image_format, preprocess_stats=None):
+        """
+        Подготовка фото и vision-запрос (выполняется в пуле этапов).
+        Повторная загрузка того же фото берет описание из кэша
+        """
+        preprocess_stats = preprocess_stats if preprocess_stats is not None else {}
+        if not user_image_data:
+            return None
         try:
-            # Получаем данные шаблона
-            template_data = self.get_template_data(template_type)
-            base_prompt = template_data.get('prompt', '')
-            final_size = size
+            digest = image_digest(user_image_data)
+            cached = timed(timings, 'description_cache_ms', description_cache.get, digest, DESCRIPTION_PROMPT_VERSION)
+            if cached is not None:
+                timings['description_cached'] = True
+                return cached
             
-            descriptions = self.description_img(user_image_data, image_format)
-            
-            # Формируем промпт
-            final_prompt = base_prompt
-            if user_text and user_text.strip():
-                final_prompt = f"{base_prompt} Дополнительные условия: {user_text}, описание: {descriptions}"
+            prepared = timed(timings, 'preprocess_ms', self.prepare_image, user_image_data, image_format)
+            preprocess_stats.update({k: v for k, v in prepared.items() if k != 'data_url'})
+            description = timed(timings, 'description_ms', self.describe_image, prepared['data_url'], prepared['detail'])
+            if description:
+                description_cache.set(digest, DESCRIPTION_PROMPT_VERSION, description)
+            return description
+        finally:
+            connection.close()
+    
+    def _generate_variant_in_thread(self, **kwargs):
+        """generate_dalle3_image для пула вариантов: _store_image пишет в БД, закрываем соединение потока"""
+        try:
+            return self.generate_dalle3_image(**kwargs)
+        finally:
+            connection.close()
+    
+    def iter_variants(self, prompt, size, count, encode_base64=True):
+        """
+        Запускает count генераций по одному промпту одновременно и отдает результаты
+        по мере готовности. У каждого варианта свои index и timings
+        """
+        futures = {}
+        for index in range(count):
+            variant_timings = {}
+            future = variant_executor.submit(
+                self._generate_variant_in_thread,
+                prompt=prompt,
+                size=size,
+                timings=variant_timings,
+                encode_base64=encode_base64
+            )
+            futures[future] = (index, variant_timings)
+        
+        for future in as_completed(futures):
+            index, variant_timings = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                result = {'success': False, 'error': f'Generation error: {str(e)}'}
+            result['index'] = index
+            result['timings'] = variant_timings
+            yield result
+    
+    def _build_prompt(self, template_type, user_text, user_image_data, image_format, timings, preprocess_stats):
+        """Шаблон и описание фото независимы - получаем параллельно и собираем промпт"""
+        template_future = stage_executor.submit(
+            timed, timings, 'template_ms', self._load_template_in_thread, template_type
+        )
+        description_future = stage_executor.submit(
+            self._describe_stage, timings, user_image_data, image_format, preprocess_stats
+        )
+        
+        template_data = template_future.result()
+        descriptions = description_future.result()
+        base_prompt = template_data.get('prompt', '')
+        
+        # Формируем промпт
+        final_prompt = base_prompt
+        if user_text and user_text.strip():
+            final_prompt = f"{base_prompt} Дополнительные условия: {user_text}, описание: {descriptions}"
+        
+        return template_data, final_prompt
+    
+    @generations_in_progress.track_inprogress(component='img')
+    def process_image_generation(self, template_type, user_text=None, user_image_data=None, size=None, image_format=None,
+                                 encode_base64=True, variants=1):
+        """
+        Основная функция генерации.
+        Этапы: шаблон из БД || (подготовка фото -> описание GPT-4o) -> промпт -> DALL-E -> скачивание.
+        При variants > 1 описание и промпт общие, а вызовы DALL-E идут параллельно
+        """
+        timings = {}
+        preprocess_stats = {}
+        started = time.perf_counter()
+        try:
+            template_data, final_prompt = self._build_prompt(
+                template_type, user_text, user_image_data, image_format, timings, preprocess_stats
+            )
+            final_size = size
             
             # Выбираем стратегию
+            if variants > 1:
+                generations = sorted(
+                    timed(timings, 'generation_ms', list, self.iter_variants(final_prompt, final_size, variants, encode_base64)),
+                    key=lambda variant: variant['index']
+                )
+                succeeded = [variant for variant in generations if variant.get('success')]
+                result = {'success': bool(succeeded), 'variants': generations}
+                if not succeeded:
+                    result['error'] = generations[0].get('error', 'All variants failed')
+            else:
+                result = self.generate_dalle3_image(
+                    prompt=final_prompt,
+                    size=final_size,
+                    timings=timings,
+                    encode_base64=encode_base64
+                )
             
-            result = self.generate_dalle3_image(
-                prompt=final_prompt,
-                size=final_size
-            )
-
             # Добавляем метаданные
+            timings['total_ms'] = round((time.perf_counter() - started) * 1000, 1)
+            stage_seconds.observe(timings['total_ms'] / 1000, component='img', stage='total')
+            result['timings'] = timings
+            if preprocess_stats:
+                result['preprocess'] = preprocess_stats
             if result.get('success'):
                 result.update({
                     'template_type': template_type,
@@ -173,13 +364,47 @@ class DalleImageGenerator:
                 'error': f'Processing error: {str(e)}',
                 'template_type': template_type
             }
+    
+    def stream_image_generation(self, template_type, user_text=None, user_image_data=None, size=None, image_format=None,
+                                encode_base64=True, variants=1):
+        """
+        То же, что process_image_generation, но отдает события по ходу работы:
+        prompt (промпт готов), variant (каждый вариант, как только готов), done или error
+        """
+        timings = {}
+        preprocess_stats = {}
+        started = time.perf_counter()
+        try:
+            template_data, final_prompt = self._build_prompt(
+                template_type, user_text, user_image_data, image_format, timings, preprocess_stats
+            )
+            yield {
+                'type': 'prompt',
+                'template_type': template_type,
+                'template_title': template_data.get('title', template_type),
+                'prompt_used': final_prompt,
+                'timings': dict(timings),
+                'preprocess': preprocess_stats,
+            }
+            
+            succeeded = 0
+            for result in self.iter_variants(final_prompt, size, variants, encode_base64):
+                succeeded += bool(result.get('success'))
+                yield {'type': 'variant', **result}
+            
+            timings['total_ms'] = round((time.perf_counter() - started) * 1000, 1)
+            stage_seconds.observe(timings['total_ms'] / 1000, component='img', stage='total')
+            yield {'type': 'done', 'success': succeeded > 0, 'variants': variants, 'succeeded': succeeded, 'timings': timings}
+        
+        except Exception as e:
+            yield {'type': 'error', 'success': False, 'error': f'Processing error: {str(e)}'}
 
 
 # Глобальный экземпляр
 image_generator = DalleImageGenerator()
 
 
-def process_with_gpt(template_type, text, image_data=None, image_format=None):
+def process_with_gpt(template_type, text, image_data=None, image_format=None, encode_base64=True, variants=1):
     """
     Интерфейсная функция для ViewSet
     """
@@ -188,5 +413,22 @@ def process_with_gpt(template_type, text, image_data=None, image_format=None):
         user_text=text,
         user_image_data=image_data,
         image_format=image_format,
-        size="1024x1024"
+        size="1024x1024",
+        encode_base64=encode_base64,
+        variants=variants
+    )
+
+
+def stream_with_gpt(template_type, text, image_data=None, image_format=None, encode_base64=True, variants=1):
+    """
+    Интерфейсная функция для потокового ответа ViewSet
+    """
+    return image_generator.stream_image_generation(
+        template_type=template_type,
+        user_text=text,
+        user_image_data=image_data,
+        image_format=image_format,
+        size="1024x1024",
+        encode_base64=encode_base64,
+        variants=variants
     )
\ No newline at end of file
@@ -0,0 +1,24 @@
+from core.jobs import JobQueue
+from .gpt import process_with_gpt
+from .models import ImageJob
+
+
+def run_image_job(job):
+    """Выполняет генерацию для задачи; байты изображения уже лежат в хранилище, в результат идет только ссылка"""
+    result = process_with_gpt(
+        template_type=job.template_type,
+        text=job.text,
+        image_data=bytes(job.image_data) or None,
+        image_format=job.image_format or None,
+        encode_base64=False,
+        variants=job.variants
+    )
+    result.pop('image_bytes', None)
+    for variant in result.get('variants', []):
+        variant.pop('image_bytes', None)
+    # Фото пользователя больше не нужно
+    job.image_data = b''
+    return result
+
+
+image_jobs = JobQueue(ImageJob, run_image_job, setting='IMG_JOBS', name='img')
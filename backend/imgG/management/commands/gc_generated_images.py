@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from imgG.storage import collect_garbage
+
+
+class Command(BaseCommand):
+    help = 'Удаляет старые сгенерированные изображения, чтобы уложиться в бюджет IMG_STORAGE'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--max-bytes', type=int, default=None, help='Максимальный объем хранилища в байтах')
+        parser.add_argument('--max-age-days', type=int, default=None, help='Удалять файлы без обращений дольше N дней')
+
+    def handle(self, *args, **options):
+        result = collect_garbage(max_bytes=options['max_bytes'], max_age_days=options['max_age_days'])
+        self.stdout.write(f"Удалено файлов: {result['deleted']}, освобождено байт: {result['freed_bytes']}")
@@ -0,0 +1,29 @@
+# Generated by Django 4.2.27 on 2026-10-18 11:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('imgG', '0002_remove_cardtemplate_image'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImageDescription',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('digest', models.CharField(max_length=64, verbose_name='SHA-256 изображения')),
+                ('prompt_version', models.CharField(max_length=32, verbose_name='Версия промта описания')),
+                ('description', models.TextField(verbose_name='Описание')),
+                ('hits', models.PositiveIntegerField(default=0, verbose_name='Повторных использований')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')),
+                ('last_used_at', models.DateTimeField(auto_now_add=True, db_index=True, verbose_name='Последнее использование')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='imagedescription',
+            constraint=models.UniqueConstraint(fields=('digest', 'prompt_version'), name='unique_image_description'),
+        ),
+    ]
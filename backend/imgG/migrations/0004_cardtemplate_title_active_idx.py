@@ -0,0 +1,17 @@
+# Generated by Django 4.2.27 on 2026-10-18 11:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('imgG', '0003_imagedescription'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='cardtemplate',
+            index=models.Index(fields=['title', 'is_active'], name='cardtemplate_title_active_idx'),
+        ),
+    ]
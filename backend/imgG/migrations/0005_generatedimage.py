@@ -0,0 +1,30 @@
+# Generated by Django 4.2.27 on 2026-10-18 11:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('imgG', '0004_cardtemplate_title_active_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GeneratedImage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sha256', models.CharField(max_length=64, unique=True, verbose_name='SHA-256')),
+                ('path', models.CharField(max_length=255, verbose_name='Путь относительно MEDIA_ROOT')),
+                ('content_type', models.CharField(max_length=50, verbose_name='MIME-тип')),
+                ('size_bytes', models.PositiveIntegerField(verbose_name='Размер, байт')),
+                ('width', models.PositiveIntegerField(blank=True, null=True, verbose_name='Ширина')),
+                ('height', models.PositiveIntegerField(blank=True, null=True, verbose_name='Высота')),
+                ('prompt', models.TextField(blank=True, verbose_name='Промт')),
+                ('model', models.CharField(blank=True, max_length=50, verbose_name='Модель')),
+                ('source_url', models.URLField(blank=True, max_length=2000, verbose_name='Исходный URL')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')),
+                ('last_accessed_at', models.DateTimeField(auto_now_add=True, db_index=True, verbose_name='Последнее обращение')),
+            ],
+        ),
+    ]
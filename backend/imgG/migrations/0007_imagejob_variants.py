@@ -0,0 +1,18 @@
+# Generated by Django 4.2.27 on 2026-10-18 11:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('imgG', '0006_imagejob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='imagejob',
+            name='variants',
+            field=models.PositiveSmallIntegerField(default=1, verbose_name='Вариантов'),
+        ),
+    ]
@@ -1,6 +1,7 @@
 from django.db import models
 from django.utils.text import slugify
 import os
+from core.jobs import BaseJob
 
 
 class CardTemplate(models.Model):
@@ -25,7 +26,134 @@ class CardTemplate(models.Model):
         verbose_name="Активный"
     )
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['title', 'is_active'], name='cardtemplate_title_active_idx'),
+        ]
+
     def __str__(self):
         return self.title
 
-    
\ No newline at end of file
+
+class ImageDescription(models.Model):
+    """Кэш описаний загруженных фото (см. imgG/descriptions.py)"""
+    digest = models.CharField(
+        max_length=64,
+        verbose_name="SHA-256 изображения"
+    )
+    prompt_version = models.CharField(
+        max_length=32,
+        verbose_name="Версия промта описания"
+    )
+    description = models.TextField(
+        verbose_name="Описание"
+    )
+    hits = models.PositiveIntegerField(
+        default=0,
+        verbose_name="Повторных использований"
+    )
+    created_at = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name="Дата создания"
+    )
+    last_used_at = models.DateTimeField(
+        auto_now_add=True,
+        db_index=True,
+        verbose_name="Последнее использование"
+    )
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['digest', 'prompt_version'], name='unique_image_description'),
+        ]
+
+    def __str__(self):
+        return f"{self.digest[:12]} ({self.prompt_version})"
+
+
+class GeneratedImage(models.Model):
+    """Сгенерированное изображение в локальном хранилище, адресуемое по SHA-256 (imgG/storage.py)"""
+    sha256 = models.CharField(
+        max_length=64,
+        unique=True,
+        verbose_name="SHA-256"
+    )
+    path = models.CharField(
+        max_length=255,
+        verbose_name="Путь относительно MEDIA_ROOT"
+    )
+    content_type = models.CharField(
+        max_length=50,
+        verbose_name="MIME-тип"
+    )
+    size_bytes = models.PositiveIntegerField(
+        verbose_name="Размер, байт"
+    )
+    width = models.PositiveIntegerField(
+        null=True,
+        blank=True,
+        verbose_name="Ширина"
+    )
+    height = models.PositiveIntegerField(
+        null=True,
+        blank=True,
+        verbose_name="Высота"
+    )
+    prompt = models.TextField(
+        blank=True,
+        verbose_name="Промт"
+    )
+    model = models.CharField(
+        max_length=50,
+        blank=True,
+        verbose_name="Модель"
+    )
+    source_url = models.URLField(
+        max_length=2000,
+        blank=True,
+        verbose_name="Исходный URL"
+    )
+    created_at = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name="Дата создания"
+    )
+    last_accessed_at = models.DateTimeField(
+        auto_now_add=True,
+        db_index=True,
+        verbose_name="Последнее обращение"
+    )
+
+    def __str__(self):
+        return self.sha256
+
+
+class ImageJob(BaseJob):
+    """Фоновая генерация открытки (imgG/jobs.py)"""
+    template_type = models.CharField(
+        max_length=200,
+        verbose_name="Шаблон"
+    )
+    text = models.TextField(
+        blank=True,
+        verbose_name="Текст пользователя"
+    )
+    image_data = models.BinaryField(
+        blank=True,
+        default=b'',
+        verbose_name="Фото пользователя",
+        help_text="Очищается после выполнения задачи"
+    )
+    image_format = models.CharField(
+        max_length=20,
+        blank=True,
+        verbose_name="Формат фото"
+    )
+    variants = models.PositiveSmallIntegerField(
+        default=1,
+        verbose_name="Вариантов"
+    )
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'created_at'], name='imagejob_status_created_idx'),
+        ]
@@ -0,0 +1,77 @@
+import logging
+from io import BytesIO
+
+from PIL import Image, ImageOps
+
+
+logger = logging.getLogger(__name__)
+
+# GPT-4o в режиме detail=high вписывает фото в 2048x2048 и сжимает короткую сторону до 768,
+# все, что больше, только увеличивает загрузку
+MAX_LONG_SIDE = 2048
+MAX_SHORT_SIDE = 768
+# Фото не больше 512px целиком помещается в один тайл, хватает detail=low
+LOW_DETAIL_MAX_SIDE = 512
+JPEG_QUALITY = 85
+ORIENTATION_TAG = 0x0112
+
+
+def preprocess_image(data: bytes, image_format: str = None) -> dict:
+    """
+    Готовит фото для vision-запроса: поворот по EXIF, уменьшение до разрешения,
+    которое реально использует модель, и перекодирование в компактный JPEG.
+    Если фото не удалось разобрать, возвращает его без изменений
+    """
+    original_mime = f"image/{image_format or 'jpeg'}"
+    try:
+        image = Image.open(BytesIO(data))
+        rotated = image.getexif().get(ORIENTATION_TAG, 1) != 1
+        image = ImageOps.exif_transpose(image)
+        image = _to_rgb(image)
+
+        width, height = image.size
+        scale = min(1.0, MAX_LONG_SIDE / max(width, height), MAX_SHORT_SIDE / min(width, height))
+        if scale < 1.0:
+            image = image.resize((max(1, round(width * scale)), max(1, round(height * scale))), Image.LANCZOS)
+
+        buffer = BytesIO()
+        image.save(buffer, format='JPEG', quality=JPEG_QUALITY, optimize=True)
+        encoded, mime = buffer.getvalue(), 'image/jpeg'
+
+        # Маленькое и уже сжатое фото могло только вырасти при перекодировании
+        if scale == 1.0 and not rotated and len(encoded) >= len(data):
+            encoded, mime = data, original_mime
+
+    except Exception as e:
+        logger.warning("Не удалось обработать фото, отправляем как есть: %s", e)
+        return {
+            'data': data,
+            'mime': original_mime,
+            'detail': 'auto',
+            'original_bytes': len(data),
+            'bytes': len(data),
+            'saved_bytes': 0,
+        }
+
+    return {
+        'data': encoded,
+        'mime': mime,
+        'detail': 'low' if max(image.size) <= LOW_DETAIL_MAX_SIDE else 'high',
+        'width': image.size[0],
+        'height': image.size[1],
+        'original_bytes': len(data),
+        'bytes': len(encoded),
+        'saved_bytes': len(data) - len(encoded),
+    }
+
+
+def _to_rgb(image):
+    """JPEG не поддерживает прозрачность: кладем фото на белый фон"""
+    if image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info):
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.split()[-1])
+        return background
+    if image.mode != 'RGB':
+        return image.convert('RGB')
+    return image
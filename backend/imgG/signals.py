@@ -0,0 +1,16 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .catalog import template_catalog
+from .models import CardTemplate
+
+
+@receiver(post_save, sender=CardTemplate)
+@receiver(post_delete, sender=CardTemplate)
+def invalidate_template_catalog(sender, **kwargs):
+    """
+    Любое изменение шаблона сбрасывает каталог. Сброс - после коммита: иначе другой воркер
+    успеет перечитать старую строку под новой версией и закэшировать ее
+    """
+    transaction.on_commit(template_catalog.invalidate)
@@ -0,0 +1,173 @@
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from io import BytesIO
+
+from django.apps import apps
+from django.conf import settings
+from django.db import IntegrityError, connection
+from django.utils import timezone
+from PIL import Image
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'location': 'generated',
+    'max_bytes': 5 * 1024 ** 3,
+    'max_age_days': 30,
+    'gc_interval': 60 * 60,
+}
+
+_gc_lock = threading.Lock()
+# monotonic() отсчитывается от произвольной точки (часто от загрузки системы), поэтому не 0
+_last_gc = float('-inf')
+
+
+def storage_options():
+    return {**DEFAULTS, **getattr(settings, 'IMG_STORAGE', {})}
+
+
+def relative_path(digest, content_type):
+    """generated/ab/cd/<sha256>.<ext> - двухуровневое шардирование по хэшу"""
+    extension = content_type.split('/')[-1].replace('jpeg', 'jpg')
+    return os.path.join(storage_options()['location'], digest[:2], digest[2:4], f"{digest}.{extension}")
+
+
+def absolute_path(relative):
+    return os.path.join(settings.MEDIA_ROOT, relative)
+
+
+def _write_atomic(path, data):
+    """Пишет во временный файл и переименовывает, чтобы читатели не видели половину файла"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+
+def _dimensions(data):
+    try:
+        return Image.open(BytesIO(data)).size
+    except Exception:
+        return None, None
+
+
+def store_generated_image(data, content_type, prompt='', model='', source_url=''):
+    """
+    Сохраняет изображение один раз по SHA-256 содержимого.
+    Повторное сохранение тех же байт возвращает существующую запись
+    """
+    GeneratedImage = apps.get_model('imgG', 'GeneratedImage')
+    digest = hashlib.sha256(data).hexdigest()
+
+    existing = GeneratedImage.objects.filter(sha256=digest).first()
+    if existing and os.path.exists(absolute_path(existing.path)):
+        return existing
+
+    relative = relative_path(digest, content_type)
+    _write_atomic(absolute_path(relative), data)
+
+    width, height = _dimensions(data)
+    try:
+        image, _ = GeneratedImage.objects.update_or_create(
+            sha256=digest,
+            defaults={
+                'path': relative,
+                'content_type': content_type,
+                'size_bytes': len(data),
+                'width': width,
+                'height': height,
+                'prompt': prompt or '',
+                'model': model or '',
+                'source_url': source_url or '',
+            }
+        )
+    except IntegrityError:
+        # Тот же файл параллельно сохранил другой запрос
+        image = GeneratedImage.objects.get(sha256=digest)
+
+    schedule_gc()
+    return image
+
+
+def touch(image):
+    """Отмечает обращение к файлу не чаще раза в час, чтобы не писать в БД на каждый просмотр"""
+    now = timezone.now()
+    if image.last_accessed_at < now - timedelta(hours=1):
+        type(image).objects.filter(pk=image.pk).update(last_accessed_at=now)
+
+
+def collect_garbage(max_bytes=None, max_age_days=None):
+    """
+    Удаляет файлы старше max_age_days (по последнему обращению),
+    затем самые давно открывавшиеся, пока общий объем больше max_bytes
+    """
+    GeneratedImage = apps.get_model('imgG', 'GeneratedImage')
+    options = storage_options()
+    max_bytes = options['max_bytes'] if max_bytes is None else max_bytes
+    max_age_days = options['max_age_days'] if max_age_days is None else max_age_days
+
+    doomed = []
+    if max_age_days:
+        cutoff = timezone.now() - timedelta(days=max_age_days)
+        doomed.extend(GeneratedImage.objects.filter(last_accessed_at__lt=cutoff).values_list('pk', 'path', 'size_bytes'))
+
+    doomed_ids = {pk for pk, _, _ in doomed}
+    remaining = GeneratedImage.objects.exclude(pk__in=doomed_ids)
+    total = sum(remaining.values_list('size_bytes', flat=True))
+    if max_bytes and total > max_bytes:
+        for pk, path, size in remaining.order_by('last_accessed_at').values_list('pk', 'path', 'size_bytes').iterator():
+            if total <= max_bytes:
+                break
+            doomed.append((pk, path, size))
+            total -= size
+
+    # Сначала записи, потом файлы: запрос не должен найти запись, файла которой уже нет
+    GeneratedImage.objects.filter(pk__in=[pk for pk, _, _ in doomed]).delete()
+    # Тот же файл могли сохранить заново, пока шла сборка: его не трогаем
+    reused = set(GeneratedImage.objects.filter(path__in=[path for _, path, _ in doomed]).values_list('path', flat=True))
+
+    freed = 0
+    for pk, path, size in doomed:
+        if path in reused:
+            continue
+        try:
+            os.unlink(absolute_path(path))
+        except FileNotFoundError:
+            pass
+        freed += size
+
+    return {'deleted': len(doomed), 'freed_bytes': freed}
+
+
+def schedule_gc():
+    """Запускает сборку мусора в фоновом потоке не чаще gc_interval секунд"""
+    global _last_gc
+    interval = storage_options()['gc_interval']
+    if not interval or time.monotonic() - _last_gc < interval or not _gc_lock.acquire(blocking=False):
+        return
+    _last_gc = time.monotonic()
+
+    def run():
+        try:
+            result = collect_garbage()
+            if result['deleted']:
+                logger.info("GC изображений: удалено %(deleted)s, освобождено %(freed_bytes)s байт", result)
+        except Exception as e:
+            logger.warning("GC изображений не удался: %s", e)
+        finally:
+            connection.close()
+            _gc_lock.release()
+
+    threading.Thread(target=run, name='img-storage-gc', daemon=True).start()
@@ -1,3 +1,243 @@
-from django.test import TestCase
+import os
+import shutil
+import tempfile
+from datetime import timedelta
+from io import BytesIO
+from unittest import mock
 
-# Create your tests here.
+from django.db.models.signals import post_delete
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from PIL import Image
+
+from core.jobs import JobQueue
+from .catalog import TemplateCatalog, template_catalog
+from .descriptions import description_cache, image_digest
+from .models import CardTemplate, GeneratedImage, ImageDescription, ImageJob
+from .preprocess import ORIENTATION_TAG, preprocess_image
+from .storage import absolute_path, collect_garbage, store_generated_image
+
+
+def make_image(size, image_format='JPEG', mode='RGB', orientation=None, noise=False):
+    """Фото заданного размера в байтах; noise - плохо сжимаемое содержимое"""
+    image = Image.effect_noise(size, 100).convert(mode) if noise else Image.new(mode, size, 'red')
+    buffer = BytesIO()
+    if orientation:
+        exif = Image.Exif()
+        exif[ORIENTATION_TAG] = orientation
+        image.save(buffer, format=image_format, exif=exif)
+    else:
+        image.save(buffer, format=image_format)
+    return buffer.getvalue()
+
+
+class TemplateCatalogTests(TestCase):
+    def setUp(self):
+        template_catalog.invalidate()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.template = CardTemplate.objects.create(title='Юбилей', prompt='золото')
+
+    def test_warm_lookup_makes_no_queries(self):
+        self.assertEqual(template_catalog.get('Юбилей'), {'prompt': 'золото', 'title': 'Юбилей'})
+        with self.assertNumQueries(0):
+            self.assertEqual(template_catalog.get('Юбилей')['prompt'], 'золото')
+            self.assertIsNone(template_catalog.get('Нет такого'))
+
+    def test_save_reloads_after_commit(self):
+        template_catalog.get('Юбилей')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.template.prompt = 'серебро'
+            self.template.save()
+            # До коммита каталог не сбрасывается
+            self.assertEqual(template_catalog.get('Юбилей')['prompt'], 'золото')
+        self.assertEqual(template_catalog.get('Юбилей')['prompt'], 'серебро')
+
+    def test_deactivate_and_delete(self):
+        other_worker = TemplateCatalog()
+        other_worker.get('Юбилей')
+        with self.captureOnCommitCallbacks(execute=True):
+            CardTemplate.objects.create(title='Свадьба', prompt='кольца', is_active=False)
+        self.assertIsNone(other_worker.get('Свадьба'))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.template.delete()
+        # Сброс виден и другим процессам через версию в общем кэше
+        self.assertIsNone(other_worker.get('Юбилей'))
+        self.assertIsNone(template_catalog.get('Юбилей'))
+
+
+@override_settings(IMG_DESCRIPTION_CACHE={'max_entries': 2})
+class DescriptionCacheTests(TestCase):
+    def test_get_counts_hits(self):
+        description_cache.set(image_digest(b'a'), 'v1', 'кот на диване')
+        self.assertEqual(description_cache.get(image_digest(b'a'), 'v1'), 'кот на диване')
+        self.assertIsNone(description_cache.get(image_digest(b'a'), 'v2'))
+        self.assertIsNone(description_cache.get(image_digest(b'b'), 'v1'))
+        self.assertEqual(ImageDescription.objects.get().hits, 1)
+
+    def test_set_twice_keeps_first(self):
+        description_cache.set('a', 'v1', 'первое')
+        description_cache.set('a', 'v1', 'второе')
+        self.assertEqual(description_cache.get('a', 'v1'), 'первое')
+
+    def test_evicts_least_recently_used(self):
+        description_cache.set('a', 'v1', 'a')
+        description_cache.set('b', 'v1', 'b')
+        hour_ago = timezone.now() - timedelta(hours=1)
+        ImageDescription.objects.filter(digest='a').update(last_used_at=hour_ago - timedelta(minutes=1))
+        ImageDescription.objects.filter(digest='b').update(last_used_at=hour_ago)
+        # a записана раньше, но прочитана позже b: вытесняется b
+        description_cache.get('a', 'v1')
+        description_cache.set('c', 'v1', 'c')
+        self.assertEqual(sorted(ImageDescription.objects.values_list('digest', flat=True)), ['a', 'c'])
+
+
+class PreprocessTests(SimpleTestCase):
+    def test_downscale_to_vision_limits(self):
+        result = preprocess_image(make_image((2000, 1500), noise=True))
+        # Короткая сторона - не больше 768, длинная - не больше 2048
+        self.assertEqual((result['width'], result['height']), (1024, 768))
+        self.assertEqual(result['detail'], 'high')
+        self.assertEqual(result['mime'], 'image/jpeg')
+        self.assertGreater(result['saved_bytes'], 0)
+        self.assertEqual(result['saved_bytes'], result['original_bytes'] - result['bytes'])
+        self.assertEqual(Image.open(BytesIO(result['data'])).size, (1024, 768))
+
+    def test_long_side_limit(self):
+        result = preprocess_image(make_image((5000, 1000)))
+        self.assertEqual((result['width'], result['height']), (2048, 410))
+
+    def test_exif_transpose(self):
+        # Orientation 6: фото снято повернутым на 90 градусов
+        result = preprocess_image(make_image((300, 100), orientation=6))
+        self.assertEqual((result['width'], result['height']), (100, 300))
+        self.assertEqual(result['mime'], 'image/jpeg')
+
+    def test_detail(self):
+        self.assertEqual(preprocess_image(make_image((512, 300)))['detail'], 'low')
+        self.assertEqual(preprocess_image(make_image((513, 300)))['detail'], 'high')
+
+    def test_small_compressed_photo_is_sent_as_is(self):
+        data = make_image((64, 64), 'PNG')
+        result = preprocess_image(data, 'png')
+        self.assertEqual((result['data'], result['mime'], result['saved_bytes']), (data, 'image/png', 0))
+
+    def test_transparent_png_becomes_jpeg(self):
+        result = preprocess_image(make_image((300, 300), 'PNG', mode='RGBA', noise=True), 'png')
+        self.assertEqual(result['mime'], 'image/jpeg')
+        self.assertEqual(Image.open(BytesIO(result['data'])).mode, 'RGB')
+
+    def test_broken_data_is_sent_as_is(self):
+        with self.assertLogs('imgG.preprocess', 'WARNING'):
+            result = preprocess_image(b'not an image', 'png')
+        self.assertEqual((result['data'], result['detail'], result['saved_bytes']), (b'not an image', 'auto', 0))
+
+
+@override_settings(IMG_STORAGE={'gc_interval': 0})
+class StorageTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        override = override_settings(MEDIA_ROOT=media_root)
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def store(self, data, days_ago=0):
+        image = store_generated_image(data, 'image/png')
+        GeneratedImage.objects.filter(pk=image.pk).update(last_accessed_at=timezone.now() - timedelta(days=days_ago))
+        return image
+
+    def exists(self, image):
+        return os.path.exists(absolute_path(image.path))
+
+    def test_same_bytes_stored_once(self):
+        first = store_generated_image(b'png', 'image/png', prompt='кот')
+        second = store_generated_image(b'png', 'image/png', prompt='кот еще раз')
+        self.assertEqual(first.pk, second.pk)
+        self.assertEqual(GeneratedImage.objects.count(), 1)
+        with open(absolute_path(first.path), 'rb') as f:
+            self.assertEqual(f.read(), b'png')
+
+    def test_missing_file_is_written_again(self):
+        image = store_generated_image(b'png', 'image/png')
+        os.unlink(absolute_path(image.path))
+        self.assertEqual(store_generated_image(b'png', 'image/png').pk, image.pk)
+        self.assertTrue(self.exists(image))
+
+    def test_gc_by_age(self):
+        old, fresh = self.store(b'old', days_ago=40), self.store(b'fresh', days_ago=1)
+        self.assertEqual(collect_garbage(max_bytes=0, max_age_days=30), {'deleted': 1, 'freed_bytes': 3})
+        self.assertEqual(list(GeneratedImage.objects.values_list('pk', flat=True)), [fresh.pk])
+        self.assertFalse(self.exists(old))
+        self.assertTrue(self.exists(fresh))
+
+    def test_gc_by_size_removes_least_recently_accessed(self):
+        images = [self.store(b'%d' % index * 10, days_ago=days) for index, days in enumerate((3, 1, 2))]
+        self.assertEqual(collect_garbage(max_bytes=25, max_age_days=0), {'deleted': 1, 'freed_bytes': 10})
+        self.assertEqual([self.exists(image) for image in images], [False, True, True])
+
+    def test_gc_keeps_file_stored_again_during_collection(self):
+        image = self.store(b'old', days_ago=40)
+
+        def store_again(sender, instance, **kwargs):
+            # Тот же файл сохраняют заново, пока сборка удаляет его запись
+            store_generated_image(b'old', 'image/png')
+
+        post_delete.connect(store_again, sender=GeneratedImage, dispatch_uid='store_again')
+        self.addCleanup(post_delete.disconnect, sender=GeneratedImage, dispatch_uid='store_again')
+        collect_garbage(max_bytes=0, max_age_days=30)
+        self.assertTrue(self.exists(image))
+        self.assertEqual(GeneratedImage.objects.get().path, image.path)
+
+
+@mock.patch('history.signals.history_writer')
+@mock.patch('core.jobs.connection')
+class JobQueueTests(TestCase):
+    def make_queue(self, handler):
+        queue = JobQueue(ImageJob, handler, name='test')
+        queue._executor = mock.Mock()
+        return queue
+
+    def test_run_claims_pending_job_once(self, connection, history_writer):
+        handler = mock.Mock(return_value={'success': True, 'image_url': 'https://img'})
+        queue = self.make_queue(handler)
+        job = ImageJob.objects.create(template_type='Юбилей')
+        queue._run(job.pk)
+        queue._run(job.pk)
+        handler.assert_called_once()
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.result['image_url']), (ImageJob.SUCCEEDED, 'https://img'))
+        self.assertIsNotNone(job.started_at)
+        self.assertIsNotNone(job.finished_at)
+        history_writer.update_job.assert_called_once()
+
+    def test_failure_and_exception(self, connection, history_writer):
+        failed = ImageJob.objects.create(template_type='Юбилей')
+        self.make_queue(lambda job: {'success': False, 'error': 'nsfw'})._run(failed.pk)
+        crashed = ImageJob.objects.create(template_type='Юбилей')
+        with self.assertLogs('core.jobs', 'ERROR'):
+            self.make_queue(mock.Mock(side_effect=RuntimeError('boom')))._run(crashed.pk)
+        self.assertEqual(ImageJob.objects.get(pk=failed.pk).error, 'nsfw')
+        crashed.refresh_from_db()
+        self.assertEqual((crashed.status, crashed.error), (ImageJob.FAILED, 'boom'))
+
+    def test_recover_requeues_stale_and_pending_jobs(self, connection, history_writer):
+        stale = ImageJob.objects.create(
+            template_type='Юбилей', status=ImageJob.RUNNING, started_at=timezone.now() - timedelta(hours=1)
+        )
+        running = ImageJob.objects.create(template_type='Юбилей', status=ImageJob.RUNNING, started_at=timezone.now())
+        pending = ImageJob.objects.create(template_type='Юбилей')
+        queue = self.make_queue(mock.Mock())
+        queue.recover()
+        self.assertEqual(ImageJob.objects.get(pk=stale.pk).status, ImageJob.PENDING)
+        self.assertEqual(ImageJob.objects.get(pk=running.pk).status, ImageJob.RUNNING)
+        submitted = {call.args[1] for call in queue._executor.submit.call_args_list}
+        self.assertEqual(submitted, {stale.pk, pending.pk})
+
+    def test_events_until_finished(self, connection, history_writer):
+        queue = self.make_queue(lambda job: {'success': True})
+        job = ImageJob.objects.create(template_type='Юбилей')
+        events = queue.events(job.pk)
+        self.assertEqual(next(events).status, ImageJob.PENDING)
+        queue._run(job.pk)
+        self.assertEqual(next(events).status, ImageJob.SUCCEEDED)
+        self.assertEqual(list(events), [])
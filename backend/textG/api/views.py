@@ -1,18 +1,28 @@
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
+from rest_framework.settings import api_settings
 from django.utils.decorators import method_decorator
 from django.views.decorators.csrf import csrf_exempt
 import json
 from django.conf import settings
+from core.streaming import EventStreamRenderer, format_event, ndjson_response, sse_response
+from history.models import Generation
+from history.writer import history_writer
+from users.throttling import RefundRejectedGenerationMixin, TextBatchThrottle, TextGenerationThrottle
+from ..batch import batch_options, build_items, item_message, run_batch
+from ..cache import get_response_cache
 from ..gpt import GPTClient
+import time
 import uuid
 
 
-class ChatViewSet(viewsets.ViewSet):
+class ChatViewSet(RefundRejectedGenerationMixin, viewsets.ViewSet):
     """
     ViewSet для обработки чата с GPT
     """
+    renderer_classes = [*api_settings.DEFAULT_RENDERER_CLASSES, EventStreamRenderer]
+    
     def __init__(self, *args, **kwargs):
         api_key = settings.API_KEY
         super().__init__(*args, **kwargs)
@@ -20,11 +30,12 @@ class ChatViewSet(viewsets.ViewSet):
             api_key=api_key
         )
     
-    @action(detail=False, methods=['post'], url_path='generate')
+    @action(detail=False, methods=['post'], url_path='generate', throttle_classes=[TextGenerationThrottle])
     def generate(self, request):
         """
         Основная функция генерации поздравления или сценария
         """
+        started = time.perf_counter()
         try:
             message = request.data.get('message')
             session_id = request.data.get('session_id', str(uuid.uuid4()))
@@ -35,16 +46,37 @@ class ChatViewSet(viewsets.ViewSet):
                     status=status.HTTP_400_BAD_REQUEST
                 )
             
-            response_text = self.gpt_client.send_message(
+            use_cache = self._flag(request, 'cache')
+            refresh = self._flag(request, 'refresh')
+            
+            if self._wants_stream(request):
+                return self._stream_response(
+                    self.gpt_client.stream_message(
+                        message=message,
+                        session_id=session_id,
+                        use_cache=use_cache,
+                        refresh=refresh
+                    ),
+                    message,
+                    session_id,
+                    'Ошибка при генерации',
+                    started
+                )
+            
+            response_text, cached = self.gpt_client.send_message(
                 message=message,
-                session_id=session_id
+                session_id=session_id,
+                use_cache=use_cache,
+                refresh=refresh
             )
             
+            self._record(message, response_text, session_id, started, cached=cached)
             return Response({
                 'success': True,
                 'response': response_text,
                 'user_message': message,
-                'session_id': session_id
+                'session_id': session_id,
+                'cached': cached
             })
         
         except Exception as e:
@@ -53,11 +85,12 @@ class ChatViewSet(viewsets.ViewSet):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
     
-    @action(detail=False, methods=['post'], url_path='regenerate')
+    @action(detail=False, methods=['post'], url_path='regenerate', throttle_classes=[TextGenerationThrottle])
     def regenerate(self, request):
         """
         Функция для переделки текста
         """
+        started = time.perf_counter()
         try:
             message = request.data.get('message')
             session_id = request.data.get('session_id', str(uuid.uuid4()))
@@ -68,11 +101,21 @@ class ChatViewSet(viewsets.ViewSet):
                     status=status.HTTP_400_BAD_REQUEST
                 )
             
+            if self._wants_stream(request):
+                return self._stream_response(
+                    self.gpt_client.stream_regenerate(message=message, session_id=session_id),
+                    message,
+                    session_id,
+                    'Ошибка при переделке',
+                    started
+                )
+            
             response_text = self.gpt_client.regenerate_text(
                 message=message,
                 session_id=session_id
             )
             
+            self._record(message, response_text, session_id, started)
             return Response({
                 'success': True,
                 'response': response_text,
@@ -86,13 +129,57 @@ class ChatViewSet(viewsets.ViewSet):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
     
+    @action(detail=False, methods=['post'], url_path='batch', throttle_classes=[TextBatchThrottle])
+    def batch(self, request):
+        """
+        Пакетная генерация поздравлений (например, для списка сотрудников).
+        Результаты отдаются в NDJSON по мере готовности, каждый элемент - отдельная запись истории
+        """
+        started = time.perf_counter()
+        try:
+            items = build_items(request.data)
+            options = batch_options()
+            
+            if not items or any(not item['message'] for item in items):
+                return Response(
+                    {'error': 'Список сообщений не может быть пустым'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            
+            if len(items) > options['max_items']:
+                return Response(
+                    {'error': f"Слишком много элементов: максимум {options['max_items']}"},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            
+            concurrency = min(int(request.data.get('concurrency', options['concurrency'])), options['concurrency'])
+            
+            return ndjson_response(self._record_batch(run_batch(
+                self.gpt_client,
+                items,
+                concurrency=concurrency,
+                use_cache=self._flag(request, 'cache')
+            ), items, started))
+        
+        except (TypeError, ValueError) as e:
+            return Response(
+                {'error': f'Некорректный запрос: {str(e)}'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+    
     @action(detail=False, methods=['post'], url_path='clear-history')
     def clear_history(self, request):
         """
-        Очистка истории сообщений
+        Очистка истории сессии session_id; без него - всех сессий (только персонал)
         """
         try:
             session_id = request.data.get('session_id')
+            # Без session_id очищаются диалоги всех пользователей: это доступно только персоналу
+            if not session_id and not (request.user and request.user.is_staff):
+                return Response(
+                    {'error': 'Укажите session_id'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
             self.gpt_client.clear_history(session_id)
             
             return Response({
@@ -105,4 +192,63 @@ class ChatViewSet(viewsets.ViewSet):
             return Response(
                 {'error': f'Ошибка при очистке истории: {str(e)}'},
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
-            )
\ No newline at end of file
+            )
+    
+    @action(detail=False, methods=['get'], url_path='cache-stats')
+    def cache_stats(self, request):
+        """
+        Статистика кэша ответов текущего процесса
+        """
+        return Response(get_response_cache().stats())
+    
+    def _flag(self, request, name):
+        return str(request.data.get(name, '')).lower() in ('1', 'true', 'yes')
+    
+    def _wants_stream(self, request):
+        """Потоковый режим: флаг stream в теле или Accept: text/event-stream"""
+        if request.accepted_renderer.format == EventStreamRenderer.format:
+            return True
+        return self._flag(request, 'stream')
+    
+    def _record(self, message, response_text, session_id, started, cached=False):
+        """Запись в историю пользователя (в фоне, запрос ее не ждет)"""
+        history_writer.record(
+            self.request.user,
+            Generation.TEXT,
+            prompt=message,
+            result={'response': response_text, 'session_id': session_id, 'cached': cached},
+            duration_ms=(time.perf_counter() - started) * 1000
+        )
+    
+    def _record_batch(self, rows, items, started):
+        """Пробрасывает строки пакета, записывая в историю каждое готовое поздравление"""
+        for row in rows:
+            if row.get('success'):
+                self._record(item_message(items[row['index']]), row['response'], row['session_id'], started,
+                             cached=row['cached'])
+            yield row
+    
+    def _stream_response(self, chunks, message, session_id, error_prefix, started):
+        """
+        Отдает ответ GPT как Server-Sent Events:
+        start -> множество событий с delta -> done (или error)
+        """
+        def events():
+            yield format_event({'session_id': session_id, 'user_message': message}, event='start')
+            parts = []
+            try:
+                for delta in chunks:
+                    parts.append(delta)
+                    yield format_event({'delta': delta})
+            except Exception as e:
+                yield format_event({'error': f'{error_prefix}: {str(e)}'}, event='error')
+                return
+            self._record(message, ''.join(parts), session_id, started)
+            yield format_event({
+                'success': True,
+                'response': ''.join(parts),
+                'user_message': message,
+                'session_id': session_id
+            }, event='done')
+        
+        return sse_response(events())
@@ -0,0 +1,96 @@
+import uuid
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from django.conf import settings
+
+
+DEFAULTS = {
+    'concurrency': 8,
+    'max_items': 500,
+}
+
+
+def batch_options():
+    return {**DEFAULTS, **getattr(settings, 'TEXTG_BATCH', {})}
+
+
+def build_items(data):
+    """
+    Разбирает тело запроса в список заданий.
+    Поддерживается items: [строка | {message, recipient}] или message + recipients.
+    Неверные типы - ValueError (400 во view)
+    """
+    items = []
+    if data.get('items'):
+        if not isinstance(data['items'], list):
+            raise ValueError('items должен быть списком')
+        for raw in data['items']:
+            if isinstance(raw, str):
+                items.append({'message': raw, 'recipient': None})
+            elif isinstance(raw, dict):
+                items.append({'message': raw.get('message', ''), 'recipient': raw.get('recipient')})
+            else:
+                raise ValueError('элемент items должен быть строкой или объектом {message, recipient}')
+    elif data.get('recipients'):
+        if not isinstance(data['recipients'], list):
+            raise ValueError('recipients должен быть списком')
+        template = data.get('message', '')
+        for recipient in data['recipients']:
+            items.append({'message': template, 'recipient': recipient})
+
+    for item in items:
+        if not isinstance(item['message'], str):
+            raise ValueError('message должен быть строкой')
+        if item['recipient'] is not None and not isinstance(item['recipient'], str):
+            raise ValueError('recipient должен быть строкой')
+    return items
+
+
+def item_message(item):
+    if item['recipient']:
+        return f"{item['message']}\nПолучатель поздравления: {item['recipient']}"
+    return item['message']
+
+
+def run_batch(gpt_client, items, concurrency, use_cache=False):
+    """
+    Генерирует поздравления параллельно, не больше concurrency запросов к GPT.
+    Отдает результаты по мере готовности, ошибка одного элемента не прерывает пакет
+    """
+    batch_id = uuid.uuid4().hex
+
+    def generate(index, item):
+        session_id = f"{batch_id}-{index}"
+        message = item_message(item)
+        response_text, cached = gpt_client.send_message(message=message, session_id=session_id, use_cache=use_cache)
+        return {'response': response_text, 'session_id': session_id, 'cached': cached}
+
+    executor = ThreadPoolExecutor(max_workers=max(1, min(concurrency, len(items))))
+    succeeded = 0
+    futures = {}
+    try:
+        futures = {executor.submit(generate, index, item): (index, item) for index, item in enumerate(items)}
+        for future in as_completed(futures):
+            index, item = futures[future]
+            row = {'index': index, 'recipient': item['recipient']}
+            try:
+                row.update(future.result())
+                row['success'] = True
+                succeeded += 1
+            except Exception as e:
+                row.update({'success': False, 'error': f'Ошибка при генерации: {str(e)}'})
+            yield row
+    finally:
+        # Клиент мог оборвать соединение: не тратим запросы на невыполненные элементы
+        # (cancel_futures у shutdown появился только в Python 3.9)
+        for future in futures:
+            future.cancel()
+        executor.shutdown(wait=False)
+
+    yield {
+        'done': True,
+        'batch_id': batch_id,
+        'total': len(items),
+        'succeeded': succeeded,
+        'failed': len(items) - succeeded,
+    }
@@ -0,0 +1,54 @@
+import hashlib
+import json
+import re
+from functools import lru_cache
+
+from django.conf import settings
+
+from core.lru import LRUCache
+
+
+_PUNCTUATION_EDGES = ' .,!?;:…"\'«»'
+
+
+def normalize_message(message: str) -> str:
+    """Приводит запрос к каноничному виду: регистр, ё/е, пробелы, знаки по краям"""
+    text = message.casefold().replace('ё', 'е')
+    text = re.sub(r'\s+', ' ', text)
+    return text.strip(_PUNCTUATION_EDGES)
+
+
+class ResponseCache:
+    """
+    Кэш готовых ответов для первых сообщений без истории.
+    Ключ - нормализованный запрос, системный промт, модель и температура
+    """
+
+    def __init__(self, max_size: int = 1000, ttl: int = 6 * 60 * 60):
+        self._cache = LRUCache(max_size=max_size, ttl=ttl, sliding=False)
+
+    @staticmethod
+    def make_key(message, system_prompt, model, temperature) -> str:
+        payload = json.dumps(
+            [normalize_message(message), system_prompt, model, temperature],
+            ensure_ascii=False
+        )
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        return self._cache.get(key)
+
+    def set(self, key, response_text):
+        self._cache.set(key, response_text)
+
+    def clear(self):
+        self._cache.clear()
+
+    def stats(self):
+        return self._cache.stats()
+
+
+@lru_cache(maxsize=None)
+def get_response_cache() -> ResponseCache:
+    """Кэш ответов процесса, настройки в TEXTG_RESPONSE_CACHE"""
+    return ResponseCache(**getattr(settings, 'TEXTG_RESPONSE_CACHE', {}))
@@ -0,0 +1,138 @@
+import logging
+from functools import lru_cache
+from typing import Callable, List
+
+from django.conf import settings
+
+try:
+    import tiktoken
+except ImportError:  # pragma: no cover - tiktoken необязателен
+    tiktoken = None
+
+
+logger = logging.getLogger(__name__)
+
+# Служебные токены, которые API добавляет к каждому сообщению
+MESSAGE_OVERHEAD = 4
+SUMMARY_PREFIX = "Краткое содержание предыдущей части диалога:\n"
+
+DEFAULT_BUDGETS = {
+    'generate': 1500,
+    'regenerate': 3000,
+}
+
+
+@lru_cache(maxsize=8)
+def _encoding(model):
+    if tiktoken is None:
+        return None
+    try:
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            return tiktoken.get_encoding('cl100k_base')
+    except Exception as e:
+        # Словарь BPE скачивается при первом обращении, без сети считаем приблизительно
+        logger.warning("tiktoken недоступен, используется оценка: %s", e)
+        return None
+
+
+def count_tokens(text: str, model: str = "gpt-3.5-turbo") -> int:
+    """Считает токены локально (tiktoken или оценка ~4 байта UTF-8 на токен)"""
+    encoding = _encoding(model)
+    if encoding is not None:
+        return len(encoding.encode(text))
+    return len(text.encode('utf-8')) // 4 + 1
+
+
+def count_message_tokens(messages: List[dict], model: str = "gpt-3.5-turbo") -> int:
+    return sum(count_tokens(m['content'], model) + MESSAGE_OVERHEAD for m in messages)
+
+
+def is_summary(message: dict) -> bool:
+    return message['role'] == 'system' and message['content'].startswith(SUMMARY_PREFIX)
+
+
+def make_summary(text: str) -> dict:
+    return {"role": "system", "content": SUMMARY_PREFIX + text}
+
+
+def split_summary(history: List[dict]):
+    """Отделяет сводку (первое system-сообщение) от реплик"""
+    if history and is_summary(history[0]):
+        return history[0]['content'][len(SUMMARY_PREFIX):], history[1:]
+    return "", history
+
+
+def get_budget(endpoint: str) -> int:
+    """Бюджет токенов истории для эндпоинта из TEXTG_CONTEXT_BUDGETS"""
+    budgets = {**DEFAULT_BUDGETS, **getattr(settings, 'TEXTG_CONTEXT_BUDGETS', {})}
+    return budgets[endpoint]
+
+
+class ContextBudget:
+    """
+    Укладывает историю диалога в бюджет токенов.
+    Новые реплики идут дословно, старые сворачиваются в сводку
+    """
+
+    def __init__(self, max_tokens: int, model: str = "gpt-3.5-turbo", keep_ratio: float = 0.5):
+        self.max_tokens = max_tokens
+        self.model = model
+        self.keep_ratio = keep_ratio
+
+    def fit(self, history: List[dict]) -> List[dict]:
+        """
+        Жесткая обрезка при сборке запроса: сводка и самые новые реплики,
+        которые помещаются в бюджет
+        """
+        summary, turns = split_summary(history)
+        used = count_tokens(summary, self.model) + MESSAGE_OVERHEAD if summary else 0
+        kept = self._take_newest(turns, self.max_tokens - used)
+        return ([make_summary(summary)] if summary else []) + kept
+
+    def over_budget(self, history: List[dict]) -> bool:
+        return count_message_tokens(history, self.model) > self.max_tokens
+
+    def compact(self, history: List[dict], summarize: Callable[[str, List[dict]], str]) -> List[dict]:
+        """
+        Если история превысила бюджет, старые реплики сворачиваются в сводку.
+        summarize(старая_сводка, реплики) возвращает новую сводку.
+        Если сворачивать нечего или сводка не удалась, возвращается сама history:
+        сохранять нечего, старые реплики не теряются, и следующая запись попробует снова
+        """
+        if not self.over_budget(history):
+            return history
+
+        summary, turns = split_summary(history)
+        kept = self._take_newest(turns, int(self.max_tokens * self.keep_ratio))
+        folded = turns[:len(turns) - len(kept)]
+        if not folded:
+            return history
+
+        try:
+            summary = summarize(summary, folded)
+        except Exception as e:
+            logger.warning("Не удалось обновить сводку диалога: %s", e)
+            return history
+
+        return self.fit([make_summary(summary)] + kept)
+
+    def _take_newest(self, turns, budget):
+        """
+        Самые новые реплики в пределах бюджета, целыми парами вопрос-ответ.
+        Последняя пара остается всегда: regenerate правит именно ее
+        """
+        kept = []
+        used = 0
+        end = len(turns)
+        while end > 0:
+            start = max(end - 2, 0)
+            pair = turns[start:end]
+            cost = count_message_tokens(pair, self.model)
+            if kept and used + cost > budget:
+                break
+            kept[:0] = pair
+            used += cost
+            end = start
+        return kept
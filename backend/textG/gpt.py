@@ -1,49 +1,78 @@
-from openai import OpenAI
-from typing import Dict, Optional
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterator, Optional, Tuple
 from django.conf import settings
+from core.clients import get_openai_client
+from core.metrics import generations_in_progress, stage_seconds, upstream_call
+from .cache import get_response_cache
+from .context import ContextBudget, get_budget
+from .sessions import BaseSessionStore, get_session_store
+
+
+GREETING_SYSTEM_PROMPT = """Ты специалист по созданию поздравлений и сценариев для видео-поздравлений.
+        Пользователь будет просить тебя генерировать текст поздравлений или идеи для видео.
+        Отвечай креативно и учитывай контекст предыдущих сообщений в диалоге."""
+
+EDIT_SYSTEM_PROMPT = """Ты помощник для редактирования текстов.
+        Пользователь будет отправлять тебе текст и инструкции, как его изменить.
+        Твоя задача - переработать текст согласно инструкциям, сохраняя основную идею."""
+
+SUMMARY_SYSTEM_PROMPT = """Ты ведешь краткий конспект диалога о поздравлениях.
+        Объедини предыдущий конспект и новые реплики в один короткий конспект.
+        Сохрани имена, факты о получателях, пожелания пользователя и принятые правки текста."""
+
+logger = logging.getLogger(__name__)
+
+# Сводка истории - отдельный запрос к GPT: делаем его в фоне, чтобы не задерживать ответ пользователю
+compaction_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='textg-compact')
+_compacting = set()
+_compacting_lock = threading.Lock()
 
 
 class GPTClient:
-    def __init__(self, api_key: str, model: str = "gpt-3.5-turbo"):
-        api_key = "sk-proj-" + api_key[:3:-1] if api_key.startswith('gpt:') else api_key
-        self.client = OpenAI(api_key=api_key)
+    def __init__(self,
+                 api_key: Optional[str] = None,
+                 model: str = "gpt-3.5-turbo",
+                 store: Optional[BaseSessionStore] = None,
+                 temperature: float = 0.7):
+        self.client = get_openai_client(api_key)
         self.model = model
-        self.conversation_history = {}
+        self.temperature = temperature
+        self.store = store or get_session_store()
     
+    @generations_in_progress.track_inprogress(component='text')
+    @stage_seconds.time(component='text', stage='total')
     def send_message(self,
                      message: str,
-                     session_id: str = "default") -> str:
+                     session_id: str = "default",
+                     use_cache: bool = False,
+                     refresh: bool = False) -> Tuple[str, bool]:
         """
-        Базовая функция для отправки сообщения
+        Базовая функция для отправки сообщения.
+        use_cache включает кэш ответов для первого сообщения сессии,
+        refresh=True запрашивает свежий ответ и обновляет кэш.
+        Возвращает (текст, взят_ли_из_кэша)
         """
-        if session_id not in self.conversation_history:
-            self.conversation_history[session_id] = []
-        
-        system_prompt = """Ты специалист по созданию поздравлений и сценариев для видео-поздравлений.
-        Пользователь будет просить тебя генерировать текст поздравлений или идеи для видео.
-        Отвечай креативно и учитывай контекст предыдущих сообщений в диалоге."""
-        
-        messages = [{"role": "system", "content": system_prompt}]
-        
-        messages.extend(self.conversation_history[session_id])
-        
-        messages.append({"role": "user", "content": message})
+        messages = self._build_messages(GREETING_SYSTEM_PROMPT, message, session_id, 'generate')
+        key = self._cache_key(messages, message) if use_cache else None
         
-        response = self.client.chat.completions.create(
-            model=self.model,
-            messages=messages,
-            temperature=0.7
-        )
-        response_text = response.choices[0].message.content
+        if key and not refresh:
+            cached = get_response_cache().get(key)
+            if cached is not None:
+                self._commit(session_id, message, cached, 'generate')
+                return cached, True
         
-        self.conversation_history[session_id].append({"role": "user", "content": message})
-        self.conversation_history[session_id].append({"role": "assistant", "content": response_text})
+        response_text = self._complete(messages)
         
-        if len(self.conversation_history[session_id]) > 10:
-            self.conversation_history[session_id] = self.conversation_history[session_id][-10:]
+        self._commit(session_id, message, response_text, 'generate')
+        if key:
+            get_response_cache().set(key, response_text)
         
-        return response_text
+        return response_text, False
     
+    @generations_in_progress.track_inprogress(component='text')
+    @stage_seconds.time(component='text', stage='total')
     def regenerate_text(self,
                         message: str,
                         session_id: str = "default") -> str:
@@ -51,35 +80,166 @@ class GPTClient:
         Функция для переделки текста с учетом контекста
         message должен содержать и текст, и инструкции
         """
-        if session_id not in self.conversation_history:
-            self.conversation_history[session_id] = []
+        messages = self._build_messages(EDIT_SYSTEM_PROMPT, message, session_id, 'regenerate')
         
-        system_prompt = """Ты помощник для редактирования текстов.
-        Пользователь будет отправлять тебе текст и инструкции, как его изменить.
-        Твоя задача - переработать текст согласно инструкциям, сохраняя основную идею."""
+        response_text = self._complete(messages)
         
-        messages = [{"role": "system", "content": system_prompt}]
+        self._commit(session_id, message, response_text, 'regenerate')
         
-        messages.extend(self.conversation_history[session_id])
+        return response_text
+    
+    def stream_message(self,
+                       message: str,
+                       session_id: str = "default",
+                       use_cache: bool = False,
+                       refresh: bool = False) -> Iterator[str]:
+        """
+        Потоковая версия send_message: отдает текст частями по мере генерации.
+        При попадании в кэш ответ отдается одним куском
+        """
+        messages = self._build_messages(GREETING_SYSTEM_PROMPT, message, session_id, 'generate')
+        key = self._cache_key(messages, message) if use_cache else None
         
-        messages.append({"role": "user", "content": message})
+        if key and not refresh:
+            cached = get_response_cache().get(key)
+            if cached is not None:
+                return self._measured(self._replay(cached, message, session_id, 'generate'))
         
-        response = self.client.chat.completions.create(
-            model=self.model,
-            messages=messages,
-            temperature=0.7
-        )
-        response_text = response.choices[0].message.content
+        return self._measured(self._stream(messages, message, session_id, 'generate', cache_key=key))
+    
+    def stream_regenerate(self,
+                          message: str,
+                          session_id: str = "default") -> Iterator[str]:
+        """
+        Потоковая версия regenerate_text
+        """
+        messages = self._build_messages(EDIT_SYSTEM_PROMPT, message, session_id, 'regenerate')
+        return self._measured(self._stream(messages, message, session_id, 'regenerate'))
+    
+    @stage_seconds.time(component='text', stage='completion')
+    def _complete(self, messages):
+        with upstream_call('openai', 'chat'):
+            response = self.client.chat.completions.create(
+                model=self.model,
+                messages=messages,
+                temperature=self.temperature
+            )
+        return response.choices[0].message.content
+    
+    def _cache_key(self, messages, message):
+        """Ключ кэша ответов; None, если в сессии уже есть история"""
+        if len(messages) > 2:
+            return None
+        return get_response_cache().make_key(message, messages[0]['content'], self.model, self.temperature)
+    
+    def _measured(self, chunks):
+        """Метрики потокового ответа: генерация идет, пока поток не дочитан или не закрыт"""
+        with generations_in_progress.track_inprogress(component='text'):
+            with stage_seconds.time(component='text', stage='total'):
+                yield from chunks
+    
+    def _replay(self, response_text, message, session_id, endpoint):
+        yield response_text
+        self._commit(session_id, message, response_text, endpoint)
+    
+    def _stream(self, messages, message, session_id, endpoint, cache_key=None):
+        """
+        Пробрасывает токены из upstream-потока.
+        История сохраняется только если поток дочитан до конца
+        """
+        # Замер до начала ответа; сам поток читается уже после
+        with upstream_call('openai', 'chat_stream'):
+            stream = self.client.chat.completions.create(
+                model=self.model,
+                messages=messages,
+                temperature=self.temperature,
+                stream=True
+            )
+        parts = []
+        try:
+            for chunk in stream:
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    parts.append(delta)
+                    yield delta
+        finally:
+            stream.close()
         
-        self.conversation_history[session_id].append({"role": "user", "content": message})
-        self.conversation_history[session_id].append({"role": "assistant", "content": response_text})
+        response_text = ''.join(parts)
+        self._commit(session_id, message, response_text, endpoint)
+        if cache_key:
+            get_response_cache().set(cache_key, response_text)
+    
+    @stage_seconds.time(component='text', stage='context')
+    def _build_messages(self, system_prompt, message, session_id, endpoint):
+        """Собирает список сообщений для запроса с учетом истории и бюджета токенов"""
+        messages = [{"role": "system", "content": system_prompt}]
+        messages.extend(self._budget(endpoint).fit(self.store.load(session_id)))
+        messages.append({"role": "user", "content": message})
+        return messages
+    
+    @stage_seconds.time(component='text', stage='commit')
+    def _commit(self, session_id, message, response_text, endpoint):
+        """
+        Сохраняет пару вопрос-ответ в историю сессии.
+        Если история вышла за бюджет, старые реплики сворачиваются в сводку в фоне;
+        до этого следующий запрос обрежет историю по бюджету (ContextBudget.fit)
+        """
+        history = self.store.load(session_id)
+        history.append({"role": "user", "content": message})
+        history.append({"role": "assistant", "content": response_text})
+        self.store.save(session_id, history)
         
-        return response_text
+        if self._budget(endpoint).over_budget(history):
+            with _compacting_lock:
+                if session_id in _compacting:
+                    return
+                _compacting.add(session_id)
+            compaction_executor.submit(self._compact, session_id, endpoint)
+    
+    def _compact(self, session_id, endpoint):
+        """Сворачивает историю сессии в сводку (в пуле compaction_executor)"""
+        try:
+            snapshot = self.store.load(session_id)
+            history = self._budget(endpoint).compact(snapshot, self._summarize)
+            # Сводка не удалась или не нужна: история остается как есть, до сводки ее обрезает fit
+            if history is snapshot:
+                return
+            # Пока шел запрос сводки, в сессию могли дописать реплики: оставляем их после сводки.
+            # Если историю очистили или переписали, старая сводка уже не нужна
+            current = self.store.load(session_id)
+            if current[:len(snapshot)] != snapshot:
+                return
+            self.store.save(session_id, history + current[len(snapshot):])
+        except Exception:
+            logger.exception("Не удалось свернуть историю сессии %s", session_id)
+        finally:
+            with _compacting_lock:
+                _compacting.discard(session_id)
+    
+    def _budget(self, endpoint):
+        return ContextBudget(get_budget(endpoint), model=self.model)
+    
+    def _summarize(self, summary, turns):
+        """Дописывает старые реплики в накопительную сводку диалога"""
+        dialog = "\n".join(f"{m['role']}: {m['content']}" for m in turns)
+        with upstream_call('openai', 'chat_summary'):
+            response = self.client.chat.completions.create(
+                model=self.model,
+                messages=[
+                    {"role": "system", "content": SUMMARY_SYSTEM_PROMPT},
+                    {"role": "user", "content": f"Предыдущий конспект:\n{summary or '-'}\n\nНовые реплики:\n{dialog}"}
+                ],
+                temperature=0.3,
+                max_tokens=300
+            )
+        return response.choices[0].message.content
     
     def clear_history(self, session_id: Optional[str] = None):
         """Очищает историю сообщений"""
         if session_id:
-            if session_id in self.conversation_history:
-                del self.conversation_history[session_id]
+            self.store.delete(session_id)
         else:
-            self.conversation_history.clear()
\ No newline at end of file
+            self.store.clear()
@@ -0,0 +1,133 @@
+import json
+import zlib
+from functools import lru_cache
+from typing import List
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.module_loading import import_string
+
+from core.lru import LRUCache
+
+
+# Компактный формат: роли кодируются одной буквой, большие истории сжимаются zlib
+_ROLE_CODES = {'user': 'u', 'assistant': 'a', 'system': 's'}
+_CODE_ROLES = {code: role for role, code in _ROLE_CODES.items()}
+_COMPRESS_THRESHOLD = 1024
+
+
+def encode_history(messages: List[dict]) -> bytes:
+    """Сериализует историю в компактный бинарный вид"""
+    packed = [[_ROLE_CODES[m['role']], m['content']] for m in messages]
+    raw = json.dumps(packed, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    if len(raw) > _COMPRESS_THRESHOLD:
+        return b'z' + zlib.compress(raw)
+    return b'j' + raw
+
+
+def decode_history(data: bytes) -> List[dict]:
+    """Восстанавливает историю из компактного вида"""
+    marker, body = data[:1], data[1:]
+    if marker == b'z':
+        body = zlib.decompress(body)
+    return [{'role': _CODE_ROLES[code], 'content': content} for code, content in json.loads(body)]
+
+
+class BaseSessionStore:
+    """
+    Хранилище истории диалогов по session_id.
+    max_messages ограничивает длину одной истории, ttl - время простоя сессии
+    """
+
+    def __init__(self, ttl: int = 3600, max_messages: int = 50):
+        self.ttl = ttl
+        self.max_messages = max_messages
+
+    def load(self, session_id: str) -> List[dict]:
+        raise NotImplementedError
+
+    def save(self, session_id: str, messages: List[dict]):
+        raise NotImplementedError
+
+    def delete(self, session_id: str):
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+    def _trim(self, messages):
+        """Оставляет последние max_messages реплик, не теряя сводку в начале"""
+        if not self.max_messages or len(messages) <= self.max_messages:
+            return messages
+        head = messages[:1] if messages[0]['role'] == 'system' else []
+        return head + messages[-(self.max_messages - len(head)):]
+
+
+class InMemorySessionStore(BaseSessionStore):
+    """Хранилище в памяти процесса (для тестов и локальной разработки)"""
+
+    def __init__(self, max_sessions: int = 1000, **kwargs):
+        super().__init__(**kwargs)
+        self._cache = LRUCache(max_size=max_sessions, ttl=self.ttl)
+
+    def load(self, session_id):
+        data = self._cache.get(session_id)
+        return decode_history(data) if data else []
+
+    def save(self, session_id, messages):
+        self._cache.set(session_id, encode_history(self._trim(messages)))
+
+    def delete(self, session_id):
+        self._cache.delete(session_id)
+
+    def clear(self):
+        self._cache.clear()
+
+
+class CacheSessionStore(BaseSessionStore):
+    """
+    Хранилище в кэше Django, общее для всех воркеров.
+    Чтение продлевает TTL сессии (touch), поэтому вытеснение LRU убирает давно не активные диалоги:
+    файловый кэш - по MAX_ENTRIES (core/filecache.py), Redis - по maxmemory с allkeys-lru.
+    clear() не трогает чужие ключи: он сдвигает поколение, и старые записи истекают сами
+    """
+
+    GENERATION_KEY = 'session:generation'
+
+    def __init__(self, alias: str = 'textg_sessions', **kwargs):
+        super().__init__(**kwargs)
+        self.alias = alias
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def load(self, session_id):
+        key = self._key(session_id)
+        data = self.cache.get(key)
+        if data is None:
+            return []
+        self.cache.touch(key, self.ttl)
+        return decode_history(data)
+
+    def save(self, session_id, messages):
+        self.cache.set(self._key(session_id), encode_history(self._trim(messages)), self.ttl)
+
+    def delete(self, session_id):
+        self.cache.delete(self._key(session_id))
+
+    def clear(self):
+        self.cache.get_or_set(self.GENERATION_KEY, 1, None)
+        self.cache.incr(self.GENERATION_KEY)
+
+    def _key(self, session_id):
+        generation = self.cache.get_or_set(self.GENERATION_KEY, 1, None)
+        return f"session:{generation}:{session_id}"
+
+
+@lru_cache(maxsize=None)
+def get_session_store() -> BaseSessionStore:
+    """Создает хранилище, настроенное в TEXTG_SESSION_STORE"""
+    config = getattr(settings, 'TEXTG_SESSION_STORE', {})
+    backend = import_string(config.get('BACKEND', 'textG.sessions.CacheSessionStore'))
+    return backend(**config.get('OPTIONS', {}))
@@ -1,3 +1,367 @@
-from django.test import TestCase
+import json
+import os
+import shutil
+import tempfile
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import caches
+from django.test import SimpleTestCase, TestCase
+
+from core.filecache import LRUFileBasedCache
+from core.metrics import generations_in_progress, stage_seconds
+from .batch import build_items, run_batch
+from .cache import ResponseCache, get_response_cache
+from .context import ContextBudget, count_message_tokens, make_summary, split_summary
+from .gpt import GPTClient
+from .sessions import CacheSessionStore, InMemorySessionStore, decode_history, encode_history
+
+
+def turns(count, words=20):
+    """count пар вопрос-ответ примерно одинаковой длины"""
+    history = []
+    for index in range(count):
+        history.append({'role': 'user', 'content': f"вопрос {index} " + 'слово ' * words})
+        history.append({'role': 'assistant', 'content': f"ответ {index} " + 'слово ' * words})
+    return history
+
+
+def completion(text):
+    """Ответ chat.completions.create без потока"""
+    return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=text))])
+
+
+class FakeStream:
+    """Поток chat.completions.create(stream=True): части ответа, затем error, если задана"""
+
+    def __init__(self, parts, error=None):
+        self.parts = parts
+        self.error = error
+        self.closed = False
+
+    def __iter__(self):
+        for part in self.parts:
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=part))])
+        if self.error:
+            raise self.error
+
+    def close(self):
+        self.closed = True
+
+
+def parse_events(response):
+    """События SSE ответа: [(event, data)], у событий без имени event = None"""
+    events = []
+    for block in b''.join(response.streaming_content).decode().split('\n\n'):
+        if not block:
+            continue
+        fields = dict(line.split(': ', 1) for line in block.split('\n'))
+        events.append((fields.get('event'), json.loads(fields['data'])))
+    return events
+
+
+def make_client():
+    """GPTClient с историей в памяти и подмененным клиентом OpenAI"""
+    client = GPTClient(api_key='test', store=InMemorySessionStore())
+    client.client = mock.Mock()
+    return client
+
+
+class ContextBudgetTests(SimpleTestCase):
+    def test_fit_keeps_newest_pairs_within_budget(self):
+        history = turns(10)
+        pair_cost = count_message_tokens(history[-2:])
+        fitted = ContextBudget(pair_cost * 3).fit(history)
+        self.assertEqual(fitted, history[-6:])
+
+    def test_fit_always_keeps_last_pair(self):
+        history = turns(3, words=500)
+        self.assertEqual(ContextBudget(10).fit(history), history[-2:])
+
+    def test_fit_keeps_summary_first(self):
+        history = [make_summary('конспект')] + turns(5)
+        fitted = ContextBudget(count_message_tokens(history[-2:]) + 10).fit(history)
+        self.assertEqual(fitted[0], make_summary('конспект'))
+        self.assertEqual(fitted[1:], history[-2:])
+
+    def test_compact_under_budget_returns_history(self):
+        history = turns(2)
+        summarize = mock.Mock()
+        self.assertIs(ContextBudget(10000).compact(history, summarize), history)
+        summarize.assert_not_called()
+
+    def test_compact_folds_oldest_turns_into_summary(self):
+        history = turns(10)
+        budget = ContextBudget(count_message_tokens(history) // 2)
+        summarize = mock.Mock(return_value='новый конспект')
+        compacted = budget.compact(history, summarize)
+
+        old_summary, folded = summarize.call_args.args
+        self.assertEqual(old_summary, '')
+        self.assertEqual(folded, history[:len(folded)])
+        summary, kept = split_summary(compacted)
+        self.assertEqual(summary, 'новый конспект')
+        self.assertEqual(kept, history[len(folded):])
+        self.assertLessEqual(count_message_tokens(compacted), budget.max_tokens)
+
+    def test_compact_keeps_history_when_summary_fails(self):
+        history = turns(10)
+        budget = ContextBudget(count_message_tokens(history) // 2)
+        with self.assertLogs('textG.context', 'WARNING'):
+            compacted = budget.compact(history, mock.Mock(side_effect=RuntimeError('timeout')))
+        self.assertIs(compacted, history)
+
+    def test_failed_summary_does_not_shorten_stored_session(self):
+        client = make_client()
+        history = turns(20)
+        client.store.save('s1', history)
+        client.client.chat.completions.create.side_effect = RuntimeError('timeout')
+        with self.assertLogs('textG.context', 'WARNING'):
+            client._compact('s1', 'generate')
+        self.assertEqual(client.store.load('s1'), history)
+
+    def test_summary_keeps_turns_added_meanwhile(self):
+        client = make_client()
+        client.store.save('s1', turns(20))
+
+        def summarize(*args, **kwargs):
+            # Пока идет запрос сводки, в сессию дописывают еще одну пару
+            client.store.save('s1', client.store.load('s1') + turns(1, words=1))
+            return completion('конспект')
+
+        client.client.chat.completions.create.side_effect = summarize
+        client._compact('s1', 'generate')
+        summary, kept = split_summary(client.store.load('s1'))
+        self.assertEqual(summary, 'конспект')
+        self.assertEqual(kept[-2:], turns(1, words=1))
+        self.assertLess(len(kept), 40)
+
+
+class StreamTests(SimpleTestCase):
+    def test_history_committed_when_stream_is_read_to_the_end(self):
+        client = make_client()
+        stream = FakeStream(['Поздрав', 'ляем'])
+        client.client.chat.completions.create.return_value = stream
+        self.assertEqual(list(client.stream_message('Поздравь маму', 's1')), ['Поздрав', 'ляем'])
+        self.assertEqual(client.store.load('s1'), [
+            {'role': 'user', 'content': 'Поздравь маму'},
+            {'role': 'assistant', 'content': 'Поздравляем'},
+        ])
+        self.assertTrue(stream.closed)
+
+    def test_closed_stream_is_not_committed(self):
+        client = make_client()
+        stream = FakeStream(['Поздрав', 'ляем'])
+        client.client.chat.completions.create.return_value = stream
+        chunks = client.stream_message('Поздравь маму', 's1')
+        next(chunks)
+        chunks.close()
+        self.assertEqual(client.store.load('s1'), [])
+        self.assertTrue(stream.closed)
+
+    def test_failed_stream_is_not_committed(self):
+        client = make_client()
+        client.client.chat.completions.create.return_value = FakeStream(['Поздрав'], error=RuntimeError('reset'))
+        with self.assertRaises(RuntimeError):
+            list(client.stream_regenerate('Сделай короче', 's1'))
+        self.assertEqual(client.store.load('s1'), [])
+
+
+@mock.patch('textG.api.views.history_writer')
+@mock.patch('textG.gpt.get_openai_client')
+class StreamViewTests(TestCase):
+    def post(self, **data):
+        return self.client.post('/api/text/generate/', {'session_id': 's1', 'stream': True, **data},
+                                content_type='application/json')
+
+    def test_start_delta_done(self, get_openai_client, history_writer):
+        get_openai_client.return_value.chat.completions.create.return_value = FakeStream(['Поздрав', 'ляем'])
+        response = self.post(message='Поздравь маму')
+        self.assertEqual(response['Content-Type'], 'text/event-stream; charset=utf-8')
+        self.assertEqual(parse_events(response), [
+            ('start', {'session_id': 's1', 'user_message': 'Поздравь маму'}),
+            (None, {'delta': 'Поздрав'}),
+            (None, {'delta': 'ляем'}),
+            ('done', {'success': True, 'response': 'Поздравляем', 'user_message': 'Поздравь маму', 'session_id': 's1'}),
+        ])
+        history_writer.record.assert_called_once()
+
+    def test_error_event(self, get_openai_client, history_writer):
+        get_openai_client.return_value.chat.completions.create.return_value = FakeStream(
+            ['Поздрав'], error=RuntimeError('reset')
+        )
+        events = parse_events(self.post(message='Поздравь маму'))
+        self.assertEqual([event for event, _ in events], ['start', None, 'error'])
+        self.assertEqual(events[-1][1], {'error': 'Ошибка при генерации: reset'})
+        history_writer.record.assert_not_called()
+
+    def test_validation_error_as_event(self, get_openai_client, history_writer):
+        response = self.client.post('/api/text/generate/', {'message': ''}, content_type='application/json',
+                                    HTTP_ACCEPT='text/event-stream')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.content.decode(),
+                         'event: error\ndata: {"error": "Сообщение не может быть пустым"}\n\n')
+
+
+class SessionStoreTests(SimpleTestCase):
+    def setUp(self):
+        caches['textg_sessions'].clear()
+
+    def test_encode_roundtrip(self):
+        short, long = turns(1, words=2), turns(20)
+        self.assertTrue(encode_history(short).startswith(b'j'))
+        self.assertTrue(encode_history(long).startswith(b'z'))
+        self.assertEqual(decode_history(encode_history(short)), short)
+        self.assertEqual(decode_history(encode_history(long)), long)
+
+    def test_trim_keeps_summary(self):
+        store = InMemorySessionStore(max_messages=4)
+        history = turns(3)
+        store.save('plain', history)
+        self.assertEqual(store.load('plain'), history[-4:])
+        store.save('summary', [make_summary('конспект')] + history)
+        self.assertEqual(store.load('summary'), [make_summary('конспект')] + history[-3:])
+
+    def test_clear_bumps_generation(self):
+        store = CacheSessionStore()
+        store.save('a', turns(1))
+        generation = store._key('a')
+        store.clear()
+        self.assertNotEqual(store._key('a'), generation)
+        self.assertEqual(store.load('a'), [])
+        store.save('a', turns(2))
+        self.assertEqual(store.load('a'), turns(2))
+
+    def test_file_cache_evicts_least_recently_used(self):
+        location = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, location)
+        cache = LRUFileBasedCache(location, {'OPTIONS': {'MAX_ENTRIES': 3, 'CULL_FREQUENCY': 3}})
+        for index, key in enumerate('abc'):
+            cache.set(key, key)
+            os.utime(cache._key_to_file(key), (100 + index, 100 + index))
+        # Чтение сессии продлевает ее (touch): вытесняется b, а не самая старая по записи a
+        cache.touch('a')
+        cache.set('d', 'd')
+        self.assertEqual([cache.get(key) for key in 'abcd'], ['a', None, 'c', 'd'])
+
+
+class ResponseCacheTests(SimpleTestCase):
+    def setUp(self):
+        get_response_cache().clear()
+
+    def test_key_ignores_case_spacing_and_edge_punctuation(self):
+        key = ResponseCache.make_key('Поздравь Ёлку!', 'prompt', 'gpt', 0.7)
+        self.assertEqual(key, ResponseCache.make_key('  поздравь   елку ', 'prompt', 'gpt', 0.7))
+        self.assertNotEqual(key, ResponseCache.make_key('Поздравь Ёлку!', 'prompt', 'gpt', 0.2))
+        self.assertNotEqual(key, ResponseCache.make_key('Поздравь Ёлку!', 'other', 'gpt', 0.7))
+
+    def test_get_set(self):
+        cache = ResponseCache(max_size=1)
+        cache.set('a', 'ответ')
+        self.assertEqual(cache.get('a'), 'ответ')
+        cache.set('b', 'другой')
+        self.assertIsNone(cache.get('a'))
+
+    def test_send_message_uses_cache_for_first_turn(self):
+        client = make_client()
+        client.client.chat.completions.create.side_effect = [completion('первый'), completion('свежий')]
+        self.assertEqual(client.send_message('Поздравь маму', 's1', use_cache=True), ('первый', False))
+        self.assertEqual(client.send_message('поздравь маму!', 's2', use_cache=True), ('первый', True))
+        # Из кэша ответ тоже попадает в историю сессии
+        self.assertEqual(client.store.load('s2')[-1], {'role': 'assistant', 'content': 'первый'})
+        self.assertEqual(client.send_message('Поздравь маму', 's3', use_cache=True, refresh=True), ('свежий', False))
+        self.assertEqual(client.send_message('Поздравь маму', 's4', use_cache=True), ('свежий', True))
+        self.assertEqual(client.client.chat.completions.create.call_count, 2)
+
+    def test_send_message_skips_cache_with_history_or_without_flag(self):
+        client = make_client()
+        client.client.chat.completions.create.return_value = completion('ответ')
+        client.send_message('Поздравь маму', 's1', use_cache=True)
+        self.assertEqual(client.send_message('Поздравь маму', 's1', use_cache=True), ('ответ', False))
+        self.assertEqual(client.send_message('Поздравь маму', 's2'), ('ответ', False))
+        self.assertEqual(client.client.chat.completions.create.call_count, 3)
+
+
+class TextMetricsTests(SimpleTestCase):
+    def in_progress(self):
+        return generations_in_progress._values.get(('text',), 0)
+
+    def total_count(self):
+        state = stage_seconds._values.get(('text', 'total'))
+        return state[2] if state else 0
+
+    def test_stream_is_measured_until_closed(self):
+        client = make_client()
+        client.client.chat.completions.create.side_effect = [FakeStream(['Поздрав', 'ляем']), FakeStream(['a', 'b'])]
+        in_progress, total = self.in_progress(), self.total_count()
+
+        chunks = client.stream_message('Поздравь маму', 's1')
+        self.assertEqual(next(chunks), 'Поздрав')
+        self.assertEqual(self.in_progress(), in_progress + 1)
+        self.assertEqual(list(chunks), ['ляем'])
+        self.assertEqual((self.in_progress(), self.total_count()), (in_progress, total + 1))
+
+        chunks = client.stream_regenerate('Сделай короче', 's1')
+        next(chunks)
+        chunks.close()
+        self.assertEqual((self.in_progress(), self.total_count()), (in_progress, total + 2))
+
+
+class BatchTests(SimpleTestCase):
+    def test_build_items(self):
+        self.assertEqual(
+            build_items({'items': ['a', {'message': 'b', 'recipient': 'Анна'}]}),
+            [{'message': 'a', 'recipient': None}, {'message': 'b', 'recipient': 'Анна'}]
+        )
+        self.assertEqual(
+            build_items({'message': 'm', 'recipients': ['Анна', 'Олег']}),
+            [{'message': 'm', 'recipient': 'Анна'}, {'message': 'm', 'recipient': 'Олег'}]
+        )
+
+    def test_build_items_rejects_wrong_types(self):
+        for data in ({'items': [1]}, {'items': 'abc'}, {'items': [{'message': 5}]},
+                     {'items': [{'message': 'a', 'recipient': ['x']}]}, {'recipients': 'Анна', 'message': 'm'}):
+            with self.assertRaises(ValueError, msg=data):
+                build_items(data)
+
+    def test_run_batch_reports_each_item(self):
+        client = make_client()
+
+        def create(messages, **kwargs):
+            if 'Олег' in messages[-1]['content']:
+                raise RuntimeError('timeout')
+            return completion(messages[-1]['content'].split(': ')[-1])
+
+        client.client.chat.completions.create.side_effect = create
+        items = build_items({'message': 'Поздравь', 'recipients': ['Анна', 'Олег', 'Ира']})
+        rows = list(run_batch(client, items, concurrency=2))
+
+        summary = rows.pop()
+        self.assertEqual((summary['total'], summary['succeeded'], summary['failed']), (3, 2, 1))
+        rows.sort(key=lambda row: row['index'])
+        self.assertEqual([row['success'] for row in rows], [True, False, True])
+        self.assertEqual([rows[0]['response'], rows[2]['response']], ['Анна', 'Ира'])
+        self.assertEqual(rows[1]['error'], 'Ошибка при генерации: timeout')
+
+
+@mock.patch('textG.api.views.history_writer')
+@mock.patch('textG.gpt.get_openai_client')
+class BatchViewTests(TestCase):
+    def test_each_generated_item_is_recorded(self, get_openai_client, history_writer):
+        def create(messages, **kwargs):
+            if 'Олег' in messages[-1]['content']:
+                raise RuntimeError('timeout')
+            return completion('Поздравляем!')
+
+        get_openai_client.return_value.chat.completions.create.side_effect = create
+        response = self.client.post('/api/text/batch/', {'message': 'Поздравь', 'recipients': ['Анна', 'Олег', 'Ира']},
+                                    content_type='application/json')
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+        self.assertEqual(rows[-1]['succeeded'], 2)
+        prompts = sorted(call.kwargs['prompt'] for call in history_writer.record.call_args_list)
+        self.assertEqual(prompts, [
+            'Поздравь\nПолучатель поздравления: Анна',
+            'Поздравь\nПолучатель поздравления: Ира',
+        ])
+        sessions = {row['session_id'] for row in rows[:-1] if row['success']}
+        self.assertEqual({call.kwargs['result']['session_id'] for call in history_writer.record.call_args_list}, sessions)
@@ -1,5 +1,6 @@
 from django.contrib import admin
-from .models import User
+from .models import DailyUsage, RateLimitBucket, User
+from .throttling import available_tokens, limit_options
 
 
 @admin.register(User)
@@ -11,4 +12,38 @@ class UserAdmin(admin.ModelAdmin):
     fieldsets = (
         (None, {'fields': ('email', 'password')}),
         ('Personal info', {'fields': ('username', 'first_name')}),
-    )
\ No newline at end of file
+    )
+
+
+@admin.register(DailyUsage)
+class DailyUsageAdmin(admin.ModelAdmin):
+    """Текущее использование дневных квот генерации"""
+    list_display = ('key', 'scope', 'day', 'count', 'daily_limit')
+    list_filter = ('scope', 'day')
+    search_fields = ('key',)
+    date_hierarchy = 'day'
+    readonly_fields = ('key', 'scope', 'day')
+    
+    @admin.display(description='Квота')
+    def daily_limit(self, obj):
+        options = limit_options(obj.scope)
+        return options['daily'] if options else None
+
+
+@admin.register(RateLimitBucket)
+class RateLimitBucketAdmin(admin.ModelAdmin):
+    """Токен-бакеты: сколько запросов подряд пользователь может сделать прямо сейчас"""
+    list_display = ('key', 'scope', 'available', 'capacity')
+    list_filter = ('scope',)
+    search_fields = ('key',)
+    readonly_fields = ('key', 'scope', 'tokens', 'updated_at')
+    
+    @admin.display(description='Доступно сейчас')
+    def available(self, obj):
+        options = limit_options(obj.scope)
+        return round(available_tokens(obj, options), 1) if options else None
+    
+    @admin.display(description='Емкость')
+    def capacity(self, obj):
+        options = limit_options(obj.scope)
+        return options['capacity'] if options else None
@@ -4,6 +4,7 @@ from rest_framework.response import Response
 from rest_framework.authtoken.models import Token
 from django.contrib.auth import authenticate, login, logout
 
+from ..authentication import invalidate_user_tokens
 from .serializers import UserSerializer, UserCreateSerializer, UserLoginSerializer
 
 
@@ -81,7 +82,8 @@ class UserViewSet(viewsets.ViewSet):
         Выход пользователя
         """
         if request.user.is_authenticated:
-            # Удаляем токен
+            # Удаляем токен и сразу сбрасываем его кэш, не дожидаясь TTL
+            invalidate_user_tokens(request.user)
             Token.objects.filter(user=request.user).delete()
             logout(request)
             
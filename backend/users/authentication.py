@@ -0,0 +1,61 @@
+import hashlib
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.translation import gettext_lazy as _
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+
+DEFAULTS = {
+    'alias': 'auth_tokens',
+    # Сколько секунд токен живет в кэше без обращения к БД
+    'ttl': 5 * 60,
+}
+
+
+def token_cache_options():
+    return {**DEFAULTS, **getattr(settings, 'AUTH_TOKEN_CACHE', {})}
+
+
+def _cache():
+    return caches[token_cache_options()['alias']]
+
+
+def _cache_key(key):
+    # Сам токен в ключ не кладем: ключи кэша видны в Redis и в именах файлов
+    return 'token:' + hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+
+def invalidate_token(key):
+    if key:
+        _cache().delete(_cache_key(key))
+
+
+def invalidate_user_tokens(user):
+    """Сбрасывает кэш всех токенов пользователя"""
+    keys = Token.objects.filter(user_id=user.pk).values_list('key', flat=True)
+    _cache().delete_many([_cache_key(key) for key in keys])
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    TokenAuthentication с кэшем токен -> пользователь в общем кэше Django.
+    В устойчивом режиме запрос к API не делает запросов к БД.
+    Кэш сбрасывается при выходе, удалении токена и изменении пользователя (users/signals.py)
+    """
+
+    def authenticate_credentials(self, key):
+        cache = _cache()
+        cache_key = _cache_key(key)
+        user = cache.get(cache_key)
+        if user is None:
+            user, token = super().authenticate_credentials(key)
+            cache.set(cache_key, user, token_cache_options()['ttl'])
+            return user, token
+
+        if not user.is_active:
+            raise exceptions.AuthenticationFailed(_('User inactive or deleted.'))
+        # request.auth - ключ токена: объект Token без запроса к БД
+        return user, Token(key=key, user=user)
@@ -0,0 +1,23 @@
+from django.core.checks import Warning, register
+
+from textG.batch import batch_options
+
+from .throttling import limit_options
+
+
+@register()
+def check_batch_limits(app_configs, **kwargs):
+    """Пакет из max_items элементов должен помещаться в бакет и дневную квоту text_batch"""
+    options = limit_options('text_batch')
+    if options is None:
+        return []
+    max_items = batch_options()['max_items']
+    limit = min(options['capacity'], options['daily'] if options['daily'] is not None else max_items)
+    if limit >= max_items:
+        return []
+    return [Warning(
+        f"TEXTG_BATCH['max_items'] = {max_items}, но RATE_LIMITS['text_batch'] пропускает "
+        f"не больше {limit} элементов: пакеты больше {limit} всегда получат 413.",
+        hint="Увеличьте capacity и daily в RATE_LIMITS['text_batch'] или уменьшите TEXTG_BATCH['max_items'].",
+        id='users.W001',
+    )]
@@ -0,0 +1,51 @@
+import time
+import uuid
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIRequestFactory
+
+from users.authentication import CachedTokenAuthentication, invalidate_token
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = 'Сравнивает TokenAuthentication и CachedTokenAuthentication: время и запросы к БД на один запрос'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=1000, help='Сколько запросов аутентифицировать')
+
+    def handle(self, *args, **options):
+        # Тестовый пользователь живет только внутри транзакции и откатывается
+        with transaction.atomic():
+            suffix = uuid.uuid4().hex[:12]
+            user = User.objects.create_user(
+                username=f"bench-{suffix}", email=f"bench-{suffix}@example.com", password=None
+            )
+            token = Token.objects.create(user=user)
+            request = APIRequestFactory().get('/api/users/me/', HTTP_AUTHORIZATION=f"Token {token.key}")
+
+            for authentication_class in (TokenAuthentication, CachedTokenAuthentication):
+                self._run(authentication_class(), request, options['requests'])
+
+            transaction.set_rollback(True)
+        # Откат не вызывает сигналов: кэш токена сбрасываем сами
+        invalidate_token(token.key)
+
+    def _run(self, authenticator, request, count):
+        # Первый запрос прогревает кэш и в замер не входит
+        authenticator.authenticate(request)
+
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            for _ in range(count):
+                authenticator.authenticate(request)
+            elapsed = time.perf_counter() - started
+
+        self.stdout.write(
+            f"{type(authenticator).__name__}: {elapsed / count * 1e6:.1f} мкс/запрос, "
+            f"{len(queries) / count:.2f} запросов к БД/запрос"
+        )
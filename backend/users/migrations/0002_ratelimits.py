@@ -0,0 +1,54 @@
+# Generated by Django 4.2.27 on 2026-10-18 11:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyUsage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=100, verbose_name='Ключ')),
+                ('scope', models.CharField(max_length=50, verbose_name='Эндпоинт')),
+                ('day', models.DateField(verbose_name='День')),
+                ('count', models.PositiveIntegerField(default=0, verbose_name='Запросов')),
+            ],
+            options={
+                'verbose_name': 'Дневное использование',
+                'verbose_name_plural': 'Дневное использование',
+                'ordering': ['-day', '-count'],
+            },
+        ),
+        migrations.CreateModel(
+            name='RateLimitBucket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=100, verbose_name='Ключ')),
+                ('scope', models.CharField(max_length=50, verbose_name='Эндпоинт')),
+                ('tokens', models.FloatField(verbose_name='Токенов на момент обновления')),
+                ('updated_at', models.FloatField(verbose_name='Обновлен')),
+            ],
+            options={
+                'verbose_name': 'Лимит запросов',
+                'verbose_name_plural': 'Лимиты запросов',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='ratelimitbucket',
+            constraint=models.UniqueConstraint(fields=('key', 'scope'), name='ratelimitbucket_key_scope_uniq'),
+        ),
+        migrations.AddIndex(
+            model_name='dailyusage',
+            index=models.Index(fields=['day', 'scope'], name='dailyusage_day_scope_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='dailyusage',
+            constraint=models.UniqueConstraint(fields=('key', 'scope', 'day'), name='dailyusage_key_scope_day_uniq'),
+        ),
+    ]
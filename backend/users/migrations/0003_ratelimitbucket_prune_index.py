@@ -0,0 +1,17 @@
+# Generated by Django 4.2.27 on 2026-10-18 12:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0002_ratelimits'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='ratelimitbucket',
+            index=models.Index(fields=['scope', 'updated_at'], name='ratelimitbucket_scope_upd_idx'),
+        ),
+    ]
@@ -15,4 +15,51 @@ class User(AbstractUser):
     user_permissions = None
     
     def __str__(self):
-        return f"User: {self.email}"
\ No newline at end of file
+        return f"User: {self.email}"
+
+
+class RateLimitBucket(models.Model):
+    """Токен-бакет пользователя для одного эндпоинта (users/throttling.py)"""
+
+    key = models.CharField(max_length=100, verbose_name="Ключ")
+    scope = models.CharField(max_length=50, verbose_name="Эндпоинт")
+    tokens = models.FloatField(verbose_name="Токенов на момент обновления")
+    # Unix-время: пополнение считается от него при следующем запросе
+    updated_at = models.FloatField(verbose_name="Обновлен")
+
+    class Meta:
+        verbose_name = "Лимит запросов"
+        verbose_name_plural = "Лимиты запросов"
+        constraints = [
+            models.UniqueConstraint(fields=['key', 'scope'], name='ratelimitbucket_key_scope_uniq'),
+        ]
+        indexes = [
+            # Удаление полных бакетов (throttling.prune_buckets)
+            models.Index(fields=['scope', 'updated_at'], name='ratelimitbucket_scope_upd_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.key} {self.scope}"
+
+
+class DailyUsage(models.Model):
+    """Счетчик генераций пользователя за день для дневной квоты"""
+
+    key = models.CharField(max_length=100, verbose_name="Ключ")
+    scope = models.CharField(max_length=50, verbose_name="Эндпоинт")
+    day = models.DateField(verbose_name="День")
+    count = models.PositiveIntegerField(default=0, verbose_name="Запросов")
+
+    class Meta:
+        verbose_name = "Дневное использование"
+        verbose_name_plural = "Дневное использование"
+        ordering = ['-day', '-count']
+        constraints = [
+            models.UniqueConstraint(fields=['key', 'scope', 'day'], name='dailyusage_key_scope_day_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['day', 'scope'], name='dailyusage_day_scope_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.key} {self.scope} {self.day}: {self.count}"
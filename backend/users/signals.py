@@ -0,0 +1,25 @@
+from functools import partial
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from .authentication import invalidate_token, invalidate_user_tokens
+from .models import User
+
+
+# Кэш сбрасывается после коммита: иначе параллельный запрос успеет закэшировать
+# старого пользователя (например, еще активного) на весь TTL
+@receiver(post_save, sender=User)
+def invalidate_user_cache(sender, instance, update_fields=None, **kwargs):
+    """Смена пароля, is_active или профиля не должна ждать истечения кэша токенов"""
+    # login() обновляет только last_login: кэш от этого не устаревает
+    if update_fields is not None and set(update_fields) == {'last_login'}:
+        return
+    transaction.on_commit(partial(invalidate_user_tokens, instance))
+
+
+@receiver(post_delete, sender=Token)
+def invalidate_token_cache(sender, instance, **kwargs):
+    transaction.on_commit(partial(invalidate_token, instance.key))
@@ -1,3 +1,208 @@
-from django.test import TestCase
+from unittest import mock
 
-# Create your tests here.
+from django.test import TestCase, override_settings
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.test import APIClient
+
+from . import checks
+from .authentication import CachedTokenAuthentication, _cache, _cache_key
+from .models import DailyUsage, RateLimitBucket, User
+from .throttling import available_tokens, prune_buckets, release_daily, take_daily, take_token
+
+
+LIMIT = {'capacity': 3, 'per_minute': 60, 'daily': None}
+
+
+def at(timestamp):
+    """Подменяет время в throttling: бакет пополняется по time.time()"""
+    clock = mock.patch('users.throttling.time')
+    clock.start().time.return_value = timestamp
+    return clock
+
+
+class TokenBucketTests(TestCase):
+    def tearDown(self):
+        mock.patch.stopall()
+
+    def test_capacity_then_wait(self):
+        at(1000.0)
+        for _ in range(3):
+            self.assertEqual(take_token('user:1', 'scope', LIMIT), 0)
+        self.assertAlmostEqual(take_token('user:1', 'scope', LIMIT), 1.0)
+
+    def test_refill_by_elapsed_time(self):
+        at(1000.0)
+        for _ in range(3):
+            take_token('user:1', 'scope', LIMIT)
+        mock.patch.stopall()
+        at(1002.0)
+        self.assertEqual(take_token('user:1', 'scope', LIMIT), 0)
+        self.assertEqual(take_token('user:1', 'scope', LIMIT), 0)
+        self.assertAlmostEqual(take_token('user:1', 'scope', LIMIT), 1.0)
+
+    def test_refill_is_capped_at_capacity(self):
+        at(1000.0)
+        take_token('user:1', 'scope', LIMIT)
+        bucket = RateLimitBucket.objects.get(key='user:1', scope='scope')
+        self.assertEqual(available_tokens(bucket, LIMIT, now=5000.0), LIMIT['capacity'])
+
+    def test_cost(self):
+        at(1000.0)
+        self.assertEqual(take_token('user:1', 'scope', LIMIT, cost=2), 0)
+        # Остался 1 токен из 3, для cost=2 ждем еще один: 1 с при 60 в минуту
+        self.assertAlmostEqual(take_token('user:1', 'scope', LIMIT, cost=2), 1.0)
+        self.assertIsNone(take_token('user:1', 'scope', LIMIT, cost=4))
+
+    def test_keys_and_scopes_are_independent(self):
+        at(1000.0)
+        for _ in range(3):
+            take_token('user:1', 'scope', LIMIT)
+        self.assertEqual(take_token('user:2', 'scope', LIMIT), 0)
+        self.assertEqual(take_token('user:1', 'other', LIMIT), 0)
+
+    def test_new_bucket_prunes_full_ones(self):
+        RateLimitBucket.objects.create(key='ip:1.1.1.1', scope='scope', tokens=0, updated_at=900.0)
+        RateLimitBucket.objects.create(key='ip:2.2.2.2', scope='scope', tokens=0, updated_at=999.0)
+        at(1000.0)
+        take_token('user:1', 'scope', LIMIT)
+        self.assertEqual(
+            set(RateLimitBucket.objects.values_list('key', flat=True)), {'ip:2.2.2.2', 'user:1'}
+        )
+        self.assertEqual(prune_buckets('scope', LIMIT, now=2000.0), 2)
+
+
+class DailyQuotaTests(TestCase):
+    def test_quota(self):
+        self.assertEqual(take_daily('user:1', 'scope', 3, cost=2), 0)
+        self.assertGreater(take_daily('user:1', 'scope', 3, cost=2), 0)
+        self.assertEqual(take_daily('user:1', 'scope', 3), 0)
+        self.assertGreater(take_daily('user:1', 'scope', 3), 0)
+        self.assertEqual(DailyUsage.objects.get(key='user:1', scope='scope').count, 3)
+
+    def test_release(self):
+        take_daily('user:1', 'scope', 2, cost=2)
+        release_daily('user:1', 'scope')
+        self.assertEqual(take_daily('user:1', 'scope', 2), 0)
+
+    def test_cost_over_limit(self):
+        self.assertIsNone(take_daily('user:1', 'scope', 0))
+        self.assertIsNone(take_daily('user:1', 'scope', 2, cost=3))
+        self.assertFalse(DailyUsage.objects.exists())
+
+
+@mock.patch('textG.gpt.GPTClient.send_message', return_value=('Поздравляем!', False))
+class GenerationThrottleTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+
+    @override_settings(RATE_LIMITS={'text_generate': {'capacity': 1, 'per_minute': 1, 'daily': None}})
+    def test_rejects_with_retry_after(self, send_message):
+        self.assertEqual(self.client.post('/api/text/generate/', {'message': 'a'}, format='json').status_code, 200)
+        response = self.client.post('/api/text/generate/', {'message': 'a'}, format='json')
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '60')
+        self.assertEqual(send_message.call_count, 1)
+
+    @override_settings(RATE_LIMITS={'text_generate': {'capacity': 1, 'per_minute': 1, 'daily': None}})
+    def test_forwarded_for_does_not_give_new_bucket(self, send_message):
+        self.client.post('/api/text/generate/', {'message': 'a'}, format='json', HTTP_X_FORWARDED_FOR='1.1.1.1')
+        response = self.client.post(
+            '/api/text/generate/', {'message': 'a'}, format='json', HTTP_X_FORWARDED_FOR='2.2.2.2'
+        )
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(list(RateLimitBucket.objects.values_list('key', flat=True)), ['ip:127.0.0.1'])
+
+    @override_settings(RATE_LIMITS={'text_batch': {'capacity': 5, 'per_minute': 1, 'daily': 100}})
+    def test_batch_costs_one_token_per_item(self, send_message):
+        response = self.client.post('/api/text/batch/', {'items': ['a'] * 3}, format='json')
+        self.assertEqual(response.status_code, 200)
+        b''.join(response.streaming_content)
+        self.assertEqual(self.client.post('/api/text/batch/', {'items': ['a'] * 3}, format='json').status_code, 429)
+        self.assertEqual(DailyUsage.objects.get(scope='text_batch').count, 3)
+
+    @override_settings(RATE_LIMITS={'text_batch': {'capacity': 5, 'per_minute': 1, 'daily': 100}})
+    def test_batch_over_capacity_is_413(self, send_message):
+        # Повтор не поможет: 413 с лимитом в тексте, без Retry-After и без списания
+        response = self.client.post('/api/text/batch/', {'items': ['a'] * 6}, format='json')
+        self.assertEqual(response.status_code, 413)
+        self.assertIn('не больше 5 генераций за раз', response.data['detail'])
+        self.assertFalse(response.has_header('Retry-After'))
+        self.assertFalse(DailyUsage.objects.exists())
+        self.assertFalse(RateLimitBucket.objects.exists())
+
+    def test_max_items_batch_fits_default_limits(self, send_message):
+        self.assertEqual(checks.check_batch_limits(None), [])
+        response = self.client.post('/api/text/batch/', {'items': ['a'] * 500}, format='json')
+        self.assertEqual(response.status_code, 200)
+        b''.join(response.streaming_content)
+        self.assertEqual(send_message.call_count, 500)
+
+    @override_settings(RATE_LIMITS={'text_batch': {'capacity': 100, 'per_minute': 20, 'daily': 1000}})
+    def test_check_warns_when_max_items_exceeds_capacity(self, send_message):
+        self.assertEqual([warning.id for warning in checks.check_batch_limits(None)], ['users.W001'])
+
+    @override_settings(RATE_LIMITS={'text_generate': {'capacity': 1, 'per_minute': 1, 'daily': 10}})
+    def test_rejected_request_is_refunded(self, send_message):
+        for _ in range(3):
+            self.assertEqual(self.client.post('/api/text/generate/', {'message': ''}, format='json').status_code, 400)
+        self.assertEqual(DailyUsage.objects.get(scope='text_generate').count, 0)
+        self.assertEqual(self.client.post('/api/text/generate/', {'message': 'a'}, format='json').status_code, 200)
+        self.assertEqual(DailyUsage.objects.get(scope='text_generate').count, 1)
+
+    @override_settings(RATE_LIMITS={'img_generate': {'capacity': 3, 'per_minute': 1, 'daily': 10}})
+    def test_bad_variants_is_refunded(self, send_message):
+        data = {'template_type': 'Юбилей', 'variants': 3, 'response_format': 'binary'}
+        response = self.client.post('/api/img/generate/', data, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(RateLimitBucket.objects.get(scope='img_generate').tokens, 3)
+        self.assertEqual(DailyUsage.objects.get(scope='img_generate').count, 0)
+
+
+class CachedTokenAuthenticationTests(TestCase):
+    def setUp(self):
+        _cache().clear()
+        self.user = User.objects.create_user(email='anna@example.com', username='anna', password='secret-123')
+        self.key = Token.objects.create(user=self.user).key
+        self.auth = CachedTokenAuthentication()
+        self.auth.authenticate_credentials(self.key)
+
+    def cached(self):
+        return _cache().get(_cache_key(self.key)) is not None
+
+    def test_cached_lookup_makes_no_queries(self):
+        with self.assertNumQueries(0):
+            user, token = self.auth.authenticate_credentials(self.key)
+        self.assertEqual((user.pk, token.key), (self.user.pk, self.key))
+
+    def test_logout(self):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Token {self.key}')
+        self.assertEqual(client.get('/api/users/me/').status_code, 200)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(client.post('/api/users/logout/').status_code, 200)
+        self.assertFalse(self.cached())
+        self.assertEqual(client.get('/api/users/me/').status_code, 401)
+
+    def test_token_delete(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Token.objects.get(key=self.key).delete()
+            # До коммита кэш не сбрасывается
+            self.assertTrue(self.cached())
+        self.assertFalse(self.cached())
+        with self.assertRaises(AuthenticationFailed):
+            self.auth.authenticate_credentials(self.key)
+
+    def test_user_save(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.is_active = False
+            self.user.save()
+        self.assertFalse(self.cached())
+        with self.assertRaises(AuthenticationFailed):
+            self.auth.authenticate_credentials(self.key)
+
+    def test_last_login_save_keeps_cache(self):
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            self.user.save(update_fields=['last_login'])
+        self.assertEqual(callbacks, [])
+        self.assertTrue(self.cached())
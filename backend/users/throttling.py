@@ -0,0 +1,252 @@
+import time
+from datetime import datetime, time as day_time, timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F, Value
+from django.db.models.functions import Least
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.exceptions import APIException, Throttled
+from rest_framework.settings import api_settings
+from rest_framework.throttling import BaseThrottle
+
+from textG.batch import build_items
+
+from .models import DailyUsage, RateLimitBucket
+
+
+# Лимит эндпоинта: capacity - сколько запросов можно сделать подряд,
+# per_minute - скорость пополнения, daily - дневная квота (None - без квоты)
+DEFAULTS = {
+    'capacity': 5,
+    'per_minute': 10,
+    'daily': None,
+}
+# Сколько дней храним дневные счетчики (для просмотра в админке)
+KEEP_DAYS = 30
+
+
+def limit_options(scope):
+    """Настройки лимита из RATE_LIMITS. None - эндпоинт не ограничен"""
+    limits = getattr(settings, 'RATE_LIMITS', {})
+    if scope not in limits:
+        return None
+    return {**DEFAULTS, **limits[scope]}
+
+
+def full_after(options):
+    """Через сколько секунд после обновления бакет снова полон; такой бакет не отличается от отсутствующего"""
+    if not options['per_minute']:
+        return None
+    return options['capacity'] * 60 / options['per_minute']
+
+
+def available_tokens(bucket, options, now=None):
+    """Сколько запросов бакет позволяет сделать сейчас"""
+    elapsed = (now or time.time()) - bucket.updated_at
+    return min(options['capacity'], bucket.tokens + elapsed * options['per_minute'] / 60)
+
+
+def take_token(key, scope, options, cost=1):
+    """
+    Забирает cost токенов из бакета одним UPDATE с пополнением по прошедшему времени,
+    поэтому воркеры не мешают друг другу. Возвращает 0 или сколько секунд ждать
+    (None - не дождаться: cost больше емкости или пополнения нет)
+    """
+    rate = options['per_minute'] / 60
+    capacity = float(options['capacity'])
+    cost = float(cost)
+    if cost > capacity:
+        return None
+    for _ in range(2):
+        now = time.time()
+        refilled = F('tokens') + (Value(now) - F('updated_at')) * Value(rate)
+        taken = RateLimitBucket.objects.filter(
+            key=key, scope=scope, tokens__gte=Value(cost) - (Value(now) - F('updated_at')) * Value(rate)
+        ).update(tokens=Least(Value(capacity), refilled) - Value(cost), updated_at=now)
+        if taken:
+            return 0
+
+        bucket = RateLimitBucket.objects.filter(key=key, scope=scope).first()
+        if bucket is not None:
+            if not rate:
+                return None
+            return (cost - available_tokens(bucket, options, now)) / rate
+
+        try:
+            with transaction.atomic():
+                RateLimitBucket.objects.create(key=key, scope=scope, tokens=capacity - cost, updated_at=now)
+        except IntegrityError:
+            # Бакет одновременно создал другой воркер: повторяем UPDATE
+            continue
+        # Новый ключ: заодно удаляем бакеты, которые успели пополниться полностью
+        prune_buckets(scope, options, now)
+        return 0
+    return 1
+
+
+def release_token(key, scope, options, cost=1):
+    """Возвращает cost токенов в бакет (не больше capacity), если списанный запрос отклонен"""
+    RateLimitBucket.objects.filter(key=key, scope=scope).update(
+        tokens=Least(Value(float(options['capacity'])), F('tokens') + Value(float(cost)))
+    )
+
+
+def prune_buckets(scope, options, now=None):
+    """Удаляет полные бакеты scope: следующий запрос создаст бакет заново с тем же результатом"""
+    full = full_after(options)
+    if full is None:
+        return 0
+    deleted, _ = RateLimitBucket.objects.filter(scope=scope, updated_at__lt=(now or time.time()) - full).delete()
+    return deleted
+
+
+def take_daily(key, scope, limit, cost=1):
+    """Увеличивает дневной счетчик на cost, если квота позволяет. Возвращает 0 или секунды до конца дня"""
+    if cost > limit:
+        return None
+
+    today = timezone.localdate()
+    for _ in range(2):
+        if DailyUsage.objects.filter(key=key, scope=scope, day=today, count__lte=limit - cost).update(
+            count=F('count') + cost
+        ):
+            return 0
+        if DailyUsage.objects.filter(key=key, scope=scope, day=today).exists():
+            tomorrow = timezone.make_aware(datetime.combine(today + timedelta(days=1), day_time.min))
+            return (tomorrow - timezone.now()).total_seconds()
+
+        try:
+            with transaction.atomic():
+                DailyUsage.objects.create(key=key, scope=scope, day=today, count=cost)
+        except IntegrityError:
+            continue
+        # Первая генерация ключа за день: заодно чистим старые счетчики эндпоинта
+        DailyUsage.objects.filter(scope=scope, day__lt=today - timedelta(days=KEEP_DAYS)).delete()
+        return 0
+    return 1
+
+
+def release_daily(key, scope, cost=1):
+    """Возвращает cost единиц квоты, если запрос все-таки отклонен по скорости"""
+    DailyUsage.objects.filter(key=key, scope=scope, day=timezone.localdate(), count__gte=cost).update(
+        count=F('count') - cost
+    )
+
+
+def refund_generation(request):
+    """Возвращает лимит, списанный throttle для request: генерации не было"""
+    for key, scope, options, cost in getattr(request, 'generation_charges', ()):
+        release_token(key, scope, options, cost)
+        if options['daily'] is not None:
+            release_daily(key, scope, cost)
+    request.generation_charges = []
+
+
+class GenerationThrottled(Throttled):
+    extra_detail_singular = extra_detail_plural = 'Повторите через {wait} с.'
+
+
+class GenerationTooLarge(APIException):
+    """Запрос дороже самого лимита: повтор не поможет, поэтому 413 без Retry-After, а не 429"""
+    status_code = status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+    default_detail = 'Запрос превышает лимит генераций.'
+    default_code = 'generation_too_large'
+
+
+class GenerationRateThrottle(BaseThrottle):
+    """
+    Лимит генераций на пользователя (анонимов - на IP) для эндпоинта scope:
+    токен-бакет и дневная квота из RATE_LIMITS. Состояние хранится в БД, общей для всех воркеров.
+    Запрос стоит get_cost() токенов и единиц квоты. Отказ - 429 с Retry-After;
+    запрос дороже capacity или дневной квоты не пройдет никогда - 413
+    """
+
+    scope = None
+
+    def get_cost(self, request):
+        return 1
+
+    def get_ident(self, request):
+        # Без NUM_PROXIES DRF берет X-Forwarded-For целиком, а его клиент подставляет сам:
+        # каждый новый заголовок давал бы новый бакет
+        if api_settings.NUM_PROXIES:
+            return super().get_ident(request)
+        return request.META.get('REMOTE_ADDR', '')
+
+    def get_cache_key(self, request):
+        if request.user and request.user.is_authenticated:
+            return f"user:{request.user.pk}"
+        return f"ip:{self.get_ident(request)}"[:100]
+
+    def allow_request(self, request, view):
+        options = limit_options(self.scope)
+        if options is None:
+            return True
+
+        key = self.get_cache_key(request)
+        cost = self.get_cost(request)
+        if cost > options['capacity']:
+            raise GenerationTooLarge(f"Запрос превышает лимит: не больше {options['capacity']} генераций за раз.")
+        if options['daily'] is not None and cost > options['daily']:
+            raise GenerationTooLarge(f"Запрос превышает дневной лимит: не больше {options['daily']} генераций в день.")
+
+        if options['daily'] is not None:
+            wait = take_daily(key, self.scope, options['daily'], cost)
+            if wait != 0:
+                self._reject('Дневной лимит генераций исчерпан.', wait)
+
+        wait = take_token(key, self.scope, options, cost)
+        if wait != 0:
+            if options['daily'] is not None:
+                release_daily(key, self.scope, cost)
+            self._reject('Слишком много запросов.', wait)
+        request.generation_charges = [*getattr(request, 'generation_charges', ()), (key, self.scope, options, cost)]
+        return True
+
+    def _reject(self, detail, wait):
+        raise GenerationThrottled(wait=wait, detail=detail)
+
+
+class RefundRejectedGenerationMixin:
+    """
+    Для view с GenerationRateThrottle: throttle списывает лимит до проверки тела запроса,
+    поэтому если view отклонил запрос (4xx), лимит возвращается
+    """
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        if 400 <= response.status_code < 500:
+            refund_generation(request)
+        return super().finalize_response(request, response, *args, **kwargs)
+
+
+class ImageGenerationThrottle(GenerationRateThrottle):
+    scope = 'img_generate'
+
+    def get_cost(self, request):
+        # Каждый вариант - отдельный запрос к DALL-E; неверное значение отклонит view
+        try:
+            return max(1, int(request.data.get('variants') or 1))
+        except (TypeError, ValueError):
+            return 1
+
+
+class VideoGenerationThrottle(GenerationRateThrottle):
+    scope = 'video_generate'
+
+
+class TextGenerationThrottle(GenerationRateThrottle):
+    scope = 'text_generate'
+
+
+class TextBatchThrottle(GenerationRateThrottle):
+    """Пакет стоит столько генераций, сколько в нем элементов"""
+    scope = 'text_batch'
+
+    def get_cost(self, request):
+        try:
+            return max(1, len(build_items(request.data)))
+        except (TypeError, ValueError, AttributeError):
+            # Некорректное тело отклонит view
+            return 1
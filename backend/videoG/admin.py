@@ -1,3 +1,16 @@
 from django.contrib import admin
+from .models import VideoJob
 
-# Register your models here.
+
+@admin.register(VideoJob)
+class VideoJobAdmin(admin.ModelAdmin):
+    list_display = [
+        'id',
+        'status',
+        'provider_status',
+        'created_at',
+        'finished_at'
+    ]
+    list_filter = ['status', 'provider_status']
+    search_fields = ['id', 'generation_id', 'prompt']
+    readonly_fields = [field.name for field in VideoJob._meta.fields]
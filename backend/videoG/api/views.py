@@ -1,45 +1,74 @@
-from rest_framework import viewsets, status
+from rest_framework import permissions, viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from django.http import Http404
+from django.urls import reverse
 from django.utils.decorators import method_decorator
 from django.views.decorators.csrf import csrf_exempt
 import json
-import base64
-from ..krea import generate_video_from_text
-from django.conf import settings
 import os
+from core.http import ranged_file_response
+from core.webhooks import SIGNATURE_HEADER, TIMESTAMP_HEADER, verify
+from core.streaming import EventStreamRenderer, format_event, sse_response
+from history.models import Generation
+from history.writer import history_writer
+from users.throttling import RefundRejectedGenerationMixin, VideoGenerationThrottle
+from ..jobs import video_jobs, video_poller
+from ..models import VideoJob
+from ..storage import absolute_path
+from ..webhooks import webhook_enabled, webhook_options
+
+
+# Локальная копия видео не меняется после сохранения
+FILE_CACHE_SECONDS = 365 * 24 * 60 * 60
 
 
 @method_decorator(csrf_exempt, name='dispatch')
-class ChatViewSet(viewsets.ViewSet):
+class ChatViewSet(RefundRejectedGenerationMixin, viewsets.ViewSet):
     """
     ViewSet для обработки запросов генерации видео
     """
+    renderer_classes = [*api_settings.DEFAULT_RENDERER_CLASSES, EventStreamRenderer]
     
-    def __init__(self, *args, **kwargs):
-        self.api_key = settings.API_KEY_KREA
-        super().__init__(*args, **kwargs)
-    
-    @action(detail=False, methods=['post'], url_path='generate')
+    @action(detail=False, methods=['post'], url_path='generate', throttle_classes=[VideoGenerationThrottle])
     def generate(self, request):
+        """
+        Создает фоновую задачу генерации видео и сразу отвечает 202 с job_id.
+        Готовность проверяется через jobs/<job_id>/. С флагом progressive
+        сначала рендерится короткий черновик (поле draft), затем полная версия
+        """
         try:
             data = request.data
             prompt = data.get('prompt')
             
-            video = generate_video_from_text(
-                prompt,
-                self.api_key
+            if not prompt or not str(prompt).strip():
+                return Response(
+                    {'error': 'Промт не может быть пустым'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            
+            progressive = str(data.get('progressive', '')).lower() in ('1', 'true', 'yes')
+            job = VideoJob.objects.create(
+                prompt=prompt,
+                progressive=progressive,
+                stage=VideoJob.DRAFT if progressive else VideoJob.FINAL
+            )
+            # Запись истории по задаче пишется сразу, до submit: завершить задачу может другой воркер
+            history_writer.record(
+                request.user,
+                Generation.VIDEO,
+                prompt=prompt,
+                result={'job_id': str(job.pk)},
+                status=Generation.PENDING,
+                job_id=job.pk
             )
+            video_jobs.submit(job)
             
-            response_data = {
-                'status': 'success',
-                'message': 'Видео успешно сгенерировано',
-                'video_url': video['video']['url'],
-                'format': 'base64',
-                'prompt': prompt,
-            }
+            response_data = self._job_data(request, job)
+            response_data['message'] = 'Видео поставлено в очередь на генерацию'
             
-            return Response(response_data, status=status.HTTP_200_OK)
+            return Response(response_data, status=status.HTTP_202_ACCEPTED)
         
         except json.JSONDecodeError:
             return Response(
@@ -47,12 +76,6 @@ class ChatViewSet(viewsets.ViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        except ImportError as e:
-            return Response(
-                {'error': 'Модуль генерации видео недоступен'},
-                status=status.HTTP_500_INTERNAL_SERVER_ERROR
-            )
-        
         except Exception as e:
             return Response(
                 {
@@ -62,4 +85,135 @@ class ChatViewSet(viewsets.ViewSet):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
     
-    
\ No newline at end of file
+    @action(
+        detail=False,
+        methods=['post'],
+        url_path='webhook',
+        authentication_classes=[],
+        permission_classes=[permissions.AllowAny]
+    )
+    def webhook(self, request):
+        """
+        Уведомление провайдера о завершении генерации. Тело подписано HMAC (core/webhooks.py),
+        задача завершается сразу, не дожидаясь следующего опроса
+        """
+        options = webhook_options()
+        body = request.body
+        signed = verify(
+            options['secret'],
+            body,
+            request.headers.get(TIMESTAMP_HEADER),
+            request.headers.get(SIGNATURE_HEADER),
+            tolerance=options['tolerance']
+        )
+        if not webhook_enabled() or not signed:
+            return Response({'error': 'Неверная подпись'}, status=status.HTTP_403_FORBIDDEN)
+        
+        try:
+            payload = json.loads(body)
+        except ValueError:
+            return Response({'error': 'Невалидный JSON формат'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        if not isinstance(payload, dict) or not video_poller.resolve(payload):
+            return Response({'error': 'Генерация не найдена'}, status=status.HTTP_404_NOT_FOUND)
+        return Response({'status': 'ok'}, status=status.HTTP_200_OK)
+    
+    @action(detail=False, methods=['get'], url_path=r'jobs/(?P<job_id>[0-9a-f-]{36})')
+    def job_status(self, request, job_id=None):
+        """Состояние задачи; после succeeded в ответе есть video_url"""
+        job = video_jobs.get(job_id)
+        if job is None:
+            return Response({'error': 'Задача не найдена'}, status=status.HTTP_404_NOT_FOUND)
+        return Response(self._job_data(request, job), status=status.HTTP_200_OK)
+    
+    @action(detail=False, methods=['get'], url_path=r'jobs/(?P<job_id>[0-9a-f-]{36})/events')
+    def job_events(self, request, job_id=None):
+        """
+        Server-Sent Events по задаче: событие при каждом изменении (статус, этап, готовый черновик),
+        последнее - succeeded/failed
+        """
+        if video_jobs.get(job_id) is None:
+            return Response({'error': 'Задача не найдена'}, status=status.HTTP_404_NOT_FOUND)
+        
+        def events():
+            for job in video_jobs.events(job_id):
+                yield format_event(self._job_data(request, job), event=job.status)
+        
+        return sse_response(events())
+    
+    @action(detail=False, methods=['get'], url_path=r'files/(?P<job_id>[0-9a-f-]{36})')
+    def video_file(self, request, job_id=None):
+        """Локальная копия видео с поддержкой Range (перемотка в плеере), ETag и долгим кэшем"""
+        job = VideoJob.objects.filter(pk=job_id).exclude(video_file='').first()
+        if job is None or not os.path.exists(absolute_path(job.video_file)):
+            raise Http404('Видео не найдено')
+        return ranged_file_response(
+            request,
+            absolute_path(job.video_file),
+            content_type='video/mp4',
+            etag=job.video_sha256 or None,
+            max_age=FILE_CACHE_SECONDS,
+            immutable=True,
+            last_modified=job.finished_at.timestamp() if job.finished_at else None,
+            filename='new-year-greeting.mp4'
+        )
+    
+    @action(detail=False, methods=['get'], url_path=r'files/(?P<job_id>[0-9a-f-]{36})/poster')
+    def poster_file(self, request, job_id=None):
+        """Постер видео (кадр, извлеченный ffmpeg); у черновика и полной версии разные ?v="""
+        job = VideoJob.objects.filter(pk=job_id).exclude(poster_file='').first()
+        if job is None or not os.path.exists(absolute_path(job.poster_file)):
+            raise Http404('Постер не найден')
+        return ranged_file_response(
+            request,
+            absolute_path(job.poster_file),
+            content_type='image/jpeg',
+            etag=self._poster_version(job),
+            max_age=FILE_CACHE_SECONDS,
+            immutable=True
+        )
+    
+    @action(detail=False, methods=['get'], url_path=r'files/(?P<job_id>[0-9a-f-]{36})/draft')
+    def draft_file(self, request, job_id=None):
+        """Локальная копия черновика"""
+        job = VideoJob.objects.filter(pk=job_id).exclude(draft_video_file='').first()
+        if job is None or not os.path.exists(absolute_path(job.draft_video_file)):
+            raise Http404('Черновик не найден')
+        return ranged_file_response(
+            request,
+            absolute_path(job.draft_video_file),
+            content_type='video/mp4',
+            etag=f"{job.pk}-draft",
+            max_age=FILE_CACHE_SECONDS,
+            immutable=True,
+            filename='new-year-greeting-draft.mp4'
+        )
+    
+    def _job_data(self, request, job):
+        data = job.as_dict()
+        data.update({
+            'status_url': request.build_absolute_uri(reverse('video-job-status', kwargs={'job_id': job.pk})),
+            'provider_status': job.provider_status or None,
+            'prompt': job.prompt,
+            'stage': job.stage,
+        })
+        if job.progressive:
+            draft_url = job.draft_video_url or None
+            if job.draft_video_file:
+                draft_url = request.build_absolute_uri(reverse('video-draft-file', kwargs={'job_id': job.pk}))
+            data['draft'] = {'ready': bool(draft_url), 'video_url': draft_url}
+        if job.poster_file:
+            data['poster_url'] = request.build_absolute_uri(
+                f"{reverse('video-poster-file', kwargs={'job_id': job.pk})}?v={self._poster_version(job)}"
+            )
+        if job.status == VideoJob.SUCCEEDED:
+            data['video_url'] = job.video_url
+            # Есть локальная копия - отдаем ее, ссылка провайдера со временем истекает
+            if job.video_file:
+                data['source_video_url'] = job.video_url
+                data['video_url'] = request.build_absolute_uri(reverse('video-video-file', kwargs={'job_id': job.pk}))
+        return data
+    
+    def _poster_version(self, job):
+        """Постер черновика потом заменяется постером полной версии: версия - имя файла"""
+        return os.path.splitext(os.path.basename(job.poster_file))[0]
@@ -0,0 +1,136 @@
+import logging
+
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+
+from core.jobs import DEFERRED, JobQueue
+from .krea import generate_video
+from .models import VideoJob
+from .poller import VideoPoller
+from .storage import mirror_video
+from .webhooks import callback_url
+
+
+logger = logging.getLogger(__name__)
+
+PROGRESSIVE_DEFAULTS = {
+    'draft_frames': 30,
+    'final_frames': 90,
+    # False: полная версия запускается после черновика и не отнимает у него ресурсы провайдера
+    'parallel': False,
+}
+
+
+def progressive_options():
+    return {**PROGRESSIVE_DEFAULTS, **getattr(settings, 'VIDEO_PROGRESSIVE', {})}
+
+
+def submit_generation(job, stage=VideoJob.FINAL):
+    """Создает генерацию этапа в AIMLAPI, сохраняет ее ID и передает поллеру. Возвращает False при ошибке"""
+    options = progressive_options()
+    num_frames = options['draft_frames'] if stage == VideoJob.DRAFT else options['final_frames']
+    response_data = generate_video(
+        job.prompt, settings.API_KEY_KREA, num_frames=num_frames, callback_url=callback_url()
+    )
+    if not response_data or not response_data.get('id'):
+        return False
+
+    field = 'draft_generation_id' if stage == VideoJob.DRAFT else 'generation_id'
+    setattr(job, field, response_data['id'])
+    VideoJob.objects.filter(pk=job.pk).update(**{field: response_data['id']})
+    video_poller.track(job, stage, started_at=timezone.now())
+    return True
+
+
+def run_video_job(job):
+    """
+    Создает генерацию в AIMLAPI (если ее еще нет) и передает ее общему поллеру.
+    В режиме progressive сначала создается короткий черновик, полная версия - после него
+    или сразу вместе с ним (VIDEO_PROGRESSIVE['parallel']). Задача, восстановленная
+    после перезапуска, продолжает опрос уже созданных генераций
+    """
+    if job.progressive and not job.draft_video_url:
+        if job.draft_generation_id:
+            video_poller.track(job, VideoJob.DRAFT)
+            draft_running = True
+        else:
+            draft_running = submit_generation(job, VideoJob.DRAFT)
+        if not draft_running:
+            logger.warning("Видео %s: черновик не создан, сразу рендерим полную версию", job.pk)
+            VideoJob.objects.filter(pk=job.pk).update(stage=VideoJob.FINAL)
+        elif not job.generation_id and not progressive_options()['parallel']:
+            # Полную версию запустит _complete_draft
+            return DEFERRED
+
+    if job.generation_id:
+        video_poller.track(job)
+    elif not submit_generation(job):
+        return {'success': False, 'error': 'Не удалось создать задачу генерации видео'}
+    return DEFERRED
+
+
+class VideoJobQueue(JobQueue):
+    def stale_jobs(self):
+        # Задача с созданной генерацией ждет провайдера (DEFERRED), а не упавший handler:
+        # ее подхватит опрос по аренде, повторный запуск оплатил бы генерацию второй раз
+        return super().stale_jobs().filter(generation_id='', draft_generation_id='')
+
+    def recover(self):
+        super().recover()
+        video_poller.resume()
+
+    def complete(self, job, result):
+        """Готовое видео скачиваем к себе в пуле очереди, чтобы не задерживать поллер"""
+        self.start().submit(self._complete, job, result)
+
+    def _complete(self, job, result):
+        try:
+            if result.get('stage') == VideoJob.DRAFT:
+                self._complete_draft(job, result)
+                return
+
+            job.refresh_from_db()
+            if result.get('success'):
+                job.video_url = result['video_url']
+                try:
+                    for field, value in mirror_video(job.pk, job.video_url).items():
+                        # Если ffmpeg не сделал постер, остается постер черновика
+                        if value or field != 'poster_file':
+                            setattr(job, field, value)
+                except Exception as e:
+                    # Отдадим ссылку провайдера: видео есть, хоть и не у нас
+                    logger.warning("Видео %s не удалось сохранить локально: %s", job.pk, e)
+            self.finish(job, result)
+        except Exception:
+            logger.exception("Видео %s: не удалось завершить задачу", job.pk)
+        finally:
+            connection.close()
+
+    def _complete_draft(self, job, result):
+        """Черновик готов: сохраняем его, будим ждущих и запускаем полную версию, если она еще не запущена"""
+        fields = {'stage': VideoJob.FINAL}
+        if result.get('success'):
+            fields['draft_video_url'] = result['video_url']
+            try:
+                mirrored = mirror_video(f"{job.pk}-draft", result['video_url'])
+                fields['draft_video_file'] = mirrored['video_file']
+                if mirrored['poster_file']:
+                    fields['poster_file'] = mirrored['poster_file']
+            except Exception as e:
+                logger.warning("Черновик видео %s не удалось сохранить локально: %s", job.pk, e)
+        else:
+            # Без черновика задача не ломается: пользователь дождется полной версии
+            logger.warning("Черновик видео %s не готов: %s", job.pk, result.get('error'))
+        # Черновик завершает один процесс (опрос или вебхук), иначе полная версия запустилась бы дважды
+        if not VideoJob.objects.filter(pk=job.pk, status=VideoJob.RUNNING, stage=VideoJob.DRAFT).update(**fields):
+            return
+        self.notify()
+
+        job.refresh_from_db()
+        if job.status == VideoJob.RUNNING and not job.generation_id and not submit_generation(job):
+            self.finish(job, {'success': False, 'error': 'Не удалось создать задачу генерации видео'})
+
+
+video_jobs = VideoJobQueue(VideoJob, run_video_job, setting='VIDEO_JOBS', name='video')
+video_poller = VideoPoller(video_jobs)
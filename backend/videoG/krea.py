@@ -1,12 +1,17 @@
-import requests
 import time
+from django.conf import settings
+from core.downloader import request_with_retries
+from core.metrics import upstream_call
 
 # Insert your AI/ML API key instead of <YOUR_AIMLAPI_KEY>:
 
+# Статусы генерации, при которых видео еще не готово
+PENDING_STATUSES = ("waiting", "active", "queued", "generating")
+
 
 # Creating and sending a video generation task to the server
-def generate_video(promt, api_key):
-    url = "https://api.aimlapi.com/v2/video/generations"
+def generate_video(promt, api_key, num_frames=90, callback_url=None):
+    url = f"{settings.AIMLAPI_BASE_URL}/v2/video/generations"
     headers = {
         "Authorization": f"Bearer {api_key}",
     }
@@ -14,10 +19,16 @@ def generate_video(promt, api_key):
     data = {
         "model": "krea/krea-wan-14b/text-to-video",
         "prompt": promt,
-        "num_frames": 90
+        "num_frames": num_frames
     }
+    # Провайдер сообщит о готовности запросом на наш вебхук
+    if callback_url:
+        data["callback_url"] = callback_url
     
-    response = requests.post(url, json=data, headers=headers)
+    with upstream_call('aimlapi', 'video_generate') as call:
+        response = request_with_retries('POST', url, json=data, headers=headers)
+        if response.status_code >= 400:
+            call.error = f"HTTP {response.status_code}"
     if response.status_code >= 400:
         print(f"Error: {response.status_code} - {response.text}")
     else:
@@ -28,7 +39,7 @@ def generate_video(promt, api_key):
 
 # Requesting the result of the task from the server using the generation_id
 def get_video(gen_id, api_key):
-    url = "https://api.aimlapi.com/v2/video/generations"
+    url = f"{settings.AIMLAPI_BASE_URL}/v2/video/generations"
     params = {
         "generation_id": gen_id,
     }
@@ -38,7 +49,10 @@ def get_video(gen_id, api_key):
         "Content-Type": "application/json"
     }
     
-    response = requests.get(url, params=params, headers=headers)
+    with upstream_call('aimlapi', 'video_status') as call:
+        response = request_with_retries('GET', url, params=params, headers=headers)
+        if response.status_code >= 400:
+            call.error = f"HTTP {response.status_code}"
     return response.json()
 
 
@@ -61,7 +75,7 @@ def generate_video_from_text(promt, api_key):
             
             status = response_data.get("status")
             
-            if status == "waiting" or status == "active" or status == "queued" or status == "generating":
+            if status in PENDING_STATUSES:
                 time.sleep(10)
             else:
                 print("Processing complete:/n", response_data)
@@ -72,6 +86,11 @@ def generate_video_from_text(promt, api_key):
 
 
 if __name__ == "__main__":
-    api_key = "a4***********"
+    # Ручная проверка из backend/: python -m videoG.krea (нужны настройки Django)
+    import os
+    import django
+
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
+    django.setup()
     promt = "Дед мороз в костюме вручает премию работнику"
-    print(generate_video_from_text(promt, api_key))
\ No newline at end of file
+    print(generate_video_from_text(promt, settings.API_KEY_KREA))
\ No newline at end of file
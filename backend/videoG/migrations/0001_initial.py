@@ -0,0 +1,34 @@
+# Generated by Django 4.2.27 on 2026-10-18 11:44
+
+from django.db import migrations, models
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VideoJob',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('status', models.CharField(choices=[('pending', 'В очереди'), ('running', 'Выполняется'), ('succeeded', 'Готово'), ('failed', 'Ошибка')], db_index=True, default='pending', max_length=16, verbose_name='Статус')),
+                ('result', models.JSONField(blank=True, null=True, verbose_name='Результат')),
+                ('error', models.TextField(blank=True, verbose_name='Ошибка')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')),
+                ('started_at', models.DateTimeField(blank=True, null=True, verbose_name='Начало выполнения')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='Окончание выполнения')),
+                ('prompt', models.TextField(verbose_name='Промт')),
+                ('generation_id', models.CharField(blank=True, db_index=True, max_length=100, verbose_name='ID генерации у провайдера')),
+                ('provider_status', models.CharField(blank=True, max_length=32, verbose_name='Статус у провайдера')),
+                ('video_url', models.URLField(blank=True, max_length=2000, verbose_name='Ссылка на видео')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', 'created_at'], name='videojob_status_created_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 4.2.27 on 2026-10-18 11:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('videoG', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='videojob',
+            name='poster_file',
+            field=models.CharField(blank=True, help_text='Путь относительно MEDIA_ROOT', max_length=255, verbose_name='Постер'),
+        ),
+        migrations.AddField(
+            model_name='videojob',
+            name='video_file',
+            field=models.CharField(blank=True, help_text='Путь относительно MEDIA_ROOT', max_length=255, verbose_name='Локальная копия видео'),
+        ),
+        migrations.AddField(
+            model_name='videojob',
+            name='video_sha256',
+            field=models.CharField(blank=True, max_length=64, verbose_name='SHA-256 видео'),
+        ),
+        migrations.AddField(
+            model_name='videojob',
+            name='video_size',
+            field=models.PositiveBigIntegerField(blank=True, null=True, verbose_name='Размер видео, байт'),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 4.2.27 on 2026-10-18 11:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('videoG', '0002_videojob_local_copy'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='videojob',
+            name='draft_generation_id',
+            field=models.CharField(blank=True, max_length=100, verbose_name='ID черновика у провайдера'),
+        ),
+        migrations.AddField(
+            model_name='videojob',
+            name='draft_video_file',
+            field=models.CharField(blank=True, help_text='Путь относительно MEDIA_ROOT', max_length=255, verbose_name='Локальная копия черновика'),
+        ),
+        migrations.AddField(
+            model_name='videojob',
+            name='draft_video_url',
+            field=models.URLField(blank=True, max_length=2000, verbose_name='Ссылка на черновик'),
+        ),
+        migrations.AddField(
+            model_name='videojob',
+            name='progressive',
+            field=models.BooleanField(default=False, help_text='Короткий черновик отдается до готовности полной версии', verbose_name='Сначала черновик'),
+        ),
+        migrations.AddField(
+            model_name='videojob',
+            name='stage',
+            field=models.CharField(choices=[('draft', 'Черновик'), ('final', 'Финальная версия')], default='final', max_length=8, verbose_name='Текущий этап'),
+        ),
+    ]
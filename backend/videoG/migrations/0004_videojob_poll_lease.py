@@ -0,0 +1,23 @@
+# Generated by Django 4.2.27 on 2026-10-18 12:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('videoG', '0003_videojob_progressive'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='videojob',
+            name='poll_lease_until',
+            field=models.DateTimeField(blank=True, help_text='После этого времени задачу подхватит другой процесс', null=True, verbose_name='Аренда опроса до'),
+        ),
+        migrations.AddField(
+            model_name='videojob',
+            name='poll_owner',
+            field=models.CharField(blank=True, max_length=100, verbose_name='Процесс, опрашивающий генерацию'),
+        ),
+    ]
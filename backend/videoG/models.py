@@ -1,3 +1,100 @@
 from django.db import models
+from core.jobs import BaseJob
 
-# Create your models here.
+
+class VideoJob(BaseJob):
+    """Генерация видео в AIMLAPI, которую в фоне отслеживает videoG/jobs.py"""
+    DRAFT = 'draft'
+    FINAL = 'final'
+    STAGE_CHOICES = [
+        (DRAFT, 'Черновик'),
+        (FINAL, 'Финальная версия'),
+    ]
+
+    prompt = models.TextField(
+        verbose_name="Промт"
+    )
+    progressive = models.BooleanField(
+        default=False,
+        verbose_name="Сначала черновик",
+        help_text="Короткий черновик отдается до готовности полной версии"
+    )
+    stage = models.CharField(
+        max_length=8,
+        choices=STAGE_CHOICES,
+        default=FINAL,
+        verbose_name="Текущий этап"
+    )
+    draft_generation_id = models.CharField(
+        max_length=100,
+        blank=True,
+        verbose_name="ID черновика у провайдера"
+    )
+    draft_video_url = models.URLField(
+        max_length=2000,
+        blank=True,
+        verbose_name="Ссылка на черновик"
+    )
+    draft_video_file = models.CharField(
+        max_length=255,
+        blank=True,
+        verbose_name="Локальная копия черновика",
+        help_text="Путь относительно MEDIA_ROOT"
+    )
+    generation_id = models.CharField(
+        max_length=100,
+        blank=True,
+        db_index=True,
+        verbose_name="ID генерации у провайдера"
+    )
+    provider_status = models.CharField(
+        max_length=32,
+        blank=True,
+        verbose_name="Статус у провайдера"
+    )
+    video_url = models.URLField(
+        max_length=2000,
+        blank=True,
+        verbose_name="Ссылка на видео"
+    )
+    video_file = models.CharField(
+        max_length=255,
+        blank=True,
+        verbose_name="Локальная копия видео",
+        help_text="Путь относительно MEDIA_ROOT"
+    )
+    video_sha256 = models.CharField(
+        max_length=64,
+        blank=True,
+        verbose_name="SHA-256 видео"
+    )
+    video_size = models.PositiveBigIntegerField(
+        null=True,
+        blank=True,
+        verbose_name="Размер видео, байт"
+    )
+    poster_file = models.CharField(
+        max_length=255,
+        blank=True,
+        verbose_name="Постер",
+        help_text="Путь относительно MEDIA_ROOT"
+    )
+    poll_owner = models.CharField(
+        max_length=100,
+        blank=True,
+        verbose_name="Процесс, опрашивающий генерацию"
+    )
+    poll_lease_until = models.DateTimeField(
+        null=True,
+        blank=True,
+        verbose_name="Аренда опроса до",
+        help_text="После этого времени задачу подхватит другой процесс"
+    )
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'created_at'], name='videojob_status_created_idx'),
+        ]
+
+    def event_key(self):
+        return self.status, self.stage, self.provider_status, bool(self.draft_video_url)
@@ -0,0 +1,345 @@
+import heapq
+import itertools
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+import requests
+from django.conf import settings
+from django.db import connection
+from django.db.models import Q
+from django.db.models import DurationField, ExpressionWrapper, F
+from django.utils import timezone
+
+from core.metrics import generations_in_progress, stage_seconds
+
+from .krea import PENDING_STATUSES, get_video
+from .models import VideoJob
+from .webhooks import webhook_enabled, webhook_options
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'min_interval': 2,
+    'max_interval': 15,
+    'backoff': 1.5,
+    # Вес нового наблюдения в EWMA времени генерации
+    'ewma_alpha': 0.3,
+    # Вокруг ожидаемого времени готовности (± доля от него) опрашиваем часто
+    'window': 0.25,
+    'timeout': 10 * 60,
+    # Сколько последних готовых видео берем для начальной оценки времени генерации
+    'seed_jobs': 20,
+    # Потоков для одновременных запросов статуса: медленный ответ не задерживает остальные генерации
+    'workers': 4,
+    # Задачу опрашивает один процесс - владелец аренды. Он продлевает ее каждые lease / 3 секунд,
+    # после падения владельца задачу подхватит другой процесс
+    'lease': 60,
+}
+
+
+class VideoPoller:
+    """
+    Поток расписания опрашивает AIMLAPI по незавершенным генерациям через небольшой пул.
+    Интервал для каждой генерации: сначала часто, затем с экспоненциальной паузой,
+    а около ожидаемого времени готовности (EWMA по завершенным видео) снова часто.
+    Результат передается очереди задач (complete), она сохраняет видео и будит ждущие запросы.
+    Если включен вебхук, статус приходит через resolve(), а опрос становится редкой
+    проверкой пропущенных уведомлений (sweep_interval).
+    Задачу опрашивает только процесс, который держит ее аренду (poll_owner, poll_lease_until)
+    """
+
+    def __init__(self, queue):
+        self.queue = queue
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._wakeup = threading.Condition()
+        self._due = []
+        self._tracked = {}
+        self._order = itertools.count()
+        self._thread = None
+        self._executor = None
+        self._next_renewal = 0.0
+        # Ожидаемое время генерации по этапам (черновик рендерится быстрее)
+        self._ewma = {}
+
+    @property
+    def options(self):
+        return {**DEFAULTS, **getattr(settings, 'VIDEO_POLLER', {})}
+
+    def track(self, job, stage=VideoJob.FINAL, started_at=None, claim=True):
+        """
+        Добавляет генерацию задачи (финальную или черновик) в опрос и забирает аренду задачи
+        (claim=False - аренда уже получена). Повторный вызов для той же генерации ничего не делает
+        """
+        generation_id = job.draft_generation_id if stage == VideoJob.DRAFT else job.generation_id
+        self._start()
+        if claim:
+            VideoJob.objects.filter(pk=job.pk).update(poll_owner=self.owner, poll_lease_until=self._lease_until())
+        with self._wakeup:
+            if generation_id in self._tracked:
+                return
+            entry = self._entry(job, stage, started_at)
+            self._tracked[generation_id] = entry
+            generations_in_progress.inc(component='video')
+            self._schedule(entry, self._elapsed(entry))
+            self._wakeup.notify()
+
+    def resume(self):
+        """
+        Подхватывает running-генерации без действующей аренды: оставшиеся после перезапуска
+        или брошенные упавшим процессом. Аренду каждой задачи получает один процесс
+        """
+        now = timezone.now()
+        orphaned = Q(poll_lease_until__isnull=True) | Q(poll_lease_until__lt=now)
+        jobs = VideoJob.objects.filter(orphaned, status=VideoJob.RUNNING).exclude(generation_id='', draft_generation_id='')
+        for job in jobs:
+            claimed = VideoJob.objects.filter(orphaned, pk=job.pk, status=VideoJob.RUNNING).update(
+                poll_owner=self.owner, poll_lease_until=self._lease_until()
+            )
+            if not claimed:
+                continue
+            if job.draft_generation_id and not job.draft_video_url:
+                self.track(job, VideoJob.DRAFT, claim=False)
+            if job.generation_id:
+                self.track(job, claim=False)
+
+    def resolve(self, response_data):
+        """
+        Обрабатывает статус генерации из вебхука так же, как результат опроса.
+        Возвращает False, если такой незавершенной генерации нет
+        """
+        generation_id = str(response_data.get('id') or response_data.get('generation_id') or '')
+        if not generation_id:
+            return False
+
+        with self._wakeup:
+            entry = self._tracked.get(generation_id)
+        if entry is None:
+            # Генерацию опрашивает другой процесс: применяем статус, не забирая аренду
+            job = VideoJob.objects.filter(status=VideoJob.RUNNING).filter(
+                Q(generation_id=generation_id) | Q(draft_generation_id=generation_id)
+            ).first()
+            if job is None:
+                return False
+            entry = self._entry(job, VideoJob.DRAFT if job.draft_generation_id == generation_id else VideoJob.FINAL)
+
+        # Если генерация еще идет, ее опрашивает владелец аренды
+        self._handle(entry, response_data, self._elapsed(entry))
+        return True
+
+    def next_interval(self, elapsed, polls, stage=VideoJob.FINAL):
+        """Пауза до следующего опроса генерации, которая идет elapsed секунд и опрошена polls раз"""
+        if webhook_enabled():
+            return webhook_options()['sweep_interval']
+
+        options = self.options
+        minimum, maximum = options['min_interval'], options['max_interval']
+        interval = min(maximum, minimum * options['backoff'] ** polls)
+
+        expected = self._ewma.get(stage)
+        if expected:
+            window = expected * options['window']
+            if elapsed < expected - window:
+                # До ожидаемой готовности далеко: можно подождать дольше, но не пропустить начало окна
+                interval = min(maximum, max(interval, expected - window - elapsed))
+            elif elapsed <= expected + window:
+                interval = minimum
+        return interval
+
+    def stats(self):
+        with self._wakeup:
+            return {
+                'tracked': len(self._tracked),
+                'expected_seconds': {stage: round(value, 1) for stage, value in self._ewma.items()},
+            }
+
+    def _entry(self, job, stage, started_at=None):
+        return {
+            'job_id': job.pk,
+            'generation_id': job.draft_generation_id if stage == VideoJob.DRAFT else job.generation_id,
+            'stage': stage,
+            'started_at': started_at or job.started_at or timezone.now(),
+            'provider_status': job.provider_status if stage == VideoJob.FINAL else '',
+            'polls': 0,
+        }
+
+    def _lease_until(self):
+        return timezone.now() + timedelta(seconds=self.options['lease'])
+
+    def _start(self):
+        if self._thread is not None:
+            return
+        with self._wakeup:
+            if self._thread is None:
+                self._seed()
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.options['workers'], thread_name_prefix='video-poll'
+                )
+                self._next_renewal = time.monotonic() + self.options['lease'] / 3
+                self._thread = threading.Thread(target=self._loop, name='video-poller', daemon=True)
+                self._thread.start()
+
+    def _seed(self):
+        """Начальная оценка времени генерации по последним готовым видео без черновика"""
+        durations = VideoJob.objects.filter(
+            status=VideoJob.SUCCEEDED, progressive=False, started_at__isnull=False, finished_at__isnull=False
+        ).annotate(
+            duration=ExpressionWrapper(F('finished_at') - F('started_at'), output_field=DurationField())
+        ).order_by('-finished_at').values_list('duration', flat=True)[:self.options['seed_jobs']]
+
+        for duration in reversed(list(durations)):
+            self._observe(VideoJob.FINAL, duration.total_seconds())
+
+    def _observe(self, stage, seconds):
+        alpha = self.options['ewma_alpha']
+        previous = self._ewma.get(stage)
+        self._ewma[stage] = seconds if previous is None else alpha * seconds + (1 - alpha) * previous
+
+    def _elapsed(self, entry):
+        return (timezone.now() - entry['started_at']).total_seconds()
+
+    def _schedule(self, entry, elapsed):
+        delay = self.next_interval(elapsed, entry['polls'], entry['stage'])
+        heapq.heappush(self._due, (time.monotonic() + delay, next(self._order), entry))
+
+    def _loop(self):
+        while True:
+            with self._wakeup:
+                now = time.monotonic()
+                if now >= self._next_renewal:
+                    self._next_renewal = now + self.options['lease'] / 3
+                    if not self._submit(self._renew):
+                        return
+                    continue
+                if not self._due:
+                    self._wakeup.wait(self._next_renewal - now)
+                    continue
+                when, _, entry = self._due[0]
+                delay = min(when, self._next_renewal) - now
+                if delay > 0:
+                    self._wakeup.wait(delay)
+                    continue
+                heapq.heappop(self._due)
+                # Генерацию уже завершил вебхук
+                if entry.get('done'):
+                    continue
+
+            if not self._submit(self._poll_entry, entry):
+                return
+
+    def _submit(self, func, *args):
+        try:
+            self._executor.submit(self._run, func, *args)
+        except RuntimeError:
+            # Процесс завершается, пул уже остановлен
+            return False
+        return True
+
+    def _run(self, func, *args):
+        try:
+            func(*args)
+        except Exception:
+            logger.exception("Опрос видео: ошибка в %s", func.__name__)
+        finally:
+            connection.close()
+
+    def _poll_entry(self, entry):
+        try:
+            self._poll(entry)
+        except Exception:
+            logger.exception("Видео %s: ошибка опроса", entry['generation_id'])
+            with self._wakeup:
+                self._schedule(entry, self._elapsed(entry))
+
+    def _renew(self):
+        """
+        Продлевает аренду своих задач, перестает опрашивать задачи, которые завершены
+        или перешли к другому процессу, и подхватывает брошенные
+        """
+        with self._wakeup:
+            job_ids = {entry['job_id'] for entry in self._tracked.values()}
+        if job_ids:
+            owned = VideoJob.objects.filter(pk__in=job_ids, status=VideoJob.RUNNING, poll_owner=self.owner)
+            owned.update(poll_lease_until=self._lease_until())
+            kept = set(owned.values_list('pk', flat=True))
+            with self._wakeup:
+                for generation_id, entry in list(self._tracked.items()):
+                    if entry['job_id'] not in kept:
+                        entry['done'] = True
+                        self._untrack(generation_id)
+        self.resume()
+
+    def _poll(self, entry):
+        entry['polls'] += 1
+        elapsed = self._elapsed(entry)
+        timed_out = elapsed > self.options['timeout']
+
+        try:
+            response_data = get_video(entry['generation_id'], settings.API_KEY_KREA)
+        except (requests.RequestException, ValueError) as e:
+            # Сбой опроса не означает сбой генерации: пробуем на следующем шаге
+            logger.warning("Видео %s: не удалось получить статус: %s", entry['generation_id'], e)
+            self._poll_later(entry, elapsed, timed_out)
+            return
+
+        if not self._handle(entry, response_data, elapsed):
+            self._poll_later(entry, elapsed, timed_out)
+
+    def _handle(self, entry, response_data, elapsed):
+        """Применяет статус генерации. Возвращает False, если видео еще не готово"""
+        status = response_data.get('status', '')
+        if status != entry['provider_status']:
+            entry['provider_status'] = status
+            if entry['stage'] == VideoJob.FINAL:
+                VideoJob.objects.filter(pk=entry['job_id']).update(provider_status=status)
+                self.queue.notify()
+
+        if status in PENDING_STATUSES:
+            return False
+
+        video_url = (response_data.get('video') or {}).get('url')
+        if not video_url:
+            self._finish(entry, {
+                'success': False,
+                'error': str(response_data.get('error') or f'Генерация завершилась со статусом {status}')
+            })
+            return True
+
+        with self._wakeup:
+            self._observe(entry['stage'], elapsed)
+        stage_seconds.observe(elapsed, component='video', stage=entry['stage'])
+        self._finish(entry, {'success': True, 'video_url': video_url, 'generation_id': entry['generation_id']})
+        return True
+
+    def _poll_later(self, entry, elapsed, timed_out):
+        if timed_out:
+            self._finish(entry, {'success': False, 'error': 'Превышено время ожидания видео'})
+            return
+        with self._wakeup:
+            self._schedule(entry, elapsed)
+
+    def _finish(self, entry, result):
+        # Вебхук и опрос могут прийти одновременно: завершает только первый
+        with self._wakeup:
+            if entry.get('done'):
+                return
+            entry['done'] = True
+            self._untrack(entry['generation_id'])
+
+        job = VideoJob.objects.filter(pk=entry['job_id'], status=VideoJob.RUNNING).first()
+        if job is None:
+            # Задачу уже завершил другой процесс
+            return
+        result['stage'] = entry['stage']
+        self.queue.complete(job, result)
+
+    def _untrack(self, generation_id):
+        # Вызывается под self._wakeup
+        if self._tracked.pop(generation_id, None) is not None:
+            generations_in_progress.dec(component='video')
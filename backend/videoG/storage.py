@@ -0,0 +1,87 @@
+import hashlib
+import logging
+import os
+import shutil
+import subprocess
+
+from django.conf import settings
+
+from core.downloader import download
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'location': 'videos',
+    'max_bytes': 500 * 1024 ** 2,
+    # Кадр для постера: секунда от начала и ширина в пикселях
+    'poster_at': 1.0,
+    'poster_width': 640,
+    'ffmpeg_timeout': 30,
+}
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def storage_options():
+    return {**DEFAULTS, **getattr(settings, 'VIDEO_STORAGE', {})}
+
+
+def absolute_path(relative):
+    return os.path.join(settings.MEDIA_ROOT, relative)
+
+
+def _file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def mirror_video(name, video_url):
+    """
+    Скачивает готовое видео потоком в MEDIA_ROOT/videos/<name>.mp4 и делает постер.
+    Возвращает поля для VideoJob: video_file, video_sha256, video_size, poster_file
+    """
+    options = storage_options()
+    video_file = os.path.join(options['location'], f"{name}.mp4")
+    downloaded = download(video_url, path=absolute_path(video_file), max_bytes=options['max_bytes'])
+    logger.info("Видео %s сохранено: %s", name, downloaded['metrics'])
+
+    poster_file = os.path.join(options['location'], f"{name}.jpg")
+    if not extract_poster(absolute_path(video_file), absolute_path(poster_file)):
+        poster_file = ''
+
+    return {
+        'video_file': video_file,
+        'video_sha256': _file_digest(absolute_path(video_file)),
+        'video_size': downloaded['size_bytes'],
+        'poster_file': poster_file,
+    }
+
+
+def extract_poster(video_path, poster_path):
+    """
+    Кадр видео в JPEG через ffmpeg. Без ffmpeg в системе постер просто не делается.
+    Если видео короче poster_at, берется первый кадр
+    """
+    ffmpeg = shutil.which('ffmpeg')
+    if not ffmpeg:
+        return False
+
+    options = storage_options()
+    for offset in (options['poster_at'], 0):
+        command = [
+            ffmpeg, '-nostdin', '-loglevel', 'error', '-y',
+            '-ss', str(offset), '-i', video_path,
+            '-frames:v', '1', '-vf', f"scale={options['poster_width']}:-2",
+            poster_path,
+        ]
+        try:
+            subprocess.run(command, check=True, capture_output=True, timeout=options['ffmpeg_timeout'])
+        except (OSError, subprocess.SubprocessError) as e:
+            logger.warning("Не удалось сделать постер для %s: %s", video_path, e)
+            return False
+        if os.path.exists(poster_path) and os.path.getsize(poster_path):
+            return True
+    return False
@@ -1,3 +1,209 @@
-from django.test import TestCase
+import json
+import os
+import tempfile
+import time
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from core.http import ranged_file_response
+from core.jobs import DEFERRED, JobQueue
+from core.webhooks import sign, signed_headers, verify
+from .jobs import run_video_job, video_jobs
+from .models import VideoJob
+from .poller import VideoPoller
+
+
+WEBHOOK = {'url': 'https://example.com', 'secret': 'whsec'}
+
+
+class WebhookSignatureTests(SimpleTestCase):
+    def test_roundtrip(self):
+        timestamp = str(int(time.time()))
+        self.assertTrue(verify('whsec', b'{}', timestamp, sign('whsec', timestamp, b'{}')))
+
+    def test_rejects_tampered_body_and_wrong_secret(self):
+        timestamp = str(int(time.time()))
+        signature = sign('whsec', timestamp, b'{"status": "failed"}')
+        self.assertFalse(verify('whsec', b'{"status": "completed"}', timestamp, signature))
+        self.assertFalse(verify('other', b'{"status": "failed"}', timestamp, signature))
+
+    def test_rejects_stale_and_malformed_timestamp(self):
+        old = str(int(time.time()) - 600)
+        self.assertFalse(verify('whsec', b'{}', old, sign('whsec', old, b'{}'), tolerance=300))
+        self.assertFalse(verify('whsec', b'{}', 'soon', sign('whsec', 'soon', b'{}')))
+
+    def test_requires_secret_and_headers(self):
+        timestamp = str(int(time.time()))
+        self.assertFalse(verify('', b'{}', timestamp, sign('', timestamp, b'{}')))
+        self.assertFalse(verify('whsec', b'{}', None, None))
+
+    def test_non_ascii_signature(self):
+        self.assertFalse(verify('whsec', b'{}', str(int(time.time())), 'sha256=подпись'))
+
+
+@override_settings(VIDEO_WEBHOOK=WEBHOOK)
+class WebhookViewTests(TestCase):
+    url = '/api/video/webhook/'
+
+    def post(self, payload, secret='whsec', **extra):
+        body = json.dumps(payload).encode()
+        headers = {f"HTTP_{name.upper().replace('-', '_')}": value
+                   for name, value in signed_headers(secret, body).items() if name != 'Content-Type'}
+        headers.update(extra)
+        return APIClient().post(self.url, body, content_type='application/json', **headers)
+
+    def test_rejects_bad_signature(self):
+        self.assertEqual(self.post({'id': 'g1'}, secret='wrong').status_code, 403)
+        # Заголовки WSGI приходят в latin-1: не-ASCII подпись - тоже 403, а не 500
+        self.assertEqual(self.post({'id': 'g1'}, HTTP_X_WEBHOOK_SIGNATURE='sha256=\xe9').status_code, 403)
+
+    def test_unknown_generation(self):
+        self.assertEqual(self.post({'id': 'missing', 'status': 'completed'}).status_code, 404)
+
+    @mock.patch.object(video_jobs, 'complete')
+    def test_completes_running_job(self, complete):
+        job = VideoJob.objects.create(prompt='p', status=VideoJob.RUNNING, started_at=timezone.now(), generation_id='g1')
+        response = self.post({'id': 'g1', 'status': 'completed', 'video': {'url': 'https://cdn/g1.mp4'}})
+        self.assertEqual(response.status_code, 200)
+        completed, result = complete.call_args.args
+        self.assertEqual(completed.pk, job.pk)
+        self.assertEqual(result['video_url'], 'https://cdn/g1.mp4')
+
+
+class RangeResponseTests(SimpleTestCase):
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp()
+        with os.fdopen(fd, 'wb') as f:
+            f.write(bytes(range(100)))
+        self.addCleanup(os.unlink, self.path)
+        self.factory = RequestFactory()
+
+    def get(self, **headers):
+        response = ranged_file_response(self.factory.get('/', **headers), self.path, 'video/mp4', etag='abc')
+        body = b''.join(response.streaming_content) if response.streaming else response.content
+        return response, body
+
+    def test_full_file(self):
+        response, body = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(body), 100)
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+
+    def test_ranges(self):
+        for header, start, end in (('bytes=10-19', 10, 19), ('bytes=90-', 90, 99), ('bytes=-5', 95, 99),
+                                   ('bytes=95-500', 95, 99)):
+            response, body = self.get(HTTP_RANGE=header)
+            self.assertEqual(response.status_code, 206, header)
+            self.assertEqual(body, bytes(range(start, end + 1)), header)
+            self.assertEqual(response['Content-Range'], f'bytes {start}-{end}/100')
+            self.assertEqual(response['Content-Length'], str(end - start + 1))
+
+    def test_unsatisfiable(self):
+        for header in ('bytes=100-', 'bytes=50-10', 'bytes=-0'):
+            response, _ = self.get(HTTP_RANGE=header)
+            self.assertEqual(response.status_code, 416, header)
+            self.assertEqual(response['Content-Range'], 'bytes */100')
+
+    def test_multiple_or_malformed_range_returns_full_file(self):
+        for header in ('bytes=0-1,5-6', 'items=0-1', 'bytes=-'):
+            response, body = self.get(HTTP_RANGE=header)
+            self.assertEqual(response.status_code, 200, header)
+            self.assertEqual(len(body), 100)
+
+    def test_etag(self):
+        self.assertEqual(self.get(HTTP_IF_NONE_MATCH='"abc"')[0].status_code, 304)
+        # If-Range с другой версией: отдаем файл целиком
+        self.assertEqual(self.get(HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE='"old"')[0].status_code, 200)
+        self.assertEqual(self.get(HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE='"abc"')[0].status_code, 206)
+
+
+@mock.patch('history.signals.history_writer')
+@mock.patch('core.jobs.connection')
+class JobQueueTests(TestCase):
+    def make_queue(self, handler):
+        queue = JobQueue(VideoJob, handler, name='test')
+        queue._executor = mock.Mock()
+        return queue
+
+    def test_deferred_job_stays_running_until_finish(self, connection, history_writer):
+        queue = self.make_queue(lambda job: DEFERRED)
+        job = VideoJob.objects.create(prompt='p')
+        queue._run(job.pk)
+        job.refresh_from_db()
+        self.assertEqual(job.status, VideoJob.RUNNING)
+        # Ту же задачу одновременно завершают опрос и вебхук: побеждает первый
+        other = VideoJob.objects.get(pk=job.pk)
+        self.assertTrue(queue.finish(job, {'success': True}))
+        self.assertFalse(queue.finish(other, {'success': False, 'error': 'late'}))
+        self.assertEqual(VideoJob.objects.get(pk=job.pk).status, VideoJob.SUCCEEDED)
+        history_writer.update_job.assert_called_once()
+
+    def test_recover_resets_stale_jobs_but_not_waiting_generations(self, connection, history_writer):
+        started = timezone.now() - timedelta(hours=1)
+        crashed = VideoJob.objects.create(prompt='p', status=VideoJob.RUNNING, started_at=started)
+        waiting = VideoJob.objects.create(prompt='p', status=VideoJob.RUNNING, started_at=started, generation_id='g1')
+        drafting = VideoJob.objects.create(
+            prompt='p', status=VideoJob.RUNNING, started_at=started, progressive=True, draft_generation_id='d1'
+        )
+        fresh = VideoJob.objects.create(prompt='p', status=VideoJob.RUNNING, started_at=timezone.now())
+        with mock.patch.object(video_jobs, '_executor', mock.Mock()), mock.patch('videoG.jobs.video_poller'):
+            video_jobs.recover()
+        self.assertEqual(VideoJob.objects.get(pk=crashed.pk).status, VideoJob.PENDING)
+        for job in (waiting, drafting, fresh):
+            self.assertEqual(VideoJob.objects.get(pk=job.pk).status, VideoJob.RUNNING)
+
+
+@mock.patch('videoG.jobs.mirror_video', return_value={'video_file': 'videos/d.mp4', 'poster_file': 'videos/d.jpg'})
+@mock.patch('videoG.jobs.video_poller')
+@mock.patch('videoG.jobs.generate_video')
+class ProgressiveTests(TestCase):
+    def test_draft_then_final(self, generate_video, video_poller, mirror_video):
+        generate_video.side_effect = [{'id': 'draft'}, {'id': 'final'}]
+        job = VideoJob.objects.create(prompt='p', progressive=True, stage=VideoJob.DRAFT,
+                                      status=VideoJob.RUNNING, started_at=timezone.now())
+        self.assertIs(run_video_job(job), DEFERRED)
+        job.refresh_from_db()
+        self.assertEqual((job.draft_generation_id, job.generation_id), ('draft', ''))
+
+        # Готовность черновика пришла и от опроса, и от вебхука: полная версия запускается один раз
+        result = {'success': True, 'stage': VideoJob.DRAFT, 'video_url': 'https://cdn/draft.mp4'}
+        video_jobs._complete_draft(job, result)
+        video_jobs._complete_draft(VideoJob.objects.get(pk=job.pk), result)
+        job.refresh_from_db()
+        self.assertEqual(
+            (job.stage, job.draft_video_url, job.generation_id), (VideoJob.FINAL, 'https://cdn/draft.mp4', 'final')
+        )
+        self.assertEqual(job.draft_video_file, 'videos/d.mp4')
+        self.assertEqual(generate_video.call_count, 2)
+        self.assertEqual(generate_video.call_args_list[0].kwargs['num_frames'], 30)
+        self.assertEqual(generate_video.call_args_list[1].kwargs['num_frames'], 90)
+
+    def test_failed_draft_falls_back_to_final(self, generate_video, video_poller, mirror_video):
+        generate_video.side_effect = [None, {'id': 'final'}]
+        job = VideoJob.objects.create(prompt='p', progressive=True, stage=VideoJob.DRAFT,
+                                      status=VideoJob.RUNNING, started_at=timezone.now())
+        with self.assertLogs('videoG.jobs', 'WARNING'):
+            self.assertIs(run_video_job(job), DEFERRED)
+        job.refresh_from_db()
+        self.assertEqual((job.stage, job.generation_id), (VideoJob.FINAL, 'final'))
+
+
+@override_settings(VIDEO_POLLER={'lease': 600})
+class PollerLeaseTests(TestCase):
+    def test_one_process_polls_each_job(self):
+        job = VideoJob.objects.create(prompt='p', status=VideoJob.RUNNING, started_at=timezone.now(), generation_id='g1')
+        first, second = VideoPoller(video_jobs), VideoPoller(video_jobs)
+        first.resume()
+        second.resume()
+        self.assertEqual((first.stats()['tracked'], second.stats()['tracked']), (1, 0))
+
+        # Владелец пропал: аренда истекла, задачу забирает другой процесс, а старый перестает ее опрашивать
+        VideoJob.objects.filter(pk=job.pk).update(poll_lease_until=timezone.now() - timedelta(seconds=1))
+        second._renew()
+        first._renew()
+        self.assertEqual((first.stats()['tracked'], second.stats()['tracked']), (0, 1))
+        self.assertEqual(VideoJob.objects.get(pk=job.pk).poll_owner, second.owner)
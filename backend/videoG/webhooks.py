@@ -0,0 +1,30 @@
+from django.conf import settings
+from django.urls import reverse
+
+
+DEFAULTS = {
+    'url': '',
+    'secret': '',
+    'tolerance': 5 * 60,
+    'sweep_interval': 60,
+}
+
+
+def webhook_options():
+    return {**DEFAULTS, **getattr(settings, 'VIDEO_WEBHOOK', {})}
+
+
+def webhook_enabled():
+    options = webhook_options()
+    return bool(options['url'] and options['secret'])
+
+
+def callback_url():
+    """Полный адрес вебхука для провайдера или None, если режим выключен"""
+    if not webhook_enabled():
+        return None
+    url = webhook_options()['url']
+    # Можно указать только хост: путь до вебхука добавим сами
+    if url.rstrip('/').count('/') <= 2:
+        url = url.rstrip('/') + reverse('video-webhook')
+    return url
@@ -50,58 +50,37 @@ function ImgG() {
     setResponseMessage('');
     setProcessedImage(null);
 
-    // Конвертируем файл в base64
-    const reader = new FileReader();
-    reader.readAsDataURL(selectedImage);
-    
-    reader.onload = async () => {
-      const base64Data = reader.result.split(',')[1]; // Убираем префикс "data:image/..."
-      const imageFormat = selectedImage.type.split('/')[1]; // Получаем формат (jpeg, png, etc)
-      
-      const requestData = {
-        template_type: selectedTemplate,
-        text: textRequest,
-        image_data: base64Data,
-        image_format: imageFormat
-      };
-
-      try {
-        const response = await fetch(`${import.meta.env.VITE_API_URL}img/generate/`, {
-          method: 'POST',
-          headers: {
-            'Content-Type': 'application/json',
-          },
-          body: JSON.stringify(requestData),
-        });
-
-        if (!response.ok) {
-          const errorText = await response.text();
-          throw new Error(`Ошибка сервера: ${response.status} - ${errorText}`);
-        }
-
-        const result = await response.json();
-        console.log(result);
-        if (result.success && result.generated_image) {
-          // Добавляем префикс для отображения
-          setProcessedImage(`data:image/${result.image_format || 'png'};base64,${result.generated_image}`);
-          setResponseMessage('✅ Изображение успешно обработано!');
-        } else {
-
-          throw new Error(result.message || 'Сервер вернул некорректный ответ');
-        }
-        
-      } catch (error) {
-        console.error('Ошибка при отправке:', error);
-        setResponseMessage(`❌ Ошибка: ${error.message}`);
-      } finally {
-        setIsLoading(false);
+    // Отправляем файл как есть (multipart), ответ - готовое изображение в бинарном виде
+    const formData = new FormData();
+    formData.append('template_type', selectedTemplate);
+    formData.append('text', textRequest);
+    formData.append('image', selectedImage);
+    formData.append('response_format', 'binary');
+
+    try {
+      const response = await fetch(`${import.meta.env.VITE_API_URL}img/generate/`, {
+        method: 'POST',
+        body: formData,
+      });
+
+      if (!response.ok) {
+        const errorText = await response.text();
+        throw new Error(`Ошибка сервера: ${response.status} - ${errorText}`);
       }
-    };
 
-    reader.onerror = () => {
-      setResponseMessage('❌ Ошибка чтения файла');
+      const blob = await response.blob();
+      if (!blob.type.startsWith('image/')) {
+        throw new Error('Сервер вернул некорректный ответ');
+      }
+
+      setProcessedImage(URL.createObjectURL(blob));
+      setResponseMessage('✅ Изображение успешно обработано!');
+    } catch (error) {
+      console.error('Ошибка при отправке:', error);
+      setResponseMessage(`❌ Ошибка: ${error.message}`);
+    } finally {
       setIsLoading(false);
-    };
+    }
   };
 
   const downloadProcessedImage = () => {
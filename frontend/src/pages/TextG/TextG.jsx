@@ -1,11 +1,64 @@
 import React, { useState } from 'react';
 import './TextG.css';
 
+// Читает ответ text/event-stream и вызывает onText с накопленным текстом
+const streamText = async (endpoint, body, onText) => {
+  const response = await fetch(`${import.meta.env.VITE_API_URL}${endpoint}`, {
+    method: 'POST',
+    headers: {
+      'Content-Type': 'application/json',
+      'Accept': 'text/event-stream',
+    },
+    body: JSON.stringify({ ...body, stream: true }),
+  });
+
+  if (!response.ok || !response.body) {
+    throw new Error(`Ошибка сервера: ${response.status}`);
+  }
+
+  const reader = response.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = '';
+  let text = '';
+
+  while (true) {
+    const { value, done } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+
+    const events = buffer.split('\n\n');
+    buffer = events.pop();
+
+    for (const raw of events) {
+      const eventLine = raw.split('\n').find(line => line.startsWith('event: '));
+      const dataLine = raw.split('\n').find(line => line.startsWith('data: '));
+      if (!dataLine) continue;
+
+      const event = eventLine ? eventLine.slice(7) : 'message';
+      const data = JSON.parse(dataLine.slice(6));
+
+      if (event === 'error') {
+        throw new Error(data.error);
+      }
+      if (event === 'done') {
+        return data.response;
+      }
+      if (data.delta) {
+        text += data.delta;
+        onText(text);
+      }
+    }
+  }
+
+  return text;
+};
+
 const TextG = () => {
   const [inputText, setInputText] = useState('');
   const [generatedText, setGeneratedText] = useState('');
   const [additionalRequest, setAdditionalRequest] = useState('');
   const [isLoading, setIsLoading] = useState(false);
+  const [isStreaming, setIsStreaming] = useState(false);
   const [error, setError] = useState('');
   const [sessionId, setSessionId] = useState(`user_${Date.now()}`);
   const [requestHistory, setRequestHistory] = useState([]);
@@ -21,24 +74,13 @@ const TextG = () => {
     setAdditionalRequest('');
 
     try {
-      const response = await fetch(`${import.meta.env.VITE_API_URL}text/generate/`, {
-        method: 'POST',
-        headers: {
-          'Content-Type': 'application/json',
-        },
-        body: JSON.stringify({
-          message: inputText,
-          session_id: sessionId
-        }),
+      const text = await streamText('text/generate/', {
+        message: inputText,
+        session_id: sessionId
+      }, (partial) => {
+        setIsStreaming(true);
+        setGeneratedText(partial);
       });
-
-      if (!response.ok) {
-        console.log(response)
-        throw new Error('Ошибка при генерации текста');
-      }
-
-      const result = await response.json();
-      const text = result.response;
       setGeneratedText(text);
 
       setRequestHistory(prev => [...prev, {
@@ -52,6 +94,7 @@ const TextG = () => {
       setError('Не удалось сгенерировать текст. Попробуйте еще раз.');
     } finally {
       setIsLoading(false);
+      setIsStreaming(false);
     }
   };
 
@@ -65,23 +108,13 @@ const TextG = () => {
     setError('');
 
     try {
-      const response = await fetch(`${import.meta.env.VITE_API_URL}text/regenerate/`, {
-        method: 'POST',
-        headers: {
-          'Content-Type': 'application/json',
-        },
-        body: JSON.stringify({
-          message: additionalRequest,
-          session_id: sessionId
-        }),
+      const text = await streamText('text/regenerate/', {
+        message: additionalRequest,
+        session_id: sessionId
+      }, (partial) => {
+        setIsStreaming(true);
+        setGeneratedText(partial);
       });
-
-      if (!response.ok) {
-        throw new Error('Ошибка при регенерации текста');
-      }
-
-      const result = await response.json();
-      const text = result.response;
       setGeneratedText(text);
 
       setRequestHistory(prev => [...prev, {
@@ -97,6 +130,7 @@ const TextG = () => {
       setError('Не удалось обновить текст. Попробуйте еще раз.');
     } finally {
       setIsLoading(false);
+      setIsStreaming(false);
     }
   };
 
@@ -314,7 +348,7 @@ const TextG = () => {
         )}
       </div>
 
-      {isLoading && (
+      {isLoading && !isStreaming && (
         <div className="loading-overlay">
           <div className="spinner">🎄</div>
           <p>Дед Мороз пишет поздравление...</p>
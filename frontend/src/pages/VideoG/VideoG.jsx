@@ -1,12 +1,56 @@
-import React, { useState } from 'react';
+import React, { useEffect, useRef, useState } from 'react';
 import './VideoG.css';
 
+const POLL_INTERVAL_MS = 3000;
+
+const sleep = (ms) => new Promise((resolve) => setTimeout(resolve, ms));
+
 const VideoG = () => {
   const [inputText, setInputText] = useState('');
   const [videoUrl, setVideoUrl] = useState(null);
+  const [posterUrl, setPosterUrl] = useState(null);
   const [isLoading, setIsLoading] = useState(false);
   const [error, setError] = useState(null);
   const [copied, setCopied] = useState(false);
+  const [jobStatus, setJobStatus] = useState(null);
+  const [isDraft, setIsDraft] = useState(false);
+  // Номер текущего запроса: опрос прекращается, если начат новый или форма очищена
+  const pollRef = useRef(0);
+
+  useEffect(() => () => { pollRef.current += 1; }, []);
+
+  // Опрашиваем задачу, пока видео не будет готово; черновик показываем сразу, как появится
+  const waitForVideo = async (jobId, pollId) => {
+    let draftShown = false;
+
+    while (pollRef.current === pollId) {
+      const response = await fetch(`${import.meta.env.VITE_API_URL}video/jobs/${jobId}/`);
+
+      if (!response.ok) {
+        throw new Error(`Ошибка сервера: ${response.status}`);
+      }
+
+      const job = await response.json();
+      setJobStatus(job.provider_status || job.status);
+
+      if (job.status === 'succeeded') {
+        return job;
+      }
+      if (job.draft?.ready && !draftShown) {
+        draftShown = true;
+        setVideoUrl(job.draft.video_url);
+        setPosterUrl(job.poster_url || null);
+        setIsDraft(true);
+        setIsLoading(false);
+      }
+      if (job.status === 'failed') {
+        throw new Error(job.error || 'Не удалось сгенерировать видео');
+      }
+
+      await sleep(POLL_INTERVAL_MS);
+    }
+    return null;
+  };
 
   const handleSubmit = async (e) => {
     e.preventDefault();
@@ -16,10 +60,16 @@ const VideoG = () => {
       return;
     }
 
+    const pollId = pollRef.current + 1;
+    pollRef.current = pollId;
+
     setIsLoading(true);
     setError(null);
     setVideoUrl(null);
+    setPosterUrl(null);
     setCopied(false);
+    setJobStatus(null);
+    setIsDraft(false);
 
     try {
       const response = await fetch(`${import.meta.env.VITE_API_URL}video/generate/`, {
@@ -29,6 +79,7 @@ const VideoG = () => {
         },
         body: JSON.stringify({
           prompt: inputText,
+          progressive: true,
         }),
       });
 
@@ -36,17 +87,27 @@ const VideoG = () => {
         throw new Error(`Ошибка сервера: ${response.status}`);
       }
 
-      const data = await response.json();
+      const { job_id: jobId } = await response.json();
+      const data = await waitForVideo(jobId, pollId);
 
+      if (!data) {
+        return;
+      }
       if (data.video_url) {
         setVideoUrl(data.video_url);
+        setPosterUrl(data.poster_url || null);
+        setIsDraft(false);
       } else {
         throw new Error('Не удалось получить URL видео');
       }
     } catch (err) {
-      setError(err instanceof Error ? err.message : 'Произошла неизвестная ошибка');
+      if (pollRef.current === pollId) {
+        setError(err instanceof Error ? err.message : 'Произошла неизвестная ошибка');
+      }
     } finally {
-      setIsLoading(false);
+      if (pollRef.current === pollId) {
+        setIsLoading(false);
+      }
     }
   };
 
@@ -59,8 +120,13 @@ const VideoG = () => {
   };
 
   const handleClear = () => {
+    pollRef.current += 1;
+    setIsLoading(false);
+    setJobStatus(null);
+    setIsDraft(false);
     setInputText('');
     setVideoUrl(null);
+    setPosterUrl(null);
     setError(null);
     setCopied(false);
   };
@@ -133,20 +199,26 @@ const VideoG = () => {
                 Создаем ваше новогоднее видео...<br />
                 Это может занять несколько минут
               </p>
+              {jobStatus && (
+                <p className="loading-text">Статус: {jobStatus}</p>
+              )}
             </div>
           )}
         </div>
 
         {videoUrl && !isLoading && (
           <div className="result-section">
-            <h2 className="result-title">🎉 Ваше видео готово!</h2>
+            <h2 className="result-title">
+              {isDraft ? '👀 Черновик готов! Полная версия еще рендерится...' : '🎉 Ваше видео готово!'}
+            </h2>
 
             <div className="video-container">
               <video
                 controls
                 className="video-player"
                 src={videoUrl}
-                poster="/api/placeholder/640/360"
+                poster={posterUrl || undefined}
+                preload="metadata"
               >
                 Ваш браузер не поддерживает воспроизведение видео.
               </video>